@@ -0,0 +1,12 @@
+from .services.degraded import data_as_of, stale_sources
+
+
+def stale_data(request):
+    """
+    Données périmées servies pendant la requête (mode dégradé) : le bandeau du gabarit de base affiche
+    « données du ... » et les services indisponibles.
+    """
+    return {
+        'data_as_of': data_as_of,
+        'stale_sources': lambda: sorted(stale_sources()),
+    }
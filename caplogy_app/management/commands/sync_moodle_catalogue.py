@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from caplogy_app.services.catalogue_mirror import sync_catalogue
+from caplogy_app.services.clients import get_moodle_api
+
+
+class Command(BaseCommand):
+    help = "Synchronise le miroir local du catalogue Moodle (catégories et cours)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Réécrit tout le miroir au lieu de n'écrire que les enregistrements modifiés")
+        parser.add_argument('--loop', action='store_true',
+                            help="Synchronise en continu jusqu'à l'interruption")
+        parser.add_argument('--interval', type=int, default=settings.MOODLE_MIRROR_SYNC_INTERVAL,
+                            help="Intervalle entre deux synchronisations avec --loop (secondes)")
+
+    def handle(self, *args, **options):
+        api = get_moodle_api()
+        full = options['full']
+
+        while True:
+            try:
+                stats = sync_catalogue(api, full=full)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Synchronisation {'complète' if stats['full'] else 'différentielle'} terminée : "
+                    f"catégories {stats['categories']}, cours {stats['courses']}"
+                ))
+            except Exception as e:
+                if not options['loop']:
+                    raise CommandError(str(e))
+                self.stderr.write(str(e))
+
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from caplogy_app.services.cache_warmer import prime, refresh_hot_caches, run
+
+
+class Command(BaseCommand):
+    help = "Précharge les caches partagés (catégories, index des cours, profs LDAP) et les maintient à jour"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Recharge en continu les entrées proches de l'expiration jusqu'à l'interruption")
+        parser.add_argument('--interval', type=int, default=settings.CACHE_WARMER_INTERVAL,
+                            help="Intervalle entre deux passages avec --loop (secondes)")
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            try:
+                run(interval=options['interval'], stop=threading.Event())
+            except KeyboardInterrupt:
+                pass
+            return
+
+        prime()
+        refreshed = refresh_hot_caches()
+        self.stdout.write(self.style.SUCCESS(f"Caches préchargés ({refreshed} entrée(s) rechargée(s))"))
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.utils.http import http_date
+
+from .services.deadline import request_deadline
+from .services.degraded import data_as_of, stale_data_tracking
+from .services.request_memo import request_memo
+
+
+class StaleDataMiddleware:
+    """
+    Mode dégradé (voir services/degraded.py) : si la réponse a été construite avec des données périmées
+    faute de service amont, elle porte leur date (X-Data-As-Of) et un avertissement HTTP.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with stale_data_tracking():
+            response = self.get_response(request)
+            as_of = data_as_of()
+        if as_of is not None:
+            response['X-Data-As-Of'] = http_date(as_of.timestamp())
+            response['Warning'] = '110 - "Response is Stale"'
+        return response
+
+
+class DeadlineMiddleware:
+    """Budget de REQUEST_DEADLINE secondes pour les appels amont de la requête (voir services/deadline.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_deadline(settings.REQUEST_DEADLINE):
+            return self.get_response(request)
+
+
+class RequestMemoMiddleware:
+    """Mémorise les lectures WS Moodle identiques le temps d'une requête (voir services/request_memo.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_memo():
+            return self.get_response(request)
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caplogy_app', '0003_alter_schoolimage_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_full_sync', models.DateTimeField(blank=True, null=True)),
+                ('last_sync', models.DateTimeField(blank=True, null=True)),
+                ('stale', models.BooleanField(default=False)),
+                ('write_count', models.PositiveBigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MoodleCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('moodle_id', models.IntegerField(unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('parent_id', models.IntegerField(db_index=True, default=0)),
+                ('sortorder', models.IntegerField(default=0)),
+                ('timemodified', models.BigIntegerField(db_index=True, default=0)),
+                ('data', models.JSONField(default=dict)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['sortorder', 'moodle_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MoodleCourse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('moodle_id', models.IntegerField(unique=True)),
+                ('fullname', models.CharField(max_length=255)),
+                ('category_id', models.IntegerField(db_index=True, default=0)),
+                ('timemodified', models.BigIntegerField(db_index=True, default=0)),
+                ('data', models.JSONField(default=dict)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['moodle_id'],
+            },
+        ),
+    ]
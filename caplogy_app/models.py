@@ -30,3 +30,51 @@ class SchoolImage(models.Model):
 
     def __str__(self):
         return f"Logo pour catégorie {self.category_id}"
+
+
+# Miroir local du catalogue Moodle (alimenté par la commande sync_moodle_catalogue)
+class MoodleCategory(models.Model):
+    moodle_id = models.IntegerField(unique=True)  # ID Moodle de la catégorie
+    name = models.CharField(max_length=255)
+    parent_id = models.IntegerField(default=0, db_index=True)  # 0 pour une école
+    sortorder = models.IntegerField(default=0)
+    timemodified = models.BigIntegerField(default=0, db_index=True)
+    data = models.JSONField(default=dict)  # Enregistrement complet renvoyé par Moodle
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['sortorder', 'moodle_id']
+
+    def __str__(self):
+        return f"{self.name} ({self.moodle_id})"
+
+
+class MoodleCourse(models.Model):
+    moodle_id = models.IntegerField(unique=True)  # ID Moodle du cours
+    fullname = models.CharField(max_length=255)
+    category_id = models.IntegerField(default=0, db_index=True)  # ID Moodle de la catégorie du cours
+    timemodified = models.BigIntegerField(default=0, db_index=True)
+    data = models.JSONField(default=dict)  # Enregistrement complet renvoyé par Moodle
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['moodle_id']
+
+    def __str__(self):
+        return f"{self.fullname} ({self.moodle_id})"
+
+
+class CatalogueSyncState(models.Model):
+    """État de la synchronisation du miroir (une seule ligne)."""
+    last_full_sync = models.DateTimeField(null=True, blank=True)
+    last_sync = models.DateTimeField(null=True, blank=True)
+    # Vrai après une écriture faite depuis l'intranet, jusqu'à la prochaine synchronisation
+    stale = models.BooleanField(default=False)
+    # Nombre d'écritures faites depuis l'intranet : une synchronisation ne lève `stale` que si aucune
+    # écriture n'est survenue depuis son début
+    write_count = models.PositiveBigIntegerField(default=0)
+    # Date de la dernière synchronisation ayant modifié le miroir (clé des index construits en mémoire)
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Synchronisation du catalogue ({self.last_sync})"
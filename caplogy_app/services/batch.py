@@ -0,0 +1,184 @@
+"""
+Exécution groupée d'appels WS Moodle via tool_mobile_call_external_functions.
+
+Les appels sont mis en file puis envoyés en une seule requête HTTP (par paquets de MAX_CALLS_PER_REQUEST).
+Si le service n'expose pas tool_mobile_call_external_functions, les appels sont rejoués un par un.
+
+    with api.batch() as batch:
+        call = batch.add('local_ajouturl_add_url', {...})
+    call.result  # disponible à la sortie du bloc
+"""
+import json
+import re
+
+BATCH_FUNCTION = 'tool_mobile_call_external_functions'
+MAX_CALLS_PER_REQUEST = 25
+
+# Fonctions WS modifiant le catalogue : leur exécution invalide l'arborescence des catégories en cache
+CATALOGUE_WRITE_FUNCTIONS = {
+    'core_course_create_courses',
+    'core_course_update_courses',
+    'core_course_delete_courses',
+    'core_course_create_categories',
+    'core_course_delete_categories',
+}
+
+_KEY_PATTERN = re.compile(r'^([^\[\]]+)((?:\[[^\[\]]*\])*)$')
+
+
+def unflatten_params(params: dict):
+    """
+    Convertit des paramètres REST « à plat » (courses[0][fullname]=...) en structure imbriquée
+    ({'courses': [{'fullname': ...}]}), format attendu par tool_mobile_call_external_functions.
+    """
+    root = {}
+    for key, value in params.items():
+        match = _KEY_PATTERN.match(str(key))
+        if not match:
+            root[key] = value
+            continue
+        parts = [match.group(1)] + re.findall(r'\[([^\[\]]*)\]', match.group(2))
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return _lists_from_indexes(root)
+
+
+def _lists_from_indexes(node):
+    if not isinstance(node, dict):
+        return node
+    converted = {key: _lists_from_indexes(value) for key, value in node.items()}
+    if converted and all(str(key).isdigit() for key in converted):
+        return [converted[key] for key in sorted(converted, key=int)]
+    return converted
+
+
+class BatchCall:
+    """Appel mis en file dans un MoodleBatch ; result / error sont renseignés après exécution."""
+
+    def __init__(self, function: str, params: dict):
+        self.function = function
+        self.params = params
+        self.result = None
+        self.error = None
+        self.done = False
+
+    def get(self):
+        """Retourne le résultat de l'appel, ou lève l'erreur qu'il a produite."""
+        if not self.done:
+            raise RuntimeError(f"L'appel {self.function} n'a pas encore été exécuté")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def __repr__(self):
+        state = 'erreur' if self.error is not None else ('ok' if self.done else 'en attente')
+        return f"<BatchCall {self.function} ({state})>"
+
+
+class MoodleBatch:
+    def __init__(self, api):
+        self.api = api
+        self.calls = []
+
+    def add(self, function: str, params: dict) -> BatchCall:
+        call = BatchCall(function, params)
+        self.calls.append(call)
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Les appels déjà mis en file sont envoyés même si le bloc a levé une exception,
+        # comme ils l'auraient été en exécution immédiate
+        self.execute()
+        return False
+
+    def execute(self):
+        """Exécute les appels en attente, groupés si possible, séquentiellement sinon."""
+        pending = [call for call in self.calls if not call.done]
+        if not pending:
+            return self.calls
+
+        if len(pending) > 1 and self.api.batch_supported is None and self.api.capabilities.supports(BATCH_FUNCTION) is False:
+            # Le site a indiqué que la fonction n'est pas activée : inutile de l'essayer
+            self.api.batch_supported = False
+
+        for start in range(0, len(pending), MAX_CALLS_PER_REQUEST):
+            chunk = pending[start:start + MAX_CALLS_PER_REQUEST]
+            if self.api.batch_supported is False or len(chunk) == 1:
+                self._execute_sequentially(chunk)
+            else:
+                self._execute_grouped(chunk)
+
+        if any(call.function in CATALOGUE_WRITE_FUNCTIONS for call in pending):
+            self.api.invalidate_categories()
+
+        for call in pending:
+            if call.error is not None:
+                print(f"[MoodleBatch] Échec de {call.function}: {call.error}")
+        return self.calls
+
+    def _execute_sequentially(self, calls):
+        for call in calls:
+            try:
+                call.result = self.api._request(call.function, call.params)
+            except Exception as e:
+                call.error = e
+            call.done = True
+
+    def _execute_grouped(self, calls):
+        params = {}
+        for i, call in enumerate(calls):
+            params[f'requests[{i}][function]'] = call.function
+            params[f'requests[{i}][arguments]'] = json.dumps(unflatten_params(call.params))
+
+        try:
+            response = self.api._request(BATCH_FUNCTION, params)
+        except ValueError as e:
+            # Erreur de paramètres du répartiteur lui-même : aucun appel n'a été exécuté
+            print(f"[MoodleBatch] {BATCH_FUNCTION} refusé ({e}), exécution séquentielle")
+            self._execute_sequentially(calls)
+            return
+        except Exception as e:
+            # Erreur réseau : on ne sait pas ce qui a été exécuté côté Moodle, ne pas rejouer les écritures
+            for call in calls:
+                call.error = e
+                call.done = True
+            return
+
+        if not isinstance(response, dict) or 'responses' not in response:
+            # Fonction absente du service web : mémoriser et basculer sur l'exécution séquentielle
+            message = response.get('message') if isinstance(response, dict) else response
+            print(f"[MoodleBatch] {BATCH_FUNCTION} indisponible ({message}), exécution séquentielle")
+            self.api.batch_supported = False
+            self._execute_sequentially(calls)
+            return
+
+        self.api.batch_supported = True
+        responses = response.get('responses') or []
+        for call, item in zip(calls, responses):
+            call.done = True
+            if item.get('error'):
+                details = _decode(item.get('exception'))
+                message = details.get('message') if isinstance(details, dict) else details
+                call.result = details
+                call.error = Exception(f"Erreur API Moodle ({call.function}): {message}")
+            else:
+                call.result = _decode(item.get('data'))
+
+        # Moodle interrompt le lot au premier appel en erreur : les appels suivants n'ont pas été exécutés
+        not_run = calls[len(responses):]
+        if not_run:
+            self._execute_sequentially(not_run)
+
+
+def _decode(payload):
+    if isinstance(payload, str):
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return payload
+    return payload
@@ -0,0 +1,388 @@
+"""
+Caches des services.
+
+TTLCache : cache à durée de vie (TTL) avec service de la valeur périmée pendant sa revalidation.
+
+Chaque entrée TTLCache passe par trois états :
+- fraîche (âge < ttl) : servie telle quelle ;
+- périmée (ttl <= âge < ttl + stale_ttl) : servie immédiatement, un rafraîchissement est lancé en arrière-plan ;
+- expirée : le prochain lecteur recharge la valeur de manière synchrone.
+Si le rechargement échoue (service amont indisponible), la dernière valeur connue reste servie et signalée
+comme périmée (mode dégradé, voir degraded.py) ; de même pour une valeur périmée dont la revalidation a échoué.
+
+Ses entrées sont conservées en mémoire du processus (MemoryStore) ou dans un cache Django partagé
+par tous les workers du nœud (SharedCache, ex. FileBasedCache).
+
+SharedCache : espace de noms versionné dans un cache Django. Les clés sont préfixées par l'espace de noms
+et par sa version courante ; invalider revient à passer à une nouvelle version, ce qui rend toutes les anciennes
+clés inaccessibles pour tous les processus (elles sont ensuite évincées par les limites du cache Django).
+La version est horodatée (nanosecondes) et ne revient jamais en arrière : si sa clé est évincée du cache
+Django, la version recréée est plus récente que toutes les précédentes et les anciennes entrées restent
+inaccessibles (au prix d'un rechargement).
+
+LRUCache : cache mémoire borné en nombre d'entrées (ex. résolution des utilisateurs Moodle sans cache partagé).
+
+Les valeurs mises en cache sont partagées entre les appelants : elles doivent être traitées en lecture seule.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from .degraded import note_stale
+from .singleflight import SingleFlight
+
+
+class MemoryStore:
+    """Stockage des entrées TTLCache dans la mémoire du processus, borné à maxsize entrées si maxsize > 0 (LRU)."""
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._generation = 0  # incrémenté à chaque invalidation
+        self._lock = threading.Lock()
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value, generation=None):
+        """Stocke la valeur, sauf si une invalidation est survenue depuis `generation`."""
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while self.maxsize > 0 and len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def try_lock(self, key, timeout):
+        """Un seul rafraîchissement par clé et par processus est déjà garanti par TTLCache."""
+        return True
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+
+class SharedCache:
+    def __init__(self, backend, namespace: str, timeout: float = None, local_ttl: float = 0):
+        """
+        Args:
+            backend: cache Django (django.core.cache.caches[alias])
+            namespace: préfixe des clés (ex. 'moodle:<site>:catalogue')
+            timeout: durée de vie des entrées dans le cache Django (None : jusqu'à éviction)
+            local_ttl: durée pendant laquelle une valeur lue est resservie depuis la mémoire du processus
+                       sans être relue (la version de l'espace de noms est toujours vérifiée)
+        """
+        self.backend = backend
+        self.namespace = namespace
+        self.timeout = timeout
+        self.local_ttl = local_ttl
+        self._version_key = f"{namespace}:version"
+        self._local = {}  # clé -> (version, valeur, instant de lecture)
+        self._lock = threading.Lock()
+
+    def generation(self):
+        version = self.backend.get(self._version_key)
+        if version is None:
+            # Première utilisation, ou clé de version évincée : nouvelle version, postérieure à toutes les autres
+            version = time.time_ns()
+            if not self.backend.add(self._version_key, version, None):
+                version = self.backend.get(self._version_key) or version
+        return version
+
+    def _key(self, key, generation):
+        # Empreinte de la clé : les clés brutes (chemins, e-mails...) ne sont pas toujours valides pour Django
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f"{self.namespace}:{generation}:{digest}"
+
+    def get(self, key, default=None):
+        generation = self.generation()
+        with self._lock:
+            local = self._local.get(key)
+        if local is not None and local[0] == generation and time.monotonic() - local[2] < self.local_ttl:
+            return local[1]
+
+        value = self.backend.get(self._key(key, generation))
+        if value is None:
+            return default
+        if self.local_ttl > 0:
+            with self._lock:
+                self._local[key] = (generation, value, time.monotonic())
+        return value
+
+    def set(self, key, value, generation=None):
+        """
+        Stocke la valeur sous la version `generation` (courante par défaut) : une valeur chargée avant
+        une invalidation est écrite sous l'ancienne version et n'est donc jamais relue.
+        """
+        if generation is None:
+            generation = self.generation()
+        self.backend.set(self._key(key, generation), value, self.timeout)
+        if self.local_ttl > 0:
+            with self._lock:
+                self._local[key] = (generation, value, time.monotonic())
+
+    def invalidate(self, *keys):
+        """
+        Invalide tout l'espace de noms (pour tous les processus) en passant à une nouvelle version.
+        Pas d'incr (non atomique entre processus avec FileBasedCache) : deux invalidations simultanées
+        écrivent chacune une version plus récente que la version courante, ce qui suffit.
+        """
+        current = self.backend.get(self._version_key) or 0
+        self.backend.set(self._version_key, max(time.time_ns(), current + 1), None)
+        with self._lock:
+            self._local.clear()
+
+    def clear(self):
+        self.invalidate()
+
+    def items(self):
+        """Entrées lues ou écrites par ce processus sous la version courante (le cache Django n'est pas énumérable)."""
+        generation = self.generation()
+        with self._lock:
+            return [(key, value) for key, (version, value, _) in self._local.items() if version == generation]
+
+    def restore(self, items):
+        """Réinjecte des entrées (instantané disque) sans écraser celles déjà présentes ; retourne leur nombre."""
+        restored = 0
+        for key, value in items:
+            if self.get(key) is None:
+                self.set(key, value)
+                restored += 1
+        return restored
+
+    def try_lock(self, key, timeout):
+        """
+        Réserve le rafraîchissement de `key` pour `timeout` secondes, tous processus confondus :
+        un seul worker recharge une entrée partagée qui arrive à expiration.
+        """
+        return self.backend.add(f"{self.namespace}:lock:{self._key(key, 'refresh')}", 1, timeout)
+
+
+class TTLCache:
+    def __init__(self, ttl: float, stale_ttl: float = 0, store=None, name: str = 'cache', warm: bool = True):
+        """
+        Args:
+            name: service amont des valeurs (ex. 'Moodle'), cité quand une valeur périmée est servie
+            warm: retenir les clés lues pour refresh_hot() (False : clés trop nombreuses ou trop volatiles)
+        """
+        self.warm = warm
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        # clé -> (valeur, instant de stockage)
+        self.store = store if store is not None else MemoryStore()
+        self._refreshing = set()
+        self._refresh_failed = set()  # clés dont la dernière revalidation en arrière-plan a échoué
+        self._lock = threading.Lock()
+        # Rechargements synchrones simultanés d'une même clé expirée : un seul appel à loader()
+        self._loading = SingleFlight()
+        # Clés lues récemment : clé -> (loader, instant de la dernière lecture), pour refresh_hot()
+        self._hot = {}
+
+    def get_or_load(self, key, loader):
+        """Retourne la valeur associée à key, en la (re)chargeant via loader() si nécessaire."""
+        if self.ttl <= 0:
+            return loader()
+
+        if self.warm:
+            with self._lock:
+                self._hot[key] = (loader, time.monotonic())
+        generation = self.store.generation()
+        entry = self.store.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            # Horloge murale : les entrées d'un cache partagé sont écrites par d'autres processus
+            age = time.time() - stored_at
+            if age < self.ttl:
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(key, loader, generation)
+                with self._lock:
+                    refresh_failed = key in self._refresh_failed
+                if refresh_failed:
+                    note_stale(self.name, stored_at)
+                return value
+
+        def load():
+            value = loader()
+            self._store(key, value, generation)
+            return value
+
+        try:
+            return self._loading.do(key, load)
+        except Exception:
+            if entry is None:
+                raise
+            # Service amont en échec : dernière valeur connue, signalée comme périmée
+            note_stale(self.name, entry[1])
+            return entry[0]
+
+    def set(self, key, value):
+        self.store.set(key, (value, time.time()))
+
+    def invalidate(self, *keys):
+        """Supprime les entrées indiquées (tout l'espace de noms pour un cache partagé)."""
+        self.store.invalidate(*keys)
+
+    def clear(self):
+        self.store.clear()
+
+    def items(self):
+        """Entrées (clé, (valeur, instant de stockage)) connues de ce processus, pour un instantané disque."""
+        return self.store.items()
+
+    def restore(self, items):
+        """
+        Réinjecte des entrées d'un instantané disque, sans écraser celles déjà présentes.
+        Avec une fenêtre de péremption, elles sont restaurées comme périmées : servies immédiatement,
+        puis revalidées en arrière-plan dès leur première lecture.
+
+        Returns:
+            Nombre d'entrées restaurées.
+        """
+        now = time.time()
+        restored = 0
+        for key, (value, stored_at) in items:
+            if self.store.get(key) is not None:
+                continue
+            if self.stale_ttl:
+                stored_at = min(stored_at, now - self.ttl)
+            self.store.set(key, (value, stored_at))
+            restored += 1
+        return restored
+
+    def age(self, key):
+        """Âge (secondes) de l'entrée, None si elle est absente."""
+        entry = self.store.get(key)
+        return None if entry is None else time.time() - entry[1]
+
+    def refresh_hot(self, ratio: float = 0.8, hot_window: float = 1800):
+        """
+        Recharge dès maintenant les clés lues depuis moins de `hot_window` secondes dont l'entrée
+        est absente ou a dépassé `ratio` × ttl : les lecteurs les trouvent fraîches au lieu de les recharger.
+
+        Returns:
+            Liste des clés rechargées.
+        """
+        if self.ttl <= 0:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            # Clés plus lues depuis hot_window : on cesse de les entretenir
+            for key in [k for k, (_, last_read) in self._hot.items() if now - last_read > hot_window]:
+                del self._hot[key]
+            hot = list(self._hot.items())
+
+        refreshed = []
+        for key, (loader, _) in hot:
+            age = self.age(key)
+            if age is not None and age < self.ttl * ratio:
+                continue
+            if not self.store.try_lock(key, self.ttl * (1 - ratio) or 1):
+                continue  # Un autre worker s'en charge
+            generation = self.store.generation()
+            try:
+                self._store(key, self._loading.do(key, loader), generation)
+                refreshed.append(key)
+            except Exception as e:
+                with self._lock:
+                    self._refresh_failed.add(key)
+                print(f"[TTLCache] Échec du préchargement de {key!r}: {e}")
+        return refreshed
+
+    def _store(self, key, value, generation):
+        """Stocke une valeur chargée, sauf si une invalidation est survenue pendant son chargement."""
+        self.store.set(key, (value, time.time()), generation)
+        with self._lock:
+            self._refresh_failed.discard(key)
+
+    def _refresh_in_background(self, key, loader, generation):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        if not self.store.try_lock(key, max(self.ttl, 1)):
+            with self._lock:
+                self._refreshing.discard(key)
+            return  # Rafraîchissement déjà lancé par un autre worker : la valeur périmée reste servie
+
+        def refresh():
+            try:
+                self._store(key, loader(), generation)
+            except Exception as e:
+                with self._lock:
+                    self._refresh_failed.add(key)
+                print(f"[TTLCache] Échec du rafraîchissement de {key!r}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"cache-refresh-{key}", daemon=True).start()
+
+
+class LRUCache:
+    """Cache borné en nombre d'entrées, évinçant la moins récemment utilisée."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+    def restore(self, items):
+        """Réinjecte des entrées (instantané disque) sans écraser celles déjà présentes ; retourne leur nombre."""
+        restored = 0
+        with self._lock:
+            for key, value in items:
+                if key not in self._entries and len(self._entries) < self.maxsize:
+                    self._entries[key] = value
+                    restored += 1
+        return restored
@@ -0,0 +1,118 @@
+"""
+Instantané disque des caches amont, pour redémarrer les workers « à chaud ».
+
+Le préchargeur (cache_warmer) écrit périodiquement, et à l'arrêt du processus, les entrées des caches
+du catalogue Moodle (arborescence, cours, index), de la résolution des utilisateurs Moodle et des profs LDAP.
+Au démarrage, il les recharge avant son premier passage : les premières requêtes sont servies depuis
+l'instantané pendant que les entrées restaurées sont revalidées en arrière-plan.
+
+Format du fichier : en-tête MAGIC, version du format, HMAC-SHA256 (clé : SECRET_KEY) puis le pickle.
+Un fichier d'un autre format, altéré, trop ancien ou pris pour un autre site Moodle est ignoré.
+"""
+import hashlib
+import hmac
+import os
+import pickle
+import tempfile
+import time
+
+from django.conf import settings
+
+from .clients import get_moodle_api
+from .user_service import get_profs_cache
+
+MAGIC = b'CAPLOGY-CACHE-SNAPSHOT'
+FORMAT_VERSION = 1
+
+
+def _targets():
+    """Caches inclus dans l'instantané : nom -> cache exposant items() / restore()."""
+    api = get_moodle_api()
+    return {
+        'moodle_catalogue': api.cache,
+        'moodle_users': api.user_cache,
+        'ldap_profs': get_profs_cache(),
+    }
+
+
+def _site():
+    return get_moodle_api().base
+
+
+def _signature(body):
+    return hmac.new(settings.SECRET_KEY.encode(), body, hashlib.sha256).hexdigest().encode()
+
+
+def save_snapshot(path=None):
+    """Écrit l'instantané (remplacement atomique du fichier) ; retourne le nombre d'entrées écrites."""
+    path = path or settings.CACHE_SNAPSHOT_PATH
+    caches = {}
+    for name, cache in _targets().items():
+        items = cache.items()
+        if items:
+            caches[name] = items
+    body = pickle.dumps(
+        {'created': time.time(), 'site': _site(), 'caches': caches},
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + b'\n' + str(FORMAT_VERSION).encode() + b'\n' + _signature(body) + b'\n')
+            f.write(body)
+        # Remplacement atomique : un worker qui lit en même temps voit l'ancien ou le nouveau fichier
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sum(len(items) for items in caches.values())
+
+
+def _read(path):
+    """Contenu de l'instantané, None s'il est absent ou inutilisable."""
+    try:
+        with open(path, 'rb') as f:
+            magic = f.readline().rstrip(b'\n')
+            version = f.readline().rstrip(b'\n')
+            signature = f.readline().rstrip(b'\n')
+            body = f.read()
+    except FileNotFoundError:
+        return None
+
+    if magic != MAGIC or version != str(FORMAT_VERSION).encode():
+        print(f"[cache_snapshot] Format d'instantané non reconnu, ignoré: {path}")
+        return None
+    if not hmac.compare_digest(signature, _signature(body)):
+        print(f"[cache_snapshot] Signature invalide, instantané ignoré: {path}")
+        return None
+    return pickle.loads(body)
+
+
+def load_snapshot(path=None):
+    """
+    Restaure les caches depuis l'instantané, sans écraser les entrées déjà présentes.
+
+    Returns:
+        Nombre d'entrées restaurées (0 si l'instantané est absent, trop ancien ou d'un autre site).
+    """
+    path = path or settings.CACHE_SNAPSHOT_PATH
+    snapshot = _read(path)
+    if snapshot is None:
+        return 0
+    if snapshot.get('site') != _site():
+        return 0
+    if time.time() - snapshot.get('created', 0) > settings.CACHE_SNAPSHOT_MAX_AGE:
+        return 0
+
+    restored = 0
+    targets = _targets()
+    for name, items in snapshot.get('caches', {}).items():
+        cache = targets.get(name)
+        if cache is not None:
+            restored += cache.restore(items)
+    print(f"[cache_snapshot] {restored} entrée(s) restaurée(s) depuis {path}")
+    return restored
@@ -0,0 +1,131 @@
+"""
+Préchargement en arrière-plan des caches les plus lus.
+
+Au démarrage, le préchargeur remplit l'arborescence des catégories, l'index des cours et la liste
+des profs LDAP ; ensuite, toutes les CACHE_WARMER_INTERVAL secondes, il recharge les entrées lues
+récemment (TTLCache.refresh_hot) avant leur expiration. Les lecteurs trouvent donc une valeur fraîche
+et ne paient plus le rechargement synchrone ; pendant un rechargement, la valeur précédente reste servie.
+Les listings Nextcloud (une clé par dossier, fraîcheur de quelques secondes) ne sont pas entretenus :
+ils ne sont relus qu'à la demande.
+
+Avec un cache partagé, chaque entrée n'est rechargée que par un seul worker (SharedCache.try_lock).
+
+Le thread n'est démarré que par les points d'entrée des serveurs (wsgi.py, asgi.py, donc aussi runserver)
+via start_for_server() : scripts, commandes de gestion et tests qui chargent Django ne le lancent pas.
+
+Si CACHE_SNAPSHOT_ENABLED, le préchargeur restaure aussi les caches depuis l'instantané disque
+avant son premier passage, puis le réécrit toutes les CACHE_SNAPSHOT_INTERVAL secondes et à l'arrêt.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .cache_snapshot import load_snapshot, save_snapshot
+from .clients import get_moodle_api
+from .user_service import PROFS_CACHE_KEY, fetch_ldap_profs, get_profs_cache
+
+_lock = threading.Lock()
+_thread = None
+_stop = threading.Event()
+_exit_hook_registered = False
+
+
+def prime():
+    """Charge les données les plus demandées (et enregistre leurs clés comme « chaudes »)."""
+    api = get_moodle_api()
+    for name, load in (
+        ('arborescence des catégories', api.get_category_tree),
+        ('index des cours', api.get_course_index),
+        ('profs LDAP', lambda: get_profs_cache().get_or_load(PROFS_CACHE_KEY, fetch_ldap_profs)),
+    ):
+        try:
+            load()
+        except Exception as e:
+            print(f"[cache_warmer] Échec du préchargement ({name}): {e}")
+
+
+def refresh_hot_caches():
+    """Recharge les entrées chaudes proches de l'expiration ; retourne le nombre d'entrées rechargées."""
+    ratio = settings.CACHE_WARMER_REFRESH_RATIO
+    hot_window = settings.CACHE_WARMER_HOT_WINDOW
+    refreshed = 0
+    for cache in (get_moodle_api().cache, get_profs_cache()):
+        refreshed += len(cache.refresh_hot(ratio=ratio, hot_window=hot_window))
+    return refreshed
+
+
+def restore_snapshot():
+    if not settings.CACHE_SNAPSHOT_ENABLED:
+        return
+    try:
+        load_snapshot()
+    except Exception as e:
+        # Instantané illisible (ex. classes modifiées par un déploiement) : démarrage à froid
+        print(f"[cache_warmer] Instantané non restauré: {e}")
+
+
+def write_snapshot():
+    if not settings.CACHE_SNAPSHOT_ENABLED:
+        return
+    try:
+        save_snapshot()
+    except Exception as e:
+        print(f"[cache_warmer] Échec de l'écriture de l'instantané: {e}")
+
+
+def run(interval=None, stop=None):
+    """Boucle du préchargeur, jusqu'à ce que `stop` soit positionné."""
+    interval = interval or settings.CACHE_WARMER_INTERVAL
+    stop = stop or _stop
+    primed = False
+    last_snapshot = time.monotonic()
+    try:
+        while True:
+            try:
+                if primed:
+                    refresh_hot_caches()
+                else:
+                    restore_snapshot()
+                    prime()
+                    primed = True
+            except Exception as e:
+                # Ex. client non configuré : on retente au passage suivant
+                print(f"[cache_warmer] {e}")
+            if primed and time.monotonic() - last_snapshot >= settings.CACHE_SNAPSHOT_INTERVAL:
+                write_snapshot()
+                last_snapshot = time.monotonic()
+            if stop.wait(interval):
+                break
+    finally:
+        if primed:
+            write_snapshot()
+        close_old_connections()
+
+
+def start_cache_warmer():
+    """Démarre le préchargeur dans un thread démon (une seule fois par processus)."""
+    global _thread, _exit_hook_registered
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return _thread
+        _stop.clear()
+        _thread = threading.Thread(target=run, name='cache-warmer', daemon=True)
+        _thread.start()
+        # Le thread démon est interrompu sans exécuter son `finally` : l'instantané final est écrit ici
+        if not _exit_hook_registered:
+            atexit.register(write_snapshot)
+            _exit_hook_registered = True
+        return _thread
+
+
+def start_for_server():
+    """Appelé par wsgi.py / asgi.py : démarre le préchargeur si CACHE_WARMER_ENABLED."""
+    if settings.CACHE_WARMER_ENABLED:
+        start_cache_warmer()
+
+
+def stop_cache_warmer():
+    _stop.set()
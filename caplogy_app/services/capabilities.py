@@ -0,0 +1,173 @@
+"""
+Capacités d'un site Moodle et mémorisation des stratégies de repli qui fonctionnent.
+
+Plusieurs opérations de MoodleAPI disposent de plusieurs façons de faire (plugin local, fonction core,
+reconstruction à partir d'autres données). Plutôt que de réessayer à chaque appel les méthodes qui échouent,
+on interroge une fois core_webservice_get_site_info, qui liste les fonctions activées pour le jeton,
+et on retient pour chaque opération la première stratégie qui a fonctionné.
+
+Les capacités sont partagées par toutes les instances MoodleAPI visant le même site avec le même jeton.
+"""
+import threading
+import time
+
+import requests
+
+from .degraded import UpstreamUnavailable
+
+SITE_INFO_FUNCTION = 'core_webservice_get_site_info'
+DEFAULT_CAPABILITY_TTL = 3600
+# Site injoignable lors de l'interrogation : capacités inconnues, réinterrogation après ce délai (secondes)
+DEFAULT_FAILED_PROBE_TTL = 60
+
+# Codes d'erreur Moodle signifiant que la fonction n'est pas disponible pour le jeton : rien n'a été exécuté
+FUNCTION_UNAVAILABLE_ERRORS = {'accessexception', 'invalidrecord', 'servicenotavailable', 'webservicenotavailable'}
+
+
+def is_transport_error(error):
+    """Erreur de transport (réseau, délai, disjoncteur, budget de la requête), éventuellement enveloppée."""
+    while error is not None:
+        if isinstance(error, (UpstreamUnavailable, requests.exceptions.RequestException)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def is_function_unavailable(result):
+    """Réponse d'erreur Moodle indiquant que la fonction n'est pas activée pour le jeton."""
+    return isinstance(result, dict) and str(result.get('errorcode', '')).lower() in FUNCTION_UNAVAILABLE_ERRORS
+
+
+class SiteCapabilities:
+    def __init__(self, probe, ttl: float = DEFAULT_CAPABILITY_TTL, failed_probe_ttl: float = DEFAULT_FAILED_PROBE_TTL):
+        """
+        Args:
+            probe: fonction sans argument retournant la réponse de core_webservice_get_site_info
+            ttl: durée (secondes) avant de réinterroger le site (ex. plugin activé entre-temps)
+            failed_probe_ttl: durée (secondes) avant de réinterroger un site qui n'a pas répondu
+        """
+        self._probe = probe
+        self.ttl = ttl
+        self.failed_probe_ttl = failed_probe_ttl
+        self._functions = None  # ensemble des fonctions activées, None si inconnu
+        self._probed_at = None
+        self._strategies = {}  # opération -> fonction WS de la stratégie qui a fonctionné
+        self._lock = threading.Lock()
+
+    def _is_fresh(self):
+        if self._probed_at is None:
+            return False
+        ttl = self.ttl if self._functions is not None else self.failed_probe_ttl
+        return time.monotonic() - self._probed_at < ttl
+
+    def functions(self):
+        """Fonctions WS activées pour le jeton, ou None si le site n'a pas pu être interrogé."""
+        with self._lock:
+            if self._is_fresh():
+                return self._functions
+        # Interrogation hors du verrou : preferred / remember / forget restent disponibles pendant l'appel
+        try:
+            info = self._probe()
+            if not isinstance(info, dict) or 'functions' not in info:
+                raise Exception(info.get('message') if isinstance(info, dict) else info)
+            functions = {f.get('name') for f in info['functions'] if isinstance(f, dict)}
+        except Exception as e:
+            # Échec retenu failed_probe_ttl secondes seulement (disjoncteur ouvert, budget épuisé...)
+            print(f"[SiteCapabilities] {SITE_INFO_FUNCTION} indisponible ({e}), capacités inconnues")
+            functions = None
+        with self._lock:
+            # Une interrogation réussie entre-temps par un autre thread n'est pas écrasée par un échec
+            if functions is not None or not (self._is_fresh() and self._functions is not None):
+                self._functions = functions
+                self._probed_at = time.monotonic()
+            return self._functions
+
+    def supports(self, function: str):
+        """True / False si la fonction est (ou non) activée, None si les capacités sont inconnues."""
+        functions = self.functions()
+        if functions is None:
+            return None
+        return function in functions
+
+    def preferred(self, operation: str):
+        with self._lock:
+            return self._strategies.get(operation)
+
+    def remember(self, operation: str, function: str):
+        with self._lock:
+            self._strategies[operation] = function
+
+    def forget(self, operation: str, function: str = None):
+        """Oublie la stratégie retenue pour une opération (seulement si c'est `function`, s'il est fourni)."""
+        with self._lock:
+            if function is None or self._strategies.get(operation) == function:
+                self._strategies.pop(operation, None)
+
+    def invalidate(self):
+        """Force une nouvelle interrogation du site et oublie les stratégies retenues."""
+        with self._lock:
+            self._probed_at = None
+            self._functions = None
+            self._strategies.clear()
+
+    def order(self, operation: str, strategies):
+        """
+        Ordonne les stratégies [(fonction WS, callable), ...] d'une opération : la stratégie retenue d'abord,
+        puis les autres dans l'ordre donné ; celles dont la fonction n'est pas activée sont écartées.
+        """
+        preferred = self.preferred(operation)
+        ordered = sorted(strategies, key=lambda item: item[0] != preferred)
+        return [(function, strategy) for function, strategy in ordered if self.supports(function) is not False]
+
+    def run(self, operation: str, strategies, is_valid=bool, write: bool = False):
+        """
+        Exécute la première stratégie dont le résultat est valide et la retient pour les appels suivants.
+        Lève la dernière erreur rencontrée si aucune stratégie n'aboutit.
+
+        Seules les erreurs fonctionnelles (réponse inexploitable, fonction indisponible) font passer à la
+        stratégie suivante : une erreur de transport (réseau, délai, disjoncteur) est relevée telle quelle,
+        sans oublier la stratégie retenue. Pour une écriture (write=True), la stratégie suivante n'est essayée
+        que si Moodle a répondu que la fonction n'est pas disponible : une écriture en échec a pu être
+        appliquée, la refaire autrement risquerait de l'appliquer deux fois.
+        """
+        last_error = None
+        for function, strategy in self.order(operation, strategies):
+            try:
+                result = strategy()
+            except Exception as e:
+                if write or is_transport_error(e):
+                    raise
+                last_error = e
+                self.forget(operation, function)
+                continue
+            if is_valid(result):
+                if self.preferred(operation) != function:
+                    print(f"[SiteCapabilities] {operation}: stratégie retenue {function}")
+                    self.remember(operation, function)
+                return result
+            if write and not is_function_unavailable(result):
+                message = result.get('message') if isinstance(result, dict) else result
+                raise Exception(f"Échec de {function}: {message}")
+            last_error = Exception(f"Réponse inexploitable de {function}")
+            self.forget(operation, function)
+        raise last_error or Exception(f"Aucune fonction disponible pour {operation}")
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_site_capabilities(api) -> SiteCapabilities:
+    """Capacités partagées du site visé par `api` (clé : URL du service + jeton)."""
+    key = (api.base, api.token)
+    with _registry_lock:
+        capabilities = _registry.get(key)
+        if capabilities is None:
+            capabilities = SiteCapabilities(lambda: api._request(SITE_INFO_FUNCTION, {}))
+            _registry[key] = capabilities
+        return capabilities
+
+
+def reset_site_capabilities():
+    with _registry_lock:
+        _registry.clear()
@@ -0,0 +1,256 @@
+"""
+Miroir local du catalogue Moodle (catégories et cours) dans la base Django.
+
+La synchronisation (commande `manage.py sync_moodle_catalogue`) télécharge à chaque passage tout le
+catalogue (catégories et cours) : les fonctions WS utilisées ne filtrent pas sur timemodified, et seule la
+liste complète révèle les suppressions. Seules les écritures en base sont différentielles : au premier
+passage (ou avec --full) tout le miroir est réécrit, ensuite seuls les enregistrements dont la signature
+(timemodified, nombre de cours des catégories) a changé sont réécrits, et ceux disparus de Moodle supprimés.
+
+Les vues lisent le catalogue via get_catalogue_tree / get_catalogue_children / get_course_index :
+depuis le miroir s'il est à jour, directement depuis Moodle sinon (miroir désactivé, jamais synchronisé,
+trop ancien, ou modifié depuis l'intranet en attendant la prochaine synchronisation).
+Si Moodle est alors indisponible, le miroir est lu quel que soit son âge et la page signale la date
+de sa dernière synchronisation (mode dégradé, voir degraded.py).
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import CatalogueSyncState, MoodleCategory, MoodleCourse
+from .category_tree import CategoryTree
+from .course_index import CourseIndex
+from .degraded import note_stale
+
+BULK_BATCH_SIZE = 500
+
+# Structures construites depuis le miroir, reconstruites seulement quand une synchronisation l'a modifié
+_built_lock = threading.RLock()  # Réentrant : l'index des cours est construit à partir de l'arborescence
+_built = {}  # nom -> (changed_at de la synchronisation, structure)
+
+_refresh_lock = threading.Lock()
+_refresh_requested = threading.Event()
+
+
+def _get_state():
+    state = CatalogueSyncState.objects.first()
+    if state is None:
+        state = CatalogueSyncState.objects.create()
+    return state
+
+
+def _category_signature(record):
+    # coursecount change à chaque création / suppression de cours sans modifier le timemodified de la catégorie
+    return (record.get('timemodified') or 0, record.get('coursecount') or 0)
+
+
+def _course_signature(record):
+    return record.get('timemodified') or 0
+
+
+def _sync_model(model, records, signature, build_fields, full):
+    """Aligne la table `model` sur `records` ; retourne le nombre de lignes créées / mises à jour / supprimées."""
+    records = {record['id']: record for record in records if isinstance(record, dict) and record.get('id')}
+    existing = {row.moodle_id: row for row in model.objects.all()}
+
+    to_create, to_update = [], []
+    for moodle_id, record in records.items():
+        row = existing.get(moodle_id)
+        if row is None:
+            to_create.append(model(moodle_id=moodle_id, **build_fields(record)))
+        elif full or signature(record) != signature(row.data):
+            for field, value in build_fields(record).items():
+                setattr(row, field, value)
+            to_update.append(row)
+
+    deleted_ids = [moodle_id for moodle_id in existing if moodle_id not in records]
+    update_fields = list(build_fields({}).keys()) + ['synced_at']
+    now = timezone.now()
+    for row in to_update:
+        row.synced_at = now
+
+    model.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+    model.objects.bulk_update(to_update, update_fields, batch_size=BULK_BATCH_SIZE)
+    if deleted_ids:
+        model.objects.filter(moodle_id__in=deleted_ids).delete()
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(deleted_ids)}
+
+
+def _category_fields(record):
+    return {
+        'name': record.get('name', ''),
+        'parent_id': record.get('parent', 0) or 0,
+        'sortorder': record.get('sortorder', 0) or 0,
+        'timemodified': record.get('timemodified', 0) or 0,
+        'data': record,
+    }
+
+
+def _course_fields(record):
+    return {
+        'fullname': record.get('fullname', ''),
+        'category_id': record.get('categoryid', 0) or 0,
+        'timemodified': record.get('timemodified', 0) or 0,
+        'data': record,
+    }
+
+
+def sync_catalogue(api, full=False):
+    """
+    Synchronise le miroir avec Moodle. Le catalogue est toujours téléchargé en entier ; les écritures
+    en base ne portent que sur les différences, sauf si `full` (ou miroir jamais rempli) : tout est réécrit.
+
+    Returns:
+        dict: {'full': bool, 'categories': {...}, 'courses': {...}} (compteurs created / updated / deleted)
+    """
+    state = _get_state()
+    full = full or state.last_full_sync is None
+    # Le miroir reste périmé pendant la lecture (plusieurs secondes) : les pages continuent de lire Moodle
+    writes_seen = state.write_count
+
+    try:
+        categories = api._fetch_all_categories()
+        courses = api.get_courses()
+        with transaction.atomic():
+            stats = {
+                'full': full,
+                'categories': _sync_model(MoodleCategory, categories, _category_signature, _category_fields, full),
+                'courses': _sync_model(MoodleCourse, courses, _course_signature, _course_fields, full),
+            }
+            now = timezone.now()
+            values = {'last_sync': now}
+            if full:
+                values['last_full_sync'] = now
+            if any(count for table in ('categories', 'courses') for count in stats[table].values()):
+                values['changed_at'] = now
+            CatalogueSyncState.objects.filter(pk=state.pk).update(**values)
+            # Le miroir redevient lisible, sauf si une écriture est survenue depuis le début de la lecture
+            CatalogueSyncState.objects.filter(pk=state.pk, write_count=writes_seen).update(stale=False)
+    except Exception as e:
+        CatalogueSyncState.objects.filter(pk=state.pk).update(stale=True)
+        raise Exception(f"Échec de la synchronisation du catalogue: {str(e)}")
+
+    print(f"[catalogue_mirror] Synchronisation {'complète' if full else 'différentielle'}: "
+          f"catégories {stats['categories']}, cours {stats['courses']}")
+    return stats
+
+
+def _readable_state():
+    """État de synchronisation si le miroir peut être lu, None sinon."""
+    if not settings.MOODLE_MIRROR_ENABLED:
+        return None
+    state = CatalogueSyncState.objects.first()
+    if state is None or state.last_sync is None or state.stale:
+        return None
+    if timezone.now() - state.last_sync > timedelta(seconds=settings.MOODLE_MIRROR_MAX_AGE):
+        return None
+    return state
+
+
+def mirror_sync_date():
+    """Date de la dernière synchronisation si le miroir peut être lu, None sinon."""
+    state = _readable_state()
+    return state.last_sync if state else None
+
+
+def _built_from_mirror(name, state, build):
+    version = state.changed_at or state.last_sync
+    with _built_lock:
+        built_version, value = _built.get(name, (None, None))
+        if value is None or built_version != version:
+            value = build()
+            _built[name] = (version, value)
+        return value
+
+
+def mark_mirror_stale():
+    """Le catalogue a été modifié depuis l'intranet : le miroir n'est plus lu jusqu'à la prochaine synchronisation."""
+    CatalogueSyncState.objects.filter(last_sync__isnull=False).update(stale=True, write_count=F('write_count') + 1)
+
+
+def on_catalogue_change(api):
+    """Écouteur des écritures MoodleAPI sur le catalogue : marque le miroir périmé et le resynchronise en arrière-plan."""
+    if not settings.MOODLE_MIRROR_ENABLED:
+        return
+    mark_mirror_stale()
+    _refresh_requested.set()
+    if not _refresh_lock.acquire(blocking=False):
+        return  # Synchronisation déjà en cours : elle reprendra un tour grâce à _refresh_requested
+
+    def refresh():
+        try:
+            while _refresh_requested.is_set():
+                _refresh_requested.clear()
+                sync_catalogue(api)
+        except Exception as e:
+            print(f"[catalogue_mirror] {e}")
+        finally:
+            _refresh_lock.release()
+            close_old_connections()
+
+    threading.Thread(target=refresh, name='catalogue-mirror-refresh', daemon=True).start()
+
+
+def _last_synced_state():
+    """État du miroir s'il a déjà été synchronisé, quel que soit son âge ; None sinon."""
+    if not settings.MOODLE_MIRROR_ENABLED:
+        return None
+    state = CatalogueSyncState.objects.first()
+    return state if state is not None and state.last_sync is not None else None
+
+
+def _live_or_mirror(load_live, load_mirror):
+    """Lecture depuis Moodle ; s'il est indisponible, dernier état synchronisé du miroir, signalé comme périmé."""
+    try:
+        return load_live()
+    except Exception as e:
+        state = _last_synced_state()
+        if state is None:
+            raise
+        print(f"[catalogue_mirror] Moodle indisponible ({e}), lecture du miroir du {state.last_sync}")
+        note_stale('Moodle', state.last_sync)
+        return load_mirror(state)
+
+
+def _mirror_tree(state):
+    return _built_from_mirror(
+        'tree', state, lambda: CategoryTree(MoodleCategory.objects.values_list('data', flat=True))
+    )
+
+
+def _mirror_course_index(state):
+    return _built_from_mirror(
+        'course_index', state,
+        lambda: CourseIndex(_mirror_tree(state), MoodleCourse.objects.values_list('data', flat=True)),
+    )
+
+
+def _mirror_children(parent_id):
+    return list(MoodleCategory.objects.filter(parent_id=parent_id or 0).values_list('data', flat=True))
+
+
+def get_catalogue_tree(api):
+    """Arborescence des catégories, depuis le miroir s'il est à jour, depuis Moodle sinon."""
+    state = _readable_state()
+    if state is None:
+        return _live_or_mirror(api.get_category_tree, _mirror_tree)
+    return _mirror_tree(state)
+
+
+def get_course_index(api):
+    """Index des cours par école / année / formation, reconstruit seulement quand le catalogue change."""
+    state = _readable_state()
+    if state is None:
+        return _live_or_mirror(api.get_course_index, _mirror_course_index)
+    return _mirror_course_index(state)
+
+
+def get_catalogue_children(api, parent_id=0):
+    """Sous-catégories directes d'une catégorie (écoles pour parent_id=0)."""
+    if mirror_sync_date() is not None:
+        return _mirror_children(parent_id)
+    return _live_or_mirror(lambda: api.get_categories(parent_id), lambda state: _mirror_children(parent_id))
@@ -0,0 +1,150 @@
+"""
+Index en mémoire de l'arborescence des catégories Moodle.
+
+Construit une seule fois à partir de la liste plate renvoyée par get_all_categories(),
+il précalcule pour chaque catégorie : ses enfants, sa profondeur, son chemin depuis la racine
+(école → année → formation → ...) et le nombre total de cours de son sous-arbre.
+Toutes les lectures sont ensuite en O(1) (ou O(taille du résultat)).
+"""
+import hashlib
+import json
+from collections import deque
+
+
+class CategoryTree:
+    def __init__(self, categories):
+        self.categories = list(categories)
+        self.nodes = {cat['id']: cat for cat in self.categories}
+        # Empreinte du contenu : change dès qu'une catégorie change (sert d'ETag aux API JSON)
+        self.version = hashlib.sha1(
+            json.dumps(self.categories, sort_keys=True, default=str).encode()
+        ).hexdigest()[:16]
+        self._children = {cat_id: [] for cat_id in self.nodes}
+        self._roots = []
+
+        for cat in self.categories:
+            parent_id = cat.get('parent', 0)
+            if parent_id and parent_id in self.nodes and parent_id != cat['id']:
+                self._children[parent_id].append(cat['id'])
+            else:
+                # Catégorie de premier niveau (ou parent inconnu : on la traite comme une racine)
+                self._roots.append(cat['id'])
+
+        # Parcours en largeur depuis les racines : chemin et profondeur de chaque nœud
+        self._path = {}
+        order = []
+        queue = deque()
+        for root_id in self._roots:
+            self._path[root_id] = (root_id,)
+            queue.append(root_id)
+        while queue:
+            cat_id = queue.popleft()
+            order.append(cat_id)
+            for child_id in self._children[cat_id]:
+                if child_id in self._path:
+                    continue  # Protection contre les cycles
+                self._path[child_id] = self._path[cat_id] + (child_id,)
+                queue.append(child_id)
+
+        # Nœuds inaccessibles depuis une racine (cycle dans les données) : chemin réduit à eux-mêmes
+        for cat_id in self.nodes:
+            if cat_id not in self._path:
+                self._path[cat_id] = (cat_id,)
+                order.append(cat_id)
+
+        # Agrégation du nombre de cours en remontant l'ordre du parcours (enfants avant parents)
+        self._total_courses = {cat_id: self.nodes[cat_id].get('coursecount', 0) or 0 for cat_id in self.nodes}
+        for cat_id in reversed(order):
+            path = self._path[cat_id]
+            if len(path) > 1:
+                self._total_courses[path[-2]] += self._total_courses[cat_id]
+
+    def __contains__(self, category_id):
+        return category_id in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, category_id, default=None):
+        return self.nodes.get(category_id, default)
+
+    def name(self, category_id, default=None):
+        return self.nodes.get(category_id, {}).get('name', default)
+
+    def roots(self):
+        """Catégories de premier niveau (écoles)."""
+        return [self.nodes[cat_id] for cat_id in self._roots]
+
+    def children(self, category_id):
+        """Sous-catégories directes d'une catégorie (parent=0 pour les racines)."""
+        if not category_id:
+            return self.roots()
+        return [self.nodes[cat_id] for cat_id in self._children.get(category_id, [])]
+
+    def has_children(self, category_id):
+        return bool(self._children.get(category_id))
+
+    def depth(self, category_id):
+        """Profondeur d'une catégorie (0 pour une école)."""
+        return len(self._path.get(category_id, ())) - 1
+
+    def path_ids(self, category_id):
+        """IDs de la racine jusqu'à la catégorie incluse."""
+        return list(self._path.get(category_id, ()))
+
+    def ancestors(self, category_id):
+        """Catégories de la racine jusqu'à la catégorie incluse."""
+        return [self.nodes[cat_id] for cat_id in self._path.get(category_id, ())]
+
+    def breadcrumb(self, category_id):
+        """Chemin de navigation au format attendu par les templates."""
+        return [{'name': cat.get('name', 'Catégorie'), 'id': cat['id']} for cat in self.ancestors(category_id)]
+
+    def _level(self, category_id, level):
+        path = self._path.get(category_id, ())
+        return path[level] if len(path) > level else None
+
+    def root_id(self, category_id):
+        """École (niveau 0) contenant la catégorie."""
+        return self._level(category_id, 0)
+
+    def year_id(self, category_id):
+        """Année (niveau 1) contenant la catégorie, None si la catégorie est une école."""
+        return self._level(category_id, 1)
+
+    def formation_id(self, category_id):
+        """Formation (niveau 2) contenant la catégorie, None au-dessus de ce niveau."""
+        return self._level(category_id, 2)
+
+    def subtree_ids(self, category_id):
+        """IDs de la catégorie et de toutes ses sous-catégories (ordre préfixe)."""
+        if category_id not in self.nodes:
+            return []
+        result = []
+        stack = [category_id]
+        seen = set()
+        while stack:
+            cat_id = stack.pop()
+            if cat_id in seen:
+                continue
+            seen.add(cat_id)
+            result.append(cat_id)
+            stack.extend(reversed(self._children.get(cat_id, [])))
+        return result
+
+    def total_courses(self, category_id):
+        """Nombre de cours de la catégorie et de toutes ses sous-catégories."""
+        return self._total_courses.get(category_id, 0)
+
+    def annotated(self, category):
+        """
+        Copie d'une catégorie enrichie des champs utilisés par les templates
+        (coursecount récursif, has_courses, has_subcategories).
+        """
+        total = self.total_courses(category['id'])
+        return {
+            **category,
+            'coursecount': total,
+            'has_courses': total > 0,
+            'has_subcategories': self.has_children(category['id']),
+        }
@@ -0,0 +1,77 @@
+"""
+Disjoncteur par service amont (Moodle, Nextcloud, LDAP).
+
+- fermé : les appels passent ; après failure_threshold échecs consécutifs (erreur réseau, délai dépassé,
+  erreur 5xx), le disjoncteur s'ouvre ;
+- ouvert : les appels échouent aussitôt (UpstreamUnavailable) pendant reset_timeout secondes,
+  sans attendre de nouveau des sockets mortes ;
+- semi-ouvert : passé ce délai, un seul appel d'essai est autorisé (les autres échouent aussitôt) ;
+  son succès referme le disjoncteur, son échec le rouvre pour reset_timeout secondes.
+"""
+import threading
+import time
+
+from .degraded import UpstreamUnavailable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Autorise l'appel, ou lève UpstreamUnavailable si le disjoncteur est ouvert."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise UpstreamUnavailable(f"{self.name} indisponible, nouvel essai dans {remaining:.0f}s")
+                self.state = HALF_OPEN
+            elif self._trial_in_flight:
+                raise UpstreamUnavailable(f"{self.name} indisponible (essai de reprise en cours)")
+            # Semi-ouvert : cet appel sert d'essai
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            recovered = self.state != CLOSED
+            self.state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+        if recovered:
+            print(f"[CircuitBreaker] {self.name} de nouveau disponible")
+
+    def record_failure(self):
+        with self._lock:
+            self._trial_in_flight = False
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                opened = self.state != OPEN
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+            else:
+                opened = False
+        if opened:
+            print(f"[CircuitBreaker] {self.name} indisponible : appels suspendus pendant {self.reset_timeout:.0f}s")
+
+    def release(self):
+        """Fin d'un appel sans verdict sur le service (ex. budget de la requête épuisé)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_timeout
@@ -0,0 +1,91 @@
+"""
+Registre des clients Moodle / Nextcloud partagés par tout le processus.
+
+Les clients sont construits une seule fois (à la première utilisation) à partir des settings,
+afin que les connexions HTTP du pool, les caches et les métriques survivent d'une requête à l'autre.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .capabilities import reset_site_capabilities
+from .moodle_api import MoodleAPI
+from .moodle_async import AsyncMoodleAPI
+from .nextcloud_api import NextcloudAPI
+
+_lock = threading.Lock()
+_moodle_api = None
+_nextcloud_api = None
+
+
+def _shared_cache():
+    """Cache Django partagé par les workers pour les données Moodle / Nextcloud (None : cache mémoire du processus)."""
+    alias = settings.UPSTREAM_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def get_moodle_api() -> MoodleAPI:
+    """Retourne l'instance MoodleAPI partagée, construite à la demande."""
+    global _moodle_api
+    if _moodle_api is None:
+        with _lock:
+            if _moodle_api is None:
+                _moodle_api = MoodleAPI(
+                    url=settings.MOODLE_URL,
+                    token=settings.MOODLE_TOKEN,
+                    pool_size=settings.MOODLE_POOL_SIZE,
+                    connect_timeout=settings.MOODLE_CONNECT_TIMEOUT,
+                    read_timeout=settings.MOODLE_READ_TIMEOUT,
+                    read_retries=settings.MOODLE_READ_RETRIES,
+                    category_cache_ttl=settings.MOODLE_CATEGORY_CACHE_TTL,
+                    category_stale_ttl=settings.MOODLE_CATEGORY_STALE_TTL,
+                    user_cache_size=settings.MOODLE_USER_CACHE_SIZE,
+                    consistency_timeout=settings.MOODLE_CONSISTENCY_TIMEOUT,
+                    cache_backend=_shared_cache(),
+                    user_cache_ttl=settings.MOODLE_USER_CACHE_TTL,
+                    retry_after=settings.UPSTREAM_RETRY_AFTER,
+                    last_good_ttl=settings.UPSTREAM_LAST_GOOD_TTL,
+                    failure_threshold=settings.UPSTREAM_FAILURE_THRESHOLD,
+                )
+                # Import différé : le miroir dépend des modèles Django
+                from .catalogue_mirror import on_catalogue_change
+                _moodle_api.catalogue_listeners.append(on_catalogue_change)
+    return _moodle_api
+
+
+def get_async_moodle_api() -> AsyncMoodleAPI:
+    """Retourne une façade asyncio de l'instance MoodleAPI partagée (une par requête : voir moodle_async.py)."""
+    return AsyncMoodleAPI(get_moodle_api(), max_concurrency=settings.MOODLE_ASYNC_CONCURRENCY)
+
+
+def get_nextcloud_api() -> NextcloudAPI:
+    """Retourne l'instance NextcloudAPI partagée, construite à la demande."""
+    global _nextcloud_api
+    if _nextcloud_api is None:
+        with _lock:
+            if _nextcloud_api is None:
+                _nextcloud_api = NextcloudAPI(
+                    base_url=settings.NEXTCLOUD_WEBDAV_URL,
+                    share_url=settings.NEXTCLOUD_SHARE_URL,
+                    user=settings.NEXTCLOUD_USER,
+                    password=settings.NEXTCLOUD_PASSWORD,
+                    cache_backend=_shared_cache(),
+                    listing_cache_ttl=settings.NEXTCLOUD_LISTING_CACHE_TTL,
+                    listing_cache_size=settings.NEXTCLOUD_LISTING_CACHE_SIZE,
+                    retry_after=settings.UPSTREAM_RETRY_AFTER,
+                    last_good_ttl=settings.UPSTREAM_LAST_GOOD_TTL,
+                    connect_timeout=settings.NEXTCLOUD_CONNECT_TIMEOUT,
+                    read_timeout=settings.NEXTCLOUD_READ_TIMEOUT,
+                    failure_threshold=settings.UPSTREAM_FAILURE_THRESHOLD,
+                )
+    return _nextcloud_api
+
+
+def reset_clients():
+    """Oublie les clients construits (ex. après un changement de configuration)."""
+    global _moodle_api, _nextcloud_api
+    with _lock:
+        _moodle_api = None
+        _nextcloud_api = None
+    reset_site_capabilities()
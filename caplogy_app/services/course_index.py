@@ -0,0 +1,95 @@
+"""
+Index dénormalisé des cours par école / année / formation.
+
+Construit une seule fois à partir de l'arborescence des catégories (CategoryTree) et de la liste des cours,
+il associe à chaque cours les IDs et noms de son école, de son année et de sa formation,
+et tient des index inversés (école / année / formation -> IDs de cours).
+Un filtre sur ces niveaux devient une intersection d'ensembles au lieu d'un parcours du catalogue.
+"""
+import hashlib
+from collections import defaultdict
+
+SITE_COURSE_ID = 1  # Cours « site » de Moodle, jamais affiché
+
+
+def _as_id(value):
+    """ID de filtre (int, ou chaîne issue d'un paramètre GET) ; None si absent, -1 s'il est invalide."""
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+class CourseIndex:
+    def __init__(self, tree, courses):
+        self.entries = {}  # ID de cours -> entrée dénormalisée
+        self.order = []    # IDs de cours dans l'ordre du catalogue
+        self.by_school = defaultdict(set)
+        self.by_year = defaultdict(set)
+        self.by_formation = defaultdict(set)
+
+        for course in courses:
+            if not isinstance(course, dict):
+                continue
+            course_id = course.get('id')
+            category_id = course.get('categoryid')
+            if course_id == SITE_COURSE_ID or not category_id or course_id in self.entries:
+                continue
+
+            school_id = tree.root_id(category_id) or category_id
+            year_id = tree.year_id(category_id)
+            formation_id = tree.formation_id(category_id)
+            self.entries[course_id] = {
+                'id': course_id,
+                'fullname': course.get('fullname', ''),
+                'categoryid': category_id,
+                'school_id': school_id,
+                'year_id': year_id,
+                'formation_id': formation_id,
+                'schoolname': tree.name(school_id),
+                'yearname': tree.name(year_id),
+                'formationname': tree.name(formation_id),
+                'course': course,
+            }
+            self.order.append(course_id)
+            self.by_school[school_id].add(course_id)
+            if year_id is not None:
+                self.by_year[year_id].add(course_id)
+            if formation_id is not None:
+                self.by_formation[formation_id].add(course_id)
+
+        self._position = {course_id: i for i, course_id in enumerate(self.order)}
+
+        # Empreinte des champs indexés : change dès qu'un cours ou l'arborescence change
+        digest = hashlib.sha1(tree.version.encode())
+        for course_id in self.order:
+            entry = self.entries[course_id]
+            digest.update(f"{course_id}|{entry['fullname']}|{entry['categoryid']}\n".encode())
+        self.version = digest.hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, course_id, default=None):
+        return self.entries.get(course_id, default)
+
+    def filter_ids(self, school=None, year=None, formation=None):
+        """IDs des cours correspondant à tous les filtres fournis (ordre du catalogue)."""
+        selected = None
+        for value, index in ((formation, self.by_formation), (year, self.by_year), (school, self.by_school)):
+            level_id = _as_id(value)
+            if level_id is None:
+                continue
+            ids = index.get(level_id, set())
+            selected = ids if selected is None else selected & ids
+            if not selected:
+                return []
+        if selected is None:
+            return list(self.order)
+        return sorted(selected, key=self._position.__getitem__)
+
+    def filter(self, school=None, year=None, formation=None):
+        """Entrées des cours correspondant à tous les filtres fournis (ordre du catalogue)."""
+        return [self.entries[course_id] for course_id in self.filter_ids(school, year, formation)]
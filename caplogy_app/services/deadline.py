@@ -0,0 +1,70 @@
+"""
+Budget de temps d'une requête Django pour ses appels aux services amont.
+
+DeadlineMiddleware ouvre un budget de REQUEST_DEADLINE secondes par requête. Chaque appel amont
+(Moodle, Nextcloud, LDAP) réduit son délai d'attente au temps restant (clip_timeout) : une page
+ne passe jamais plus de temps à attendre ses services que ce qu'elle peut se permettre, et un
+appel qui ne dispose plus du minimum utile n'est pas tenté (DeadlineExceeded).
+
+Hors requête (threads de préchargement, commandes de gestion), aucun budget ne s'applique.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from .degraded import UpstreamUnavailable
+
+# En dessous de ce temps restant (secondes), un appel amont n'est plus tenté
+MIN_CALL_TIMEOUT = 0.5
+
+_deadline = contextvars.ContextVar('caplogy_deadline', default=None)
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Budget de temps de la requête épuisé : l'appel amont n'a pas été tenté."""
+
+
+@contextmanager
+def request_deadline(seconds):
+    """Budget de `seconds` secondes pour le bloc (sans effet si nul, sans allonger un budget englobant)."""
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds if seconds else None
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Temps restant (secondes) du budget en cours, None s'il n'y en a pas."""
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def check(needed=MIN_CALL_TIMEOUT):
+    """Lève DeadlineExceeded s'il reste moins de `needed` secondes."""
+    left = remaining()
+    if left is not None and left < needed:
+        raise DeadlineExceeded(f"Budget de temps de la requête épuisé ({left:.1f}s restantes)")
+
+
+def clip_timeout(timeout):
+    """
+    Réduit un délai (secondes, ou tuple (connexion, lecture) de requests) au temps restant.
+
+    Returns:
+        (délai, réduit) : réduit vaut True si le budget a raccourci le délai ; un dépassement
+        ne dit alors rien de la santé du service amont.
+    """
+    left = remaining()
+    if left is None:
+        return timeout, False
+    check()
+    if isinstance(timeout, tuple):
+        clipped = tuple(min(t, left) if t is not None else left for t in timeout)
+    else:
+        clipped = min(timeout, left) if timeout is not None else left
+    return clipped, clipped != timeout
@@ -0,0 +1,52 @@
+"""
+Mode dégradé : quand un service amont (Moodle, Nextcloud, LDAP) est indisponible, les pages sont servies
+avec les dernières données connues (cache ou miroir local du catalogue) au lieu d'une erreur.
+
+- UpstreamUnavailable : appel non tenté parce que le service est réputé indisponible (disjoncteur ouvert,
+  voir circuit_breaker.py) ou que la requête n'a plus le temps de l'attendre (deadline.py).
+- note_stale() : les caches et le miroir signalent qu'ils ont servi une donnée périmée faute de service amont ;
+  la date de cette donnée est affichée dans les pages (« données du ... ») et renvoyée dans l'en-tête
+  X-Data-As-Of des réponses (StaleDataMiddleware).
+"""
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_stale = contextvars.ContextVar('caplogy_stale_data', default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """Service amont indisponible : l'appel n'a pas été tenté."""
+
+
+@contextmanager
+def stale_data_tracking():
+    """Collecte les données périmées servies pendant le bloc (une requête Django)."""
+    token = _stale.set({})
+    try:
+        yield
+    finally:
+        _stale.reset(token)
+
+
+def note_stale(source: str, as_of):
+    """Signale qu'une donnée de `source` datant de `as_of` (timestamp ou datetime) a été servie faute de mieux."""
+    stale = _stale.get()
+    if stale is None:
+        return
+    if isinstance(as_of, datetime):
+        as_of = as_of.timestamp()
+    # On retient la donnée la plus ancienne servie pour chaque source
+    stale[source] = min(as_of, stale.get(source, as_of))
+
+
+def stale_sources():
+    """Sources servies depuis des données périmées pendant la requête en cours : nom -> datetime."""
+    stale = _stale.get() or {}
+    return {source: datetime.fromtimestamp(as_of, tz=timezone.utc) for source, as_of in stale.items()}
+
+
+def data_as_of():
+    """Date de la plus ancienne donnée périmée servie pendant la requête en cours, None si aucune."""
+    sources = stale_sources()
+    return min(sources.values()) if sources else None
@@ -1,9 +1,85 @@
+import difflib
+import hashlib
+import time
+from contextlib import nullcontext
+
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+
+from .batch import MoodleBatch
+from .cache import LRUCache, SharedCache, TTLCache
+from .capabilities import get_site_capabilities
+from .category_tree import CategoryTree
+from .course_index import CourseIndex
+from .circuit_breaker import CircuitBreaker
+from .deadline import MIN_CALL_TIMEOUT, check as check_deadline, clip_timeout
+from .degraded import UpstreamUnavailable
+from .polling import wait_until
+from .request_memo import clear_current_memo, current_memo, memo_bypass
+from .singleflight import SingleFlight
 
 # Désactiver les avertissements SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Paramètres par défaut du transport HTTP vers Moodle
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_READ_RETRIES = 2
+DEFAULT_BACKOFF_FACTOR = 0.3
+
+# Cache de l'arborescence des catégories (secondes)
+DEFAULT_CATEGORY_CACHE_TTL = 300
+DEFAULT_CATEGORY_STALE_TTL = 3600
+CATEGORY_TREE_CACHE_KEY = 'categories:tree'
+COURSE_INDEX_CACHE_KEY = 'courses:index'
+
+# Durée maximale d'attente de la cohérence de Moodle après une écriture (secondes)
+DEFAULT_CONSISTENCY_TIMEOUT = 5
+
+# Nombre maximal d'usernames résolus conservés en mémoire
+DEFAULT_USER_CACHE_SIZE = 1024
+# Durée de vie des utilisateurs résolus dans le cache partagé (secondes)
+DEFAULT_USER_CACHE_TTL = 86400
+
+# Mode dégradé : disjoncteur (échecs consécutifs avant ouverture, durée d'ouverture en secondes),
+# et durée de conservation des dernières données connues au-delà de leur fenêtre de péremption (secondes)
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RETRY_AFTER = 30
+DEFAULT_LAST_GOOD_TTL = 7 * 86400
+
+
+def _is_read_function(function: str) -> bool:
+    """Indique si une fonction WS Moodle est une lecture (rejouable sans effet de bord)."""
+    return '_get_' in function or function.endswith('_get')
+
+
+# Noms réservés à la section générale (section 0), masqués dans l'interface d'édition
+GENERAL_SECTION_NAMES = ('généralités', 'generalites', 'general')
+
+
+def _is_visible_section_name(name) -> bool:
+    """Indique si une section de ce nom est affichée (et donc éditable) dans l'interface."""
+    name = (name or '').strip()
+    return bool(name) and name.lower() not in GENERAL_SECTION_NAMES
+
+
+def annotate_category_courses(tree, target_ids, courses):
+    """Cours triés dans l'ordre de l'arborescence (target_ids), annotés de source_category_id / source_category_name."""
+    # Conserver l'ordre de l'arborescence (catégorie, puis ses sous-catégories)
+    position = {cat_id: index for index, cat_id in enumerate(target_ids)}
+    courses = sorted(courses, key=lambda c: position.get(c.get('categoryid'), len(position)))
+    return [
+        {
+            **course,
+            'source_category_id': course.get('categoryid'),
+            'source_category_name': tree.name(course.get('categoryid'), f"Catégorie {course.get('categoryid')}"),
+        }
+        for course in courses
+    ]
+
+
 class MoodleAPI:
     def get_course_teachers(self, course_id, role_id=3):
         """
@@ -42,42 +118,33 @@ class MoodleAPI:
         if not usernames_or_ids:
             return None
         
-        # Convertir les usernames en IDs si nécessaire
+        # Convertir les usernames en IDs si nécessaire (résolution groupée des usernames)
         userids = []
+        usernames = []
         for identifier in usernames_or_ids:
             if isinstance(identifier, int) or str(identifier).isdigit():
                 userids.append(int(identifier))
             else:
-                # Recherche par email
-                email = f"{identifier}@caplogy.com"
-                try:
-                    params = {'criteria[0][key]': 'email', 'criteria[0][value]': email}
-                    result = self._request('core_user_get_users', params)
-                    users = result.get('users', []) if isinstance(result, dict) else []
-                    if users:
-                        userids.append(users[0]['id'])
-                        print(f"[DEBUG] Email {email} -> ID {users[0]['id']}")
-                        continue
-                except Exception as e:
-                    print(f"[ERROR] Erreur lors de la recherche par email {email}: {e}")
-                # Recherche par idnumber
-                try:
-                    params = {'criteria[0][key]': 'idnumber', 'criteria[0][value]': identifier}
-                    result = self._request('core_user_get_users', params)
-                    users = result.get('users', []) if isinstance(result, dict) else []
-                    if users:
-                        userids.append(users[0]['id'])
-                        print(f"[DEBUG] idnumber {identifier} -> ID {users[0]['id']}")
-                        continue
-                except Exception as e:
-                    print(f"[ERROR] Erreur lors de la recherche par idnumber {identifier}: {e}")
-                print(f"[WARNING] Username {identifier} non trouvé pour suppression")
+                usernames.append(identifier)
+        
+        if usernames:
+            resolved = self.resolve_users(usernames)
+            for username in usernames:
+                user = resolved.get(username)
+                if user:
+                    userids.append(user['id'])
+                else:
+                    print(f"[WARNING] Username {username} non trouvé pour suppression")
         
         if not userids:
             print("[WARNING] Aucun utilisateur valide trouvé pour la suppression")
             return None
         
         # Supprimer les utilisateurs du cours
+        return self._unenrol_users_from_course(course_id, userids)
+
+    def _unenrol_users_from_course(self, course_id, userids, batch=None):
+        """Désinscrit des utilisateurs d'un cours en un seul appel enrol_manual_unenrol_users."""
         try:
             params = {}
             for i, uid in enumerate(userids):
@@ -85,6 +152,8 @@ class MoodleAPI:
                 params[f'enrolments[{i}][courseid]'] = course_id
             
             print(f"[DEBUG] Suppression des utilisateurs {userids} du cours {course_id}")
+            if batch is not None:
+                return batch.add('enrol_manual_unenrol_users', params)
             result = self._request('enrol_manual_unenrol_users', params)
             print(f"[DEBUG] Résultat suppression: {result}")
             return result
@@ -92,36 +161,46 @@ class MoodleAPI:
             print(f"[ERROR] Erreur lors de la suppression des professeurs: {e}")
             raise
     
-    def replace_course_teachers(self, course_id, new_usernames):
+    def replace_course_teachers(self, course_id, new_usernames, role_id=3):
         """
-        Remplace tous les professeurs d'un cours par une nouvelle liste
-        1. Récupère les professeurs actuels
-        2. Les supprime tous
-        3. Ajoute les nouveaux professeurs
+        Remplace les professeurs d'un cours par une nouvelle liste en n'envoyant que la différence :
+        1. Récupère les professeurs actuels et résout les nouveaux usernames en IDs Moodle
+        2. Enrôle uniquement les nouveaux et désinscrit uniquement ceux qui ne sont plus dans la liste,
+           en un appel enrol_manual_enrol_users et un appel enrol_manual_unenrol_users (groupés si possible)
+        Les professeurs conservés ne perdent jamais leur accès pendant l'opération.
+        Si un username ne peut pas être résolu, aucune désinscription n'est faite (la liste cible est incertaine).
+        
+        Returns:
+            {'enrolled': [ids enrôlés], 'unenrolled': [ids désinscrits], 'not_found': [usernames introuvables]}
         """
         try:
-            # 1. Récupérer les professeurs actuels
-            current_teachers = self.get_course_teachers(course_id)
+            # 1. Etat actuel et état cible, comparés par ID utilisateur
+            current_teachers = self.get_course_teachers(course_id, role_id=role_id)
+            current_ids = [t['id'] for t in current_teachers]
             print(f"[DEBUG] Professeurs actuels du cours {course_id}: {[t.get('username', t.get('id')) for t in current_teachers]}")
             
-            # 2. Supprimer tous les professeurs actuels
-            if current_teachers:
-                current_teacher_ids = [t['id'] for t in current_teachers]
-                print(f"[DEBUG] Suppression des professeurs actuels: {current_teacher_ids}")
-                try:
-                    self.remove_teachers_from_course(course_id, current_teacher_ids)
-                    print(f"[DEBUG] Professeurs actuels supprimés")
-                except Exception as e:
-                    print(f"[WARNING] Erreur lors de la suppression des professeurs actuels: {e}")
+            desired_ids, failed_usernames = self._resolve_user_ids(list(new_usernames or []))
+            if failed_usernames:
+                print(f"[WARNING] Utilisateurs non trouvés: {failed_usernames}")
             
-            # 3. Ajouter les nouveaux professeurs
-            if new_usernames:
-                print(f"[DEBUG] Ajout des nouveaux professeurs: {new_usernames}")
-                result = self.assign_teachers_to_course(course_id, new_usernames)
-                print(f"[DEBUG] Nouveaux professeurs ajoutés")
-                return result
+            to_enrol = [uid for uid in dict.fromkeys(desired_ids) if uid not in set(current_ids)]
+            to_unenrol = [] if failed_usernames else [uid for uid in current_ids if uid not in set(desired_ids)]
+            print(f"[DEBUG] Professeurs à ajouter: {to_enrol}, à supprimer: {to_unenrol}")
             
-            return None
+            # 2. Appliquer uniquement la différence
+            enrol_call = unenrol_call = None
+            if to_enrol or to_unenrol:
+                with self.batch() as batch:
+                    if to_enrol:
+                        enrol_call = self._enrol_users_to_course(course_id, to_enrol, role_id=role_id, batch=batch)
+                    if to_unenrol:
+                        unenrol_call = self._unenrol_users_from_course(course_id, to_unenrol, batch=batch)
+            
+            for call in (enrol_call, unenrol_call):
+                if call is not None and call.error is not None:
+                    raise call.error
+            
+            return {'enrolled': to_enrol, 'unenrolled': to_unenrol, 'not_found': failed_usernames}
             
         except Exception as e:
             print(f"[ERROR] Erreur lors du remplacement des professeurs: {e}")
@@ -157,10 +236,112 @@ class MoodleAPI:
         except Exception as e:
             print(f"[ERROR] Erreur lors de la suppression du professeur: {e}")
             raise
-    def __init__(self, url: str, token: str, fmt: str = 'json'):
+    def __init__(self, url: str, token: str, fmt: str = 'json',
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 read_retries: int = DEFAULT_READ_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 category_cache_ttl: float = DEFAULT_CATEGORY_CACHE_TTL,
+                 category_stale_ttl: float = DEFAULT_CATEGORY_STALE_TTL,
+                 user_cache_size: int = DEFAULT_USER_CACHE_SIZE,
+                 consistency_timeout: float = DEFAULT_CONSISTENCY_TIMEOUT,
+                 cache_backend=None,
+                 user_cache_ttl: float = DEFAULT_USER_CACHE_TTL,
+                 retry_after: float = DEFAULT_RETRY_AFTER,
+                 last_good_ttl: float = DEFAULT_LAST_GOOD_TTL,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD):
         self.base = url
         self.token = token
         self.fmt = fmt
+        self.timeout = (connect_timeout, read_timeout)
+        self.read_retries = read_retries
+        self.backoff_factor = backoff_factor
+        self.consistency_timeout = consistency_timeout
+        self.session = self._build_session(pool_size)
+        if cache_backend is not None:
+            # Cache Django partagé par les workers : espaces de noms propres au site Moodle
+            # url peut être None (MOODLE_URL non défini) : l'erreur survient au premier appel, pas ici
+            namespace = f"moodle:{hashlib.sha1((url or '').encode()).hexdigest()[:8]}"
+            self.cache = TTLCache(
+                ttl=category_cache_ttl, stale_ttl=category_stale_ttl,
+                store=SharedCache(cache_backend, f"{namespace}:catalogue",
+                                  timeout=(category_cache_ttl + category_stale_ttl + last_good_ttl) or None,
+                                  local_ttl=category_cache_ttl),
+                name='Moodle',
+            )
+            self.user_cache = SharedCache(cache_backend, f"{namespace}:users",
+                                          timeout=user_cache_ttl or None, local_ttl=60)
+        else:
+            self.cache = TTLCache(ttl=category_cache_ttl, stale_ttl=category_stale_ttl, name='Moodle')
+            self.user_cache = LRUCache(maxsize=user_cache_size)
+        # None tant que tool_mobile_call_external_functions n'a pas été essayé sur ce site
+        self.batch_supported = None
+        # Fonctions activées sur le site et stratégies de repli retenues (partagées par site)
+        self.capabilities = get_site_capabilities(self)
+        # Fonctions appelées (avec l'instance) après chaque écriture sur le catalogue
+        self.catalogue_listeners = []
+        # Lectures identiques simultanées (plusieurs requêtes / threads) : un seul appel HTTP partagé,
+        # dont le résultat est remis sans copie (lecture seule, comme les résultats mémorisés)
+        self.inflight = SingleFlight()
+        # Moodle injoignable : après failure_threshold échecs, les appels échouent aussitôt pendant retry_after secondes
+        self.breaker = CircuitBreaker('Moodle', failure_threshold, retry_after)
+
+    def _build_session(self, pool_size: int):
+        """
+        Construit la session HTTP partagée par tous les appels WS (keep-alive + pool de connexions).
+        Le transport ne rejoue aucune requête : les nouvelles tentatives sont gérées par _post seul,
+        pour les fonctions de lecture uniquement (sinon les deux niveaux se multiplient).
+        """
+        session = requests.Session()
+        session.verify = False
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _post(self, function: str, payload: dict):
+        """
+        Envoie la requête HTTP, avec relecture et backoff exponentiel pour les fonctions de lecture.
+        Chaque tentative est limitée au budget de temps restant de la requête Django (deadline.py),
+        et le disjoncteur de Moodle est consulté avant l'envoi puis informé du résultat.
+        """
+        self.breaker.before_call()
+        try:
+            attempts = 1 + (self.read_retries if _is_read_function(function) else 0)
+            for attempt in range(attempts):
+                last_attempt = attempt >= attempts - 1
+                timeout, clipped = clip_timeout(self.timeout)
+                try:
+                    r = self.session.post(self.base, data=payload, timeout=timeout)
+                    if r.status_code < 500 or last_attempt:
+                        if r.status_code >= 500:
+                            self.breaker.record_failure()  # Ex. Moodle en maintenance
+                        else:
+                            self.breaker.record_success()
+                        r.raise_for_status()
+                        return r
+                    reason = f"HTTP {r.status_code}"
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if last_attempt:
+                        # Délai raccourci par le budget de la requête : rien ne dit que Moodle est en cause
+                        if not (clipped and isinstance(e, requests.exceptions.Timeout)):
+                            self.breaker.record_failure()
+                        raise
+                    reason = str(e)
+                delay = self.backoff_factor * (2 ** attempt)
+                check_deadline(delay + MIN_CALL_TIMEOUT)
+                print(f"[MoodleAPI] {function}: tentative {attempt + 1}/{attempts} échouée ({reason}), nouvel essai dans {delay:.2f}s")
+                time.sleep(delay)
+        finally:
+            self.breaker.release()
+
+    def batch(self):
+        """
+        Ouvre un lot d'appels WS envoyés en une seule requête à la sortie du bloc `with`.
+        Les méthodes acceptant un paramètre `batch` y mettent leur appel en file au lieu de l'exécuter.
+        """
+        return MoodleBatch(self)
 
     def _request(self, function: str, params: dict):
         payload = {
@@ -176,10 +357,25 @@ class MoodleAPI:
             if not courseid or not str(courseid).isdigit():
                 raise ValueError(f"courseid invalide pour {function}: {courseid}")
         
+        # Lecture déjà faite pendant la requête Django en cours : même résultat, sans aller-retour
+        memo = current_memo() if _is_read_function(function) else None
+        memo_key = (self.base, function, tuple(sorted((str(k), str(v)) for k, v in params.items())))
+        if memo is not None:
+            found, response_data = memo.get(memo_key)
+            if found:
+                return response_data
+        elif not _is_read_function(function):
+            # Écriture : les lectures mémorisées de la requête ne sont plus fiables
+            clear_current_memo()
+
         try:
-            r = requests.post(self.base, data=payload, verify=False)
-            r.raise_for_status()
-            response_data = r.json()
+            if _is_read_function(function):
+                response_data = self.inflight.do(memo_key, lambda: self._post(function, payload).json())
+            else:
+                response_data = self._post(function, payload).json()
+            # Seules les réponses valides sont mémorisées : une erreur Moodle repasse par les vérifications ci-dessous
+            if memo is not None and not self._is_error(response_data):
+                memo.set(memo_key, response_data)
             
             # Vérifier si la réponse contient une erreur Moodle
             if isinstance(response_data, dict):
@@ -198,28 +394,44 @@ class MoodleAPI:
             
         except requests.exceptions.RequestException as e:
             raise Exception(f"Erreur réseau: {e}")
-        except ValueError as e:
+        except (ValueError, UpstreamUnavailable) as e:
             raise e
         except Exception as e:
             raise Exception(f"Erreur API: {e}")
 
+    @staticmethod
+    def _is_error(result):
+        """Vrai si la réponse est une erreur Moodle retournée telle quelle par _request."""
+        return isinstance(result, dict) and ('exception' in result or 'errorcode' in result)
+
     def get_categories(self, parent_id: int = 0):
         try:
-            params = {
-                'criteria[0][key]': 'parent',
-                'criteria[0][value]': str(parent_id),
-                'addsubcategories': 0
-            }
-            result = self._request('core_course_get_categories', params)
-            
-            if not isinstance(result, list):
-                raise Exception("Format de réponse inattendu de l'API Moodle")
-                
-            return result
+            # Servi depuis l'arborescence en cache quand le parent y est connu
+            tree = self.get_category_tree()
+            if not parent_id or parent_id in tree:
+                return tree.children(parent_id)
+            return self._fetch_categories_by_parent(parent_id)
         except Exception as e:
             raise Exception(f"Impossible de récupérer les catégories: {str(e)}")
     
     def get_all_categories(self):
+        return self.get_category_tree().categories
+
+    def get_category_tree(self):
+        """
+        Retourne l'arborescence indexée (CategoryTree) de toutes les catégories.
+        Mise en cache (TTL + revalidation en arrière-plan) et invalidée par les opérations d'écriture.
+        """
+        return self.cache.get_or_load(CATEGORY_TREE_CACHE_KEY, lambda: CategoryTree(self._fetch_all_categories()))
+
+    def get_course_index(self):
+        """
+        Retourne l'index des cours par école / année / formation (CourseIndex).
+        Mis en cache comme l'arborescence et invalidé avec elle à chaque écriture sur le catalogue.
+        """
+        return self.cache.get_or_load(COURSE_INDEX_CACHE_KEY, lambda: CourseIndex(self.get_category_tree(), self.get_courses()))
+
+    def _fetch_all_categories(self):
         try:
             result = self._request('core_course_get_categories', {})
             
@@ -229,24 +441,43 @@ class MoodleAPI:
             return result
         except Exception as e:
             raise Exception(f"Impossible de récupérer les catégories: {str(e)}")
+
+    def _fetch_categories_by_parent(self, parent_id: int):
+        params = {
+            'criteria[0][key]': 'parent',
+            'criteria[0][value]': str(parent_id),
+            'addsubcategories': 0
+        }
+        result = self._request('core_course_get_categories', params)
+        
+        if not isinstance(result, list):
+            raise Exception("Format de réponse inattendu de l'API Moodle")
+            
+        return result
+
+    def invalidate_categories(self):
+        """
+        Invalide l'arborescence des catégories et l'index des cours en cache.
+        Les listes par parent et les détails de catégorie sont dérivés de l'arborescence : ce sont les seules
+        entrées à invalider après une écriture sur les catégories ou sur les cours (coursecount).
+        """
+        self.cache.invalidate(CATEGORY_TREE_CACHE_KEY, COURSE_INDEX_CACHE_KEY)
+        for listener in self.catalogue_listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                print(f"[MoodleAPI] Erreur d'un écouteur du catalogue: {e}")
     
     def get_subcategories(self, parent_id: int):
         """Récupère les sous-catégories d'une catégorie parent"""
         try:
             if parent_id is None:
                 raise ValueError("Le paramètre parent_id est obligatoire")
-                
-            params = {
-                'criteria[0][key]': 'parent',
-                'criteria[0][value]': str(parent_id),
-                'addsubcategories': 0
-            }
-            result = self._request('core_course_get_categories', params)
             
-            if not isinstance(result, list):
-                raise Exception("Format de réponse inattendu de l'API Moodle")
-                
-            return result
+            tree = self.get_category_tree()
+            if parent_id in tree:
+                return tree.children(parent_id)
+            return self._fetch_categories_by_parent(parent_id)
         except Exception as e:
             raise Exception(f"Impossible de récupérer les sous-catégories: {str(e)}")
 
@@ -260,22 +491,15 @@ class MoodleAPI:
             params = {
                 'categories[0][name]': name,
                 'categories[0][parent]': parent_id,
-                'wstoken': self.token,
-                'wsfunction': 'core_course_create_categories',
-                'moodlewsrestformat': self.fmt
             }
-            
-            response = requests.post(self.base, data=params, verify=False)
-            response.raise_for_status()
-            data = response.json()
+            data = self._request('core_course_create_categories', params)
             
             if isinstance(data, list) and data and 'id' in data[0]:
+                self.invalidate_categories()
                 return data[0]['id']
             else:
                 raise Exception("Impossible de créer la catégorie, réponse API invalide")
                 
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Erreur de requête lors de la création de la catégorie: {str(e)}")
         except Exception as e:
             raise Exception(f"Impossible de créer la catégorie: {str(e)}")
 
@@ -286,15 +510,12 @@ class MoodleAPI:
                 raise ValueError("Le paramètre category_id est obligatoire")
                 
             params = {
-                'wstoken': self.token,
-                'wsfunction': 'core_course_delete_categories',
-                'moodlewsrestformat': 'json',
                 'categories[0][id]': category_id,
                 'categories[0][recursive]': 1
             }
-            response = requests.post(self.base, params=params, verify=False)
-            response.raise_for_status()
-            return response.json()
+            result = self._request('core_course_delete_categories', params)
+            self.invalidate_categories()
+            return result
         except Exception as e:
             raise Exception(f"Impossible de supprimer la catégorie: {str(e)}")
 
@@ -316,25 +537,51 @@ class MoodleAPI:
 
     def get_courses_by_category(self, category_id):
         """Récupère tous les cours d'une catégorie spécifique"""
-        try:
-            # Essayer d'abord avec core_course_get_courses_by_field
-            params = {
+        def by_field():
+            result = self._request('core_course_get_courses_by_field', {
                 'field': 'category',
                 'value': str(category_id)
-            }
-            result = self._request('core_course_get_courses_by_field', params)
-            
-            if isinstance(result, dict) and 'courses' in result:
-                return result['courses']
-            elif isinstance(result, dict) and 'exception' in result:
-                # Fallback vers get_courses et filtrage
-                return self._get_courses_by_category_fallback(category_id)
-            else:
-                return []
-            
+            })
+            if self._is_error(result):
+                raise Exception(result.get('message', 'Erreur inconnue'))
+            return result.get('courses', []) if isinstance(result, dict) else []
+
+        # Essayer d'abord avec core_course_get_courses_by_field, sinon get_courses et filtrage
+        strategies = [
+            ('core_course_get_courses_by_field', by_field),
+            ('core_course_get_courses', lambda: self._get_courses_by_category_fallback(category_id)),
+        ]
+        try:
+            return self.capabilities.run('courses_by_category', strategies, is_valid=lambda result: isinstance(result, list))
         except Exception as e:
             return []
     
+    def get_courses_in_category_tree(self, category_id):
+        """
+        Récupère tous les cours d'une catégorie et de ses sous-catégories.
+        Un seul appel core_course_get_courses_by_field pour une catégorie sans enfant ;
+        sinon un seul téléchargement du catalogue, filtré à l'aide de l'arborescence des catégories.
+        Chaque cours retourné est une copie annotée de source_category_id / source_category_name.
+        """
+        category_id = int(category_id)
+        tree = self.get_category_tree()
+        target_ids = tree.subtree_ids(category_id) or [category_id]
+
+        if len(target_ids) == 1:
+            courses = self.get_courses_by_category(category_id)
+        else:
+            try:
+                target_set = set(target_ids)
+                courses = [c for c in self.get_courses() if isinstance(c, dict) and c.get('categoryid') in target_set]
+            except Exception as e:
+                # Catalogue complet inaccessible (droits du jeton) : une requête par catégorie
+                print(f"[MoodleAPI] Catalogue indisponible ({e}), récupération catégorie par catégorie")
+                courses = []
+                for cat_id in target_ids:
+                    courses.extend(self.get_courses_by_category(cat_id))
+
+        return annotate_category_courses(tree, target_ids, courses)
+
     def _get_courses_by_category_fallback(self, category_id):
         """Méthode de fallback pour récupérer les cours d'une catégorie"""
         try:
@@ -359,21 +606,39 @@ class MoodleAPI:
         except Exception as e:
             raise Exception(f"Impossible de récupérer les cours de la catégorie {category_id}: {str(e)}")
 
+    def find_course(self, course_id):
+        """
+        Récupère un cours par son ID sans télécharger le catalogue, None s'il n'existe pas.
+        core_course_get_courses_by_field (field=id) en priorité, core_course_get_courses (options[ids]) sinon.
+        """
+        def by_field():
+            result = self._request('core_course_get_courses_by_field', {'field': 'id', 'value': course_id})
+            if self._is_error(result) or not isinstance(result, dict):
+                raise Exception(result.get('message', 'Erreur inconnue') if isinstance(result, dict) else result)
+            return result.get('courses', [])
+
+        def by_ids():
+            result = self._request('core_course_get_courses', {'options[ids][0]': course_id})
+            if self._is_error(result):
+                raise Exception(result.get('message', 'Erreur inconnue'))
+            return result
+
+        strategies = [
+            ('core_course_get_courses_by_field', by_field),
+            ('core_course_get_courses', by_ids),
+        ]
+        courses = self.capabilities.run('course_by_id', strategies, is_valid=lambda result: isinstance(result, list))
+        return next((c for c in courses if isinstance(c, dict) and str(c.get('id')) == str(course_id)), None)
+
     def get_course(self, course_id):
         """Récupère un cours spécifique par son ID."""
         try:
-            params = {
-                'options[ids][0]': course_id,
-            }
-            data = self._request('core_course_get_courses_by_field', params)
-            
-            if isinstance(data, dict) and data.get('courses'):
-                return data['courses'][0]
-            else:
-                raise Exception(f"Cours avec l'ID {course_id} non trouvé")
-                
+            course = self.find_course(course_id)
         except Exception as e:
             raise Exception(f"Impossible de récupérer le cours {course_id}: {str(e)}")
+        if course is None:
+            raise Exception(f"Cours avec l'ID {course_id} non trouvé")
+        return course
 
     def update_course(self, course_id, name, category_id):
         """Met à jour un cours existant."""
@@ -387,7 +652,10 @@ class MoodleAPI:
                 'courses[0][shortname]': name[:20].replace(' ', '_'),
                 'courses[0][categoryid]': category_id,
             }
-            return self._request('core_course_update_courses', params)
+            result = self._request('core_course_update_courses', params)
+            # Le cours a pu changer de catégorie : les compteurs de cours sont à recalculer
+            self.invalidate_categories()
+            return result
         except Exception as e:
             raise Exception(f"Impossible de mettre à jour le cours: {str(e)}")
 
@@ -404,6 +672,7 @@ class MoodleAPI:
             data = self._request('core_course_create_courses', params)
             
             if isinstance(data, list) and data and data[0].get('id'):
+                self.invalidate_categories()
                 return data[0]['id']
             else:
                 raise Exception("Impossible de créer le cours, réponse API invalide")
@@ -420,34 +689,40 @@ class MoodleAPI:
             params = {
                 'courseids[0]': course_id,
             }
-            return self._request('core_course_delete_courses', params)
+            result = self._request('core_course_delete_courses', params)
+            self.invalidate_categories()
+            return result
         except Exception as e:
             raise Exception(f"Impossible de supprimer le cours: {str(e)}")
 
     def set_course_image(self, course_id, image_url):
-        """Définit l'image d'un cours Moodle via le plugin."""
-        try:
-            if not course_id or not image_url:
-                raise ValueError("Les paramètres course_id et image_url sont obligatoires")
-            
-            params = {
+        """Définit l'image d'un cours Moodle via le plugin (ou core_course_update_courses s'il est absent)."""
+        if not course_id or not image_url:
+            raise ValueError("Les paramètres course_id et image_url sont obligatoires")
+
+        def via_plugin():
+            return self._request('local_ajoutdescription_set_course_image', {
                 'courseid': course_id,
                 'imageurl': image_url,
-            }
-            return self._request('local_ajoutdescription_set_course_image', params)
+            })
+
+        def via_update_courses():
+            return self._request('core_course_update_courses', {
+                'courses[0][id]': course_id,
+                'courses[0][overviewfiles][0][filename]': 'course_image.jpg',
+                'courses[0][overviewfiles][0][fileurl]': image_url,
+            })
+
+        strategies = [
+            ('local_ajoutdescription_set_course_image', via_plugin),
+            ('core_course_update_courses', via_update_courses),
+        ]
+        try:
+            return self.capabilities.run('course_image', strategies, is_valid=lambda result: not self._is_error(result),
+                                         write=True)
         except Exception as e:
-            print(f"Erreur lors de la définition de l'image du cours via plugin: {str(e)}")
-            # Fallback vers l'ancienne méthode
-            try:
-                params = {
-                    'courses[0][id]': course_id,
-                    'courses[0][overviewfiles][0][filename]': 'course_image.jpg',
-                    'courses[0][overviewfiles][0][fileurl]': image_url,
-                }
-                return self._request('core_course_update_courses', params)
-            except Exception as fallback_error:
-                print(f"Erreur lors de la définition de l'image du cours (fallback): {str(fallback_error)}")
-                return None
+            print(f"Erreur lors de la définition de l'image du cours: {str(e)}")
+            return None
 
     def create_sections(self, course_id, section_names):
         params = {'courseid': course_id}
@@ -466,52 +741,36 @@ class MoodleAPI:
             return []
 
     def get_course_sections(self, course_id, force_refresh=False):
-        """Récupère les sections d'un cours avec leurs contenus de manière robuste."""
-        
-        # Essayer plusieurs méthodes en ordre de priorité
-        methods = [
-            lambda: self.get_sections_direct(course_id),
-            lambda: self._get_sections_via_get_contents(course_id, force_refresh),
-            lambda: self._get_course_sections_alternative(course_id)
+        """
+        Récupère les sections d'un cours avec leurs contenus de manière robuste.
+        La fonction WS qui a fonctionné est retenue pour le site : les appels suivants l'utilisent directement.
+        """
+        strategies = [
+            ('core_course_get_contents', lambda: self._get_sections_via_get_contents(course_id)),
+            ('local_wsmanagesections_get_sections', lambda: self._get_sections_via_wsmanagesections(course_id)),
         ]
-        
-        for method_func in methods:
-            try:
-                result = method_func()
-                
-                if isinstance(result, list) and len(result) > 0:
-                    # Vérifier que les sections sont valides
-                    valid_sections = []
-                    for item in result:
-                        if isinstance(item, dict) and 'section' in item:
-                            valid_sections.append(item)
-                    
-                    if valid_sections:
-                        return valid_sections
-                    
-            except Exception:
-                continue
-        
-        # Si toutes les méthodes échouent, retourner au minimum la section générale
-        return [{
-            'id': 0,
-            'section': 0,
-            'name': 'Généralités',
-            'visible': 1,
-            'modules': []
-        }]
+
+        def has_valid_sections(result):
+            return isinstance(result, list) and any(isinstance(item, dict) and 'section' in item for item in result)
+
+        try:
+            # force_refresh : relecture depuis Moodle, sans la mémoire de la requête
+            with (memo_bypass() if force_refresh else nullcontext()):
+                result = self.capabilities.run('course_sections', strategies, is_valid=has_valid_sections)
+            return [item for item in result if isinstance(item, dict) and 'section' in item]
+        except Exception:
+            pass
+
+        # Dernier recours : sections reconstruites à partir des options de format du cours
+        # (retourne au minimum la section générale)
+        return self._get_course_sections_alternative(course_id)
     
-    def _get_sections_via_get_contents(self, course_id, force_refresh=False):
+    def _get_sections_via_get_contents(self, course_id):
         """Récupère les sections via l'API core_course_get_contents avec gestion d'erreurs améliorée."""
         params = {
             'courseid': course_id,
         }
         
-        # Forcer le rafraîchissement en ajoutant un timestamp pour éviter le cache
-        if force_refresh:
-            import time
-            params['_cache_bust'] = int(time.time() * 1000)
-        
         result = self._request('core_course_get_contents', params)
         
         # Vérifier si c'est une erreur d'API
@@ -528,6 +787,17 @@ class MoodleAPI:
         
         return result
     
+    def _get_sections_via_wsmanagesections(self, course_id):
+        """Récupère les sections via le plugin local_wsmanagesections."""
+        result = self._request('local_wsmanagesections_get_sections', {'courseid': course_id})
+        if isinstance(result, dict):
+            if 'exception' in result or 'errorcode' in result:
+                raise Exception(f"Erreur API Moodle: {result.get('message', 'Erreur inconnue')}")
+            result = result.get('sections')
+        if not isinstance(result, list):
+            raise Exception(f"Format de réponse inattendu: {type(result)}")
+        return [{**item, 'modules': item.get('modules', [])} for item in result if isinstance(item, dict)]
+
     def _get_course_sections_alternative(self, course_id):
         """Méthode alternative pour récupérer les sections d'un cours en utilisant l'API core_course_get_courses."""
         try:
@@ -597,24 +867,27 @@ class MoodleAPI:
         """Récupère un cours avec toutes ses sections et contenus."""
         try:
             # Récupérer les informations de base du cours
-            courses = self.get_courses()
-            course = next((c for c in courses if c.get('id') == course_id), None)
+            course = self.find_course(course_id)
             
             if course:
                 try:
                     # Essayer de récupérer les sections du cours
                     sections = self.get_course_sections(course_id)
-                    course['sections'] = sections
+                    # Copie : le cours peut être partagé (mémoire de la requête, appels regroupés)
+                    course = {**course, 'sections': sections}
                 except Exception as e:
                     # Si on ne peut pas récupérer les sections, continuer sans elles
-                    course['sections'] = []
+                    course = {**course, 'sections': []}
                 
             return course
         except Exception as e:
             return None
 
-    def add_url(self, course_id, sectionnum, name, url, description=''):
-        """Ajoute une URL comme ressource dans un cours Moodle en utilisant notre plugin personnalisé"""
+    def add_url(self, course_id, sectionnum, name, url, description='', batch=None):
+        """
+        Ajoute une URL comme ressource dans un cours Moodle en utilisant notre plugin personnalisé.
+        Si un lot (api.batch()) est fourni, l'appel y est mis en file et le BatchCall est retourné.
+        """
         params = {
             'courseid': course_id,
             'sectionnum': sectionnum,
@@ -622,6 +895,8 @@ class MoodleAPI:
             'url': url,
             'description': description,
         }
+        if batch is not None:
+            return batch.add('local_ajouturl_add_url', params)
         return self._request('local_ajouturl_add_url', params)
 
     def get_category_details(self, category_id: int):
@@ -629,6 +904,10 @@ class MoodleAPI:
         try:
             if not category_id:
                 raise ValueError("Le paramètre category_id est obligatoire")
+            
+            category = self.get_category_tree().get(int(category_id))
+            if category:
+                return category
                 
             params = {
                 'criteria[0][key]': 'id',
@@ -660,6 +939,14 @@ class MoodleAPI:
             return {'success': True, 'message': 'Aucune section valide à supprimer'}
         
         try:
+            if verify_deletion:
+                # Identifiants des sections visées, relevés avant la suppression
+                target_ids = {
+                    s.get('section'): s.get('id')
+                    for s in self.get_course_sections(course_id, force_refresh=True)
+                    if isinstance(s, dict) and s.get('section') in valid_sections
+                }
+            
             # Préparer les paramètres pour l'API
             params = {
                 'courseid': course_id,
@@ -675,15 +962,18 @@ class MoodleAPI:
                 error_msg = result.get('message', 'Erreur de suppression inconnue')
                 return {'success': False, 'error': error_msg}
             
-            # Vérification optionnelle que les sections ont bien été supprimées
+            # Vérification optionnelle que les sections ont bien été supprimées,
+            # par leur identifiant (Moodle renumérote les sections suivant une section supprimée)
             if verify_deletion:
-                import time
-                time.sleep(1)  # Attendre un peu pour que la suppression soit effective
+                still_present = list(valid_sections)
                 
-                remaining_sections = self.get_course_sections(course_id, force_refresh=True)
-                remaining_nums = {s.get('section', 0) for s in remaining_sections if isinstance(s, dict)}
+                def deletion_visible():
+                    remaining_sections = self.get_course_sections(course_id, force_refresh=True)
+                    remaining_ids = {s.get('id') for s in remaining_sections if isinstance(s, dict)}
+                    still_present[:] = [num for num in valid_sections if target_ids.get(num) in remaining_ids]
+                    return not still_present
                 
-                still_present = [num for num in valid_sections if num in remaining_nums]
+                wait_until(deletion_visible, name='moodle.delete_sections', deadline=self.consistency_timeout)
                 if still_present:
                     return {
                         'success': False, 
@@ -699,88 +989,164 @@ class MoodleAPI:
     def update_sections(self, course_id, section_names):
         """
         Met à jour les sections d'un cours existant en utilisant le plugin wsmanagesections.
-        Compare les sections existantes avec les nouvelles et ne modifie que ce qui a changé.
+        Compare les sections existantes avec les nouvelles et n'envoie que la différence :
+        - les sections sont appariées par titre (plus longue sous-séquence commune) : une section conservée
+          garde ses ressources, même si des sections sont supprimées ou ajoutées avant elle ;
+        - une section de même titre changée de rang est déplacée, pas recréée ;
+        - une section remplacée à la même place par un autre titre est renommée sur place ;
+        - les sections sans correspondance sont supprimées, les nouvelles créées puis placées à leur rang ;
+        - les sections invisibles dans l'interface (sans titre ou nommées comme la section générale) sont supprimées.
+        Les opérations sont vérifiées à partir des réponses de l'API, sans attente fixe.
         Note: La section 0 (section générale) est toujours conservée.
+        
+        Returns:
+            Liste des numéros de section correspondant, dans l'ordre, aux noms demandés
+        """
+        # Nettoyer et filtrer les noms de sections
+        cleaned_sections = [name.strip() for name in section_names if _is_visible_section_name(name)]
+        
+        # Sections existantes (> 0), réparties entre celles affichées dans l'interface et les autres
+        existing_sections = sorted(
+            (s for s in self.get_course_sections(course_id) if isinstance(s, dict) and s.get('section', 0) > 0),
+            key=lambda s: s.get('section', 0)
+        )
+        visible = [s for s in existing_sections if _is_visible_section_name(s.get('name', ''))]
+        hidden_nums = [s['section'] for s in existing_sections if not _is_visible_section_name(s.get('name', ''))]
+        
+        visible_nums = [s['section'] for s in visible]
+        visible_names = [s.get('name', '').strip() for s in visible]
+        
+        # Si les listes sont identiques, rien à faire
+        if visible_names == cleaned_sections and not hidden_nums:
+            return visible_nums
+        
+        # Section existante retenue pour chaque titre demandé (None : section à créer)
+        plan = [None] * len(cleaned_sections)
+        opcodes = difflib.SequenceMatcher(None, visible_names, cleaned_sections, autojunk=False).get_opcodes()
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'equal':
+                plan[j1:j2] = visible_nums[i1:i2]
+        unmatched = [i for i in range(len(visible)) if visible_nums[i] not in plan]
+        
+        # Sections déplacées : même titre, hors de la sous-séquence commune
+        for j, name in enumerate(cleaned_sections):
+            if plan[j] is None:
+                i = next((i for i in unmatched if visible_names[i] == name), None)
+                if i is not None:
+                    plan[j] = visible_nums[i]
+                    unmatched.remove(i)
+        
+        # Sections remplacées à la même place par un autre titre : renommées sur place
+        renames = {}
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'replace':
+                old = [i for i in range(i1, i2) if i in unmatched]
+                new = [j for j in range(j1, j2) if plan[j] is None]
+                for i, j in zip(old, new):
+                    plan[j] = visible_nums[i]
+                    renames[visible_nums[i]] = cleaned_sections[j]
+                    unmatched.remove(i)
+        
+        # 1. Renommer sur place les sections dont le titre a changé
+        if renames and not self.rename_sections(course_id, renames):
+            # Renommage indisponible : recréer ces sections sous leur nouveau titre
+            plan = [None if num in renames else num for num in plan]
+        
+        # 2. Supprimer les sections sans correspondance et les sections invisibles
+        to_delete = sorted((set(visible_nums) - set(plan)) | set(hidden_nums))
+        if to_delete:
+            delete_result = self.delete_sections(course_id, to_delete, verify_deletion=False)
+            if not delete_result.get('success'):
+                raise Exception(f"Impossible de supprimer les sections {to_delete}: {delete_result.get('error')}")
+        
+        # Moodle renumérote les sections suivant une section supprimée
+        plan = [num - sum(1 for deleted in to_delete if deleted < num) if num is not None else None for num in plan]
+        
+        # 3. Créer les sections manquantes (ajoutées à la fin du cours)
+        missing = [j for j, num in enumerate(plan) if num is None]
+        if missing:
+            created = self._create_sections_checked(course_id, [cleaned_sections[j] for j in missing])
+            for j, num in zip(missing, created):
+                plan[j] = num
+        
+        # 4. Placer les sections dans l'ordre demandé
+        return self._order_sections(course_id, plan, cleaned_sections)
+
+    def _create_sections_checked(self, course_id, section_names):
+        """create_sections, en levant une exception si Moodle n'a pas créé toutes les sections."""
+        created = self.create_sections(course_id, section_names)
+        if len(created) != len(section_names) or any(num is None for num in created):
+            raise Exception(f"Création des sections incomplète: {len(section_names)} demandées, réponse {created}")
+        return created
+
+    def _order_sections(self, course_id, plan, section_names):
+        """
+        Déplace les sections pour que la section plan[i] occupe le i-ème rang.
+        Si le déplacement est indisponible, les sections à partir du premier rang incorrect sont recréées.
+        
+        Returns:
+            Liste des numéros de section correspondant, dans l'ordre, à section_names
+        """
+        slots = sorted(plan)
+        order = list(slots)  # Section (numéro avant déplacement) occupant chaque rang
+        for position, section in enumerate(plan):
+            current = order.index(section)
+            if current == position:
+                continue
+            if not self.move_section(course_id, slots[current], slots[position]):
+                to_delete = slots[position:]
+                delete_result = self.delete_sections(course_id, to_delete, verify_deletion=False)
+                if not delete_result.get('success'):
+                    raise Exception(f"Impossible de supprimer les sections {to_delete}: {delete_result.get('error')}")
+                return slots[:position] + self._create_sections_checked(course_id, section_names[position:])
+            # Les sections entre l'ancien et le nouveau rang sont décalées d'un rang
+            order.insert(position, order.pop(current))
+        return slots
+
+    def move_section(self, course_id, section_num, position):
+        """
+        Déplace une section au rang `position` (les sections intermédiaires sont décalées d'un rang).
+        
+        Returns:
+            True si le déplacement a été accepté par Moodle, False sinon
         """
+        params = {'courseid': course_id, 'sectionnumber': section_num, 'position': position}
         try:
-            # Nettoyage préventif des doublons existants
-            self.cleanup_duplicate_sections(course_id)
-            
-            # Nettoyer et filtrer les noms de sections
-            cleaned_sections = []
-            for name in section_names:
-                name = name.strip()
-                if name and name.lower() not in ['généralités', 'generalites', 'general']:
-                    cleaned_sections.append(name)
-            
-            # Récupérer les sections existantes
-            existing_sections = self.get_course_sections(course_id)
-            
-            # Extraire SEULEMENT les noms des sections > 0 (excluant la section générale)
-            existing_section_names = []
-            existing_section_nums = []
-            
-            for section in existing_sections:
-                # Vérifier que section est bien un dictionnaire
-                if not isinstance(section, dict):
-                    continue
-                    
-                section_num = section.get('section', 0)
-                if section_num > 0:  # Ignorer la section 0 (générale)
-                    existing_section_names.append(section.get('name', ''))
-                    existing_section_nums.append(section_num)
-            
-            # Si les listes sont identiques, rien à faire
-            if existing_section_names == cleaned_sections:
-                return existing_section_nums
-            
-            # Supprimer d'abord les anciennes sections, puis créer les nouvelles
-            # Cela évite les conflits de numérotation avec la section générale
-            
-            # 1. Supprimer toutes les sections existantes (sauf la section 0)
-            if existing_section_nums:
-                try:
-                    delete_result = self.delete_sections(course_id, existing_section_nums)
-                    
-                    # Vérification : attendre un peu et vérifier que les sections sont vraiment supprimées
-                    import time
-                    time.sleep(1)
-                    
-                    # Vérifier si les sections ont vraiment été supprimées
-                    sections_after_delete = self.get_course_sections(course_id, force_refresh=True)
-                    remaining_sections = [s for s in sections_after_delete if isinstance(s, dict) and s.get('section', 0) > 0]
-                    if remaining_sections:
-                        # Essayer de forcer la suppression
-                        remaining_nums = [s.get('section') for s in remaining_sections if isinstance(s, dict)]
-                        force_delete_result = self.delete_sections(course_id, remaining_nums)
-                        time.sleep(1)
-                    
-                except Exception as e:
-                    # Si la suppression échoue, on ne peut pas continuer proprement
-                    raise e
-            
-            # 2. Créer les nouvelles sections
-            created_sections = []
-            if cleaned_sections:
-                try:
-                    created_sections = self.create_sections(course_id, cleaned_sections)
-                    
-                    # Attendre un peu pour laisser le temps à Moodle de traiter
-                    import time
-                    time.sleep(2)
-                    
-                except Exception as e:
-                    raise e
-            
-            return created_sections
-                
+            result = self._request('local_wsmanagesections_move_section', params)
         except Exception as e:
-            # En cas d'erreur, essayer quand même de créer les nouvelles sections (après filtrage)
-            if section_names:
-                cleaned = [name.strip() for name in section_names if name.strip() and name.strip().lower() not in ['généralités', 'generalites', 'general']]
-                return self.create_sections(course_id, cleaned)
-            else:
-                return []
+            print(f"[MoodleAPI] Déplacement de la section {section_num} impossible: {e}")
+            return False
+        if isinstance(result, dict) and ('exception' in result or 'errorcode' in result):
+            print(f"[MoodleAPI] Déplacement de la section {section_num} refusé: {result.get('message')}")
+            return False
+        return True
+
+    def rename_sections(self, course_id, renames):
+        """
+        Renomme des sections existantes sans toucher à leur contenu.
+        
+        Args:
+            renames: dictionnaire {numéro de section: nouveau nom}
+        
+        Returns:
+            True si le renommage a été accepté par Moodle, False sinon
+        """
+        if not renames:
+            return True
+        params = {'courseid': course_id}
+        for i, (section_num, name) in enumerate(sorted(renames.items())):
+            params[f'sections[{i}][type]'] = 'num'
+            params[f'sections[{i}][section]'] = section_num
+            params[f'sections[{i}][name]'] = name
+        try:
+            result = self._request('local_wsmanagesections_update_sections', params)
+        except Exception as e:
+            print(f"[MoodleAPI] Renommage des sections impossible: {e}")
+            return False
+        if isinstance(result, dict) and ('exception' in result or 'errorcode' in result):
+            print(f"[MoodleAPI] Renommage des sections refusé: {result.get('message')}")
+            return False
+        return True
     
     def cleanup_duplicate_sections(self, course_id):
         """
@@ -933,7 +1299,7 @@ class MoodleAPI:
                 'modules': []
             }]
     
-    def assign_teachers_to_course(self, course_id, usernames):
+    def assign_teachers_to_course(self, course_id, usernames, batch=None):
         """
         Affecte un ou plusieurs profs (usernames LDAP) au cours comme enseignants (roleid=3 par défaut sur Moodle)
         Utilise enrol_manual_enrol_users (plus fiable pour l'enrôlement dans un cours).
@@ -944,23 +1310,8 @@ class MoodleAPI:
 
         print(f"[DEBUG] Affectation des enseignants au cours {course_id} avec le rôle 3: {usernames}")
 
-        # Récupérer les IDs des utilisateurs Moodle
-        userids = []
-        failed_usernames = []
-
-        for username in usernames:
-            try:
-                print(f"[DEBUG] Recherche de l'utilisateur: {username}")
-                user_info = self.get_user_by_username(username)
-                if user_info and 'id' in user_info:
-                    userids.append(user_info['id'])
-                    print(f"[DEBUG] Utilisateur trouvé: {username} -> ID {user_info['id']}")
-                else:
-                    failed_usernames.append(username)
-                    print(f"[WARNING] Utilisateur non trouvé: {username}")
-            except Exception as e:
-                failed_usernames.append(username)
-                print(f"[ERROR] Erreur lors de la recherche de l'utilisateur {username}: {e}")
+        # Récupérer les IDs des utilisateurs Moodle (une requête par type de clé pour toute la liste)
+        userids, failed_usernames = self._resolve_user_ids(usernames)
 
         if failed_usernames:
             print(f"[WARNING] Utilisateurs non trouvés: {failed_usernames}")
@@ -971,7 +1322,7 @@ class MoodleAPI:
 
         # Enrôler les users avec le rôle 3 (enseignant)
         print(f"[DEBUG] Enrôlement de {len(userids)} utilisateurs dans le cours {course_id} avec le rôle 3")
-        return self._enrol_users_to_course(course_id, userids, role_id=3)
+        return self._enrol_users_to_course(course_id, userids, role_id=3, batch=batch)
     
     def assign_teachers_by_email_simple(self, course_id, emails):
         """
@@ -983,23 +1334,16 @@ class MoodleAPI:
         print(f"[DEBUG] Affectation par email simple: {emails}")
         
         try:
-            # Récupérer les userids Moodle à partir des emails (comme ajoutprof.py)
+            # Récupérer les userids Moodle à partir des emails, en une seule requête
+            by_email = self._get_users_indexed_by('email', emails)
             userids = []
             for email in emails:
-                try:
-                    params = {
-                        'criteria[0][key]': 'email',
-                        'criteria[0][value]': email
-                    }
-                    result = self._request('core_user_get_users', params)
-                    users = result.get('users', []) if isinstance(result, dict) else []
-                    if users:
-                        userids.append(users[0]['id'])
-                        print(f"[DEBUG] Utilisateur trouvé: {email} -> ID {users[0]['id']}")
-                    else:
-                        print(f"[WARNING] Utilisateur non trouvé pour l'email: {email}")
-                except Exception as e:
-                    print(f"[ERROR] Erreur pour l'email {email}: {e}")
+                user = by_email.get(email.lower())
+                if user:
+                    userids.append(user['id'])
+                    print(f"[DEBUG] Utilisateur trouvé: {email} -> ID {user['id']}")
+                else:
+                    print(f"[WARNING] Utilisateur non trouvé pour l'email: {email}")
             
             if not userids:
                 print("[WARNING] Aucun utilisateur trouvé")
@@ -1021,7 +1365,7 @@ class MoodleAPI:
             print(f"[ERROR] Erreur dans assign_teachers_by_email_simple: {e}")
             raise
     
-    def _enrol_users_to_course(self, course_id, userids, role_id=3):
+    def _enrol_users_to_course(self, course_id, userids, role_id=3, batch=None):
         """
         Méthode privée pour enrôler des utilisateurs dans un cours avec un rôle spécifique
         Inspirée de la logique d'ajoutprof.py
@@ -1034,6 +1378,8 @@ class MoodleAPI:
                 params[f'enrolments[{i}][courseid]'] = course_id
             
             print(f"[DEBUG] Paramètres d'enrôlement: {params}")
+            if batch is not None:
+                return batch.add('enrol_manual_enrol_users', params)
             result = self._request('enrol_manual_enrol_users', params)
             print(f"[DEBUG] Enrôlement réussi - course_id={course_id}, userids={userids}, role_id={role_id}")
             print(f"[DEBUG] Résultat API: {result}")
@@ -1054,49 +1400,97 @@ class MoodleAPI:
             Dictionnaire avec les infos de l'utilisateur ou None si non trouvé
         """
         try:
-            # 1. Recherche par email (méthode principale)
-            email = f"{username}@caplogy.com"
-            try:
-                params = {'criteria[0][key]': 'email', 'criteria[0][value]': email}
-                result = self._request('core_user_get_users', params)
-                users = result.get('users', []) if isinstance(result, dict) else []
-                if users:
-                    print(f"[DEBUG] Utilisateur trouvé par email: {email} -> ID {users[0]['id']}")
-                    return users[0]
-            except Exception as e:
-                print(f"[DEBUG] Erreur lors de la recherche par email {email}: {e}")
-            
-            # 2. Recherche par idnumber
-            try:
-                params = {'criteria[0][key]': 'idnumber', 'criteria[0][value]': username}
-                result = self._request('core_user_get_users', params)
-                users = result.get('users', []) if isinstance(result, dict) else []
-                if users:
-                    print(f"[DEBUG] Utilisateur trouvé par idnumber: {username} -> ID {users[0]['id']}")
-                    return users[0]
-            except Exception as e:
-                print(f"[DEBUG] Erreur lors de la recherche par idnumber {username}: {e}")
-            
-            # 3. Si username contient déjà @, l'essayer directement comme email
-            if '@' in username:
-                try:
-                    params = {'criteria[0][key]': 'email', 'criteria[0][value]': username}
-                    result = self._request('core_user_get_users', params)
-                    users = result.get('users', []) if isinstance(result, dict) else []
-                    if users:
-                        print(f"[DEBUG] Utilisateur trouvé par email direct: {username} -> ID {users[0]['id']}")
-                        return users[0]
-                except Exception as e:
-                    print(f"[DEBUG] Erreur lors de la recherche par email direct {username}: {e}")
-            
-            print(f"[DEBUG] Utilisateur non trouvé: {username}")
-            return None
-            
+            user = self.resolve_users([username]).get(username)
+            if user:
+                print(f"[DEBUG] Utilisateur trouvé: {username} -> ID {user['id']}")
+            else:
+                print(f"[DEBUG] Utilisateur non trouvé: {username}")
+            return user
         except Exception as e:
             print(f"[ERROR] Erreur lors de la recherche de l'utilisateur {username}: {e}")
             return None
 
-    def assign_users_to_course_with_role(self, course_id, usernames, role_id=3):
+    def resolve_users(self, identifiers):
+        """
+        Résout une liste d'usernames LDAP en utilisateurs Moodle, avec au plus une requête
+        core_user_get_users_by_field par type de clé, dans l'ordre de priorité historique :
+        1. email <username>@caplogy.com  2. idnumber = username  3. email brut (si l'identifiant contient @)
+        Les résolutions réussies sont conservées dans un cache LRU borné.
+        
+        Returns:
+            Dictionnaire {identifiant: utilisateur Moodle ou None}
+        """
+        resolved = {}
+        pending = []
+        for identifier in dict.fromkeys(identifiers):
+            cached = self.user_cache.get(identifier)
+            if cached is not None:
+                resolved[identifier] = cached
+            else:
+                pending.append(identifier)
+        
+        if pending:
+            # 1 + 3. Emails construits et emails bruts dans une seule requête
+            candidate_emails = {identifier: f"{identifier}@caplogy.com" for identifier in pending}
+            raw_emails = {identifier: identifier for identifier in pending if '@' in identifier}
+            by_email = self._get_users_indexed_by('email', list(candidate_emails.values()) + list(raw_emails.values()))
+            
+            unresolved = []
+            for identifier in pending:
+                user = by_email.get(candidate_emails[identifier].lower())
+                if user:
+                    resolved[identifier] = user
+                else:
+                    unresolved.append(identifier)
+            
+            # 2. idnumber pour les identifiants restants
+            by_idnumber = self._get_users_indexed_by('idnumber', unresolved) if unresolved else {}
+            for identifier in unresolved:
+                user = by_idnumber.get(identifier.lower())
+                if not user and identifier in raw_emails:
+                    user = by_email.get(identifier.lower())
+                resolved[identifier] = user
+            
+            for identifier in pending:
+                if resolved.get(identifier):
+                    self.user_cache.set(identifier, resolved[identifier])
+        
+        return {identifier: resolved.get(identifier) for identifier in identifiers}
+
+    def _get_users_indexed_by(self, field, values):
+        """Appel core_user_get_users_by_field pour plusieurs valeurs, indexé par valeur du champ (minuscules)."""
+        values = [value for value in dict.fromkeys(values) if value]
+        if not values:
+            return {}
+        params = {'field': field}
+        for i, value in enumerate(values):
+            params[f'values[{i}]'] = value
+        try:
+            result = self._request('core_user_get_users_by_field', params)
+        except Exception as e:
+            print(f"[ERROR] Erreur lors de la recherche par {field}: {e}")
+            return {}
+        if not isinstance(result, list):
+            print(f"[ERROR] Réponse inattendue lors de la recherche par {field}: {result}")
+            return {}
+        return {str(user.get(field, '')).lower(): user for user in result if isinstance(user, dict)}
+
+    def _resolve_user_ids(self, usernames):
+        """Retourne (ids Moodle trouvés, usernames introuvables) pour une liste d'usernames."""
+        resolved = self.resolve_users(usernames)
+        userids = []
+        failed_usernames = []
+        for username in usernames:
+            user = resolved.get(username)
+            if user and 'id' in user:
+                userids.append(user['id'])
+                print(f"[DEBUG] Utilisateur trouvé: {username} -> ID {user['id']}")
+            else:
+                failed_usernames.append(username)
+                print(f"[WARNING] Utilisateur non trouvé: {username}")
+        return userids, failed_usernames
+
+    def assign_users_to_course_with_role(self, course_id, usernames, role_id=3, batch=None):
         """
         Affecte un ou plusieurs utilisateurs (usernames LDAP) au cours avec un rôle spécifique
         
@@ -1113,23 +1507,8 @@ class MoodleAPI:
         
         print(f"[DEBUG] Affectation des utilisateurs au cours {course_id} avec le rôle {role_id}: {usernames}")
         
-        # Récupérer les IDs des utilisateurs Moodle
-        userids = []
-        failed_usernames = []
-        
-        for username in usernames:
-            try:
-                print(f"[DEBUG] Recherche de l'utilisateur: {username}")
-                user_info = self.get_user_by_username(username)
-                if user_info and 'id' in user_info:
-                    userids.append(user_info['id'])
-                    print(f"[DEBUG] Utilisateur trouvé: {username} -> ID {user_info['id']}")
-                else:
-                    failed_usernames.append(username)
-                    print(f"[WARNING] Utilisateur non trouvé: {username}")
-            except Exception as e:
-                failed_usernames.append(username)
-                print(f"[ERROR] Erreur lors de la recherche de l'utilisateur {username}: {e}")
+        # Récupérer les IDs des utilisateurs Moodle (une requête par type de clé pour toute la liste)
+        userids, failed_usernames = self._resolve_user_ids(usernames)
         
         if failed_usernames:
             print(f"[WARNING] Utilisateurs non trouvés: {failed_usernames}")
@@ -1140,7 +1519,7 @@ class MoodleAPI:
             
         # Enrôler les users avec le rôle spécifié
         print(f"[DEBUG] Enrôlement de {len(userids)} utilisateurs dans le cours {course_id} avec le rôle {role_id}")
-        return self._enrol_users_to_course(course_id, userids, role_id=role_id)
+        return self._enrol_users_to_course(course_id, userids, role_id=role_id, batch=batch)
     
     def debug_find_users_in_moodle(self, usernames):
         """
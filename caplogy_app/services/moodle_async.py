@@ -0,0 +1,45 @@
+"""
+Variante asyncio de MoodleAPI, pour les vues qui enchaînent des appels WS indépendants.
+
+Chaque méthode de MoodleAPI est disponible sous forme de coroutine (`await api.get_course_teachers(...)`) :
+l'appel est exécuté par le client synchrone partagé (pool HTTP, caches, disjoncteur, budget de la requête)
+dans un thread, au plus max_concurrency à la fois. Des appels lancés ensemble (gather) se recouvrent :
+une page qui en fait dix dure le temps du plus lent au lieu de la somme.
+
+Le projet n'embarque pas de client HTTP asynchrone (aiohttp, httpx) : les threads réutilisent
+le transport synchrone et ses réglages plutôt que d'en maintenir un second.
+Le sémaphore est propre à une boucle d'événements : une instance par requête (get_async_moodle_api).
+"""
+import asyncio
+import functools
+
+from .moodle_api import MoodleAPI
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class AsyncMoodleAPI:
+    def __init__(self, api: MoodleAPI, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.api = api
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(self, fn, *args, **kwargs):
+        """Exécute fn(*args, **kwargs) dans un thread, dans la limite de concurrence."""
+        async with self._semaphore:
+            # to_thread copie le contexte : mémo, budget et suivi des données périmées de la requête suivent l'appel
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return call
+
+    async def get_courses_in_category_tree(self, category_id):
+        """Comme MoodleAPI.get_courses_in_category_tree, exécutée en un seul appel dans un thread."""
+        return await self.run(self.api.get_courses_in_category_tree, category_id)
@@ -1,14 +1,47 @@
+import hashlib
 import requests
 import os
 from urllib.parse import quote
 from xml.etree import ElementTree as ET
 from urllib.parse import unquote
 
+from .cache import MemoryStore, SharedCache, TTLCache
+from .circuit_breaker import CircuitBreaker
+from .deadline import clip_timeout
+from .singleflight import SingleFlight
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+# Mode dégradé : disjoncteur (échecs consécutifs avant ouverture, durée d'ouverture en secondes),
+# conservation des derniers listings (secondes)
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RETRY_AFTER = 30
+DEFAULT_LAST_GOOD_TTL = 86400
+# Listings conservés en mémoire du processus (sans cache partagé)
+DEFAULT_LISTING_CACHE_SIZE = 256
+
 class NextcloudAPI:
-    def __init__(self, base_url: str, share_url: str, user: str, password: str):
+    def __init__(self, base_url: str, share_url: str, user: str, password: str,
+                 cache_backend=None, listing_cache_ttl: float = 0,
+                 retry_after: float = DEFAULT_RETRY_AFTER, last_good_ttl: float = DEFAULT_LAST_GOOD_TTL,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 listing_cache_size: int = DEFAULT_LISTING_CACHE_SIZE):
         self.webdav = base_url
         self.share = share_url
         self.auth = (user, password)
+        self.timeout = (connect_timeout, read_timeout)
+
+        # Listings de dossiers mis en cache (désactivé si listing_cache_ttl vaut 0),
+        # dans le cache Django partagé par les workers s'il est fourni, sinon dans un cache mémoire borné (LRU).
+        # Un dossier n'est relu qu'à la demande : le préchargeur ne les entretient pas (warm=False).
+        if cache_backend is not None:
+            namespace = f"nextcloud:{hashlib.sha1(f'{base_url}|{user}'.encode()).hexdigest()[:8]}:listings"
+            store = SharedCache(cache_backend, namespace, timeout=(listing_cache_ttl + last_good_ttl) or None)
+        else:
+            store = MemoryStore(maxsize=listing_cache_size)
+        self.listing_cache = TTLCache(ttl=listing_cache_ttl, store=store, name='Nextcloud', warm=False)
 
         # Configuration optimisée pour réduire les timeouts
         self.session = requests.Session()
@@ -22,7 +55,43 @@ class NextcloudAPI:
             'Cache-Control': 'no-cache'
         }
 
+        # Listings simultanés d'un même dossier : une seule requête PROPFIND partagée
+        self.inflight = SingleFlight()
+        # Nextcloud injoignable : après failure_threshold échecs, les appels échouent aussitôt pendant retry_after secondes
+        self.breaker = CircuitBreaker('Nextcloud', failure_threshold, retry_after)
+
+    def _send(self, method, url, budgeted=True, **kwargs):
+        """
+        Requête HTTP via la session partagée, protégée par le disjoncteur de Nextcloud.
+        Son délai est limité au budget restant de la requête Django, sauf pour budgeted=False
+        (envoi de fichiers, dont la durée dépend de leur taille).
+        """
+        self.breaker.before_call()
+        clipped = False
+        try:
+            # Dans le try : un budget épuisé (DeadlineExceeded) doit libérer l'essai du disjoncteur semi-ouvert
+            timeout, clipped = clip_timeout(self.timeout) if budgeted else (self.timeout, False)
+            resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            if resp.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return resp
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # Délai raccourci par le budget de la requête : rien ne dit que Nextcloud est en cause
+            if not (clipped and isinstance(e, requests.exceptions.Timeout)):
+                self.breaker.record_failure()
+            raise
+        finally:
+            self.breaker.release()
+
     def list_nc_dir(self, path):
+        """Liste (dossiers, fichiers) d'un répertoire Nextcloud."""
+        return self.listing_cache.get_or_load(
+            path, lambda: self.inflight.do(('PROPFIND', path), lambda: self._list_nc_dir(path))
+        )
+
+    def _list_nc_dir(self, path):
         # Supprimer la logique qui force le chemin à commencer par '/Shared/Biblio_Cours_Caplogy'
         try:
             url = self.webdav + path
@@ -37,12 +106,11 @@ class NextcloudAPI:
             print(f"[NextcloudAPI] Auth: {self.auth[0]}:***")
             print(f"[NextcloudAPI] Verify SSL: False")
 
-            # Utiliser requests direct au lieu de session pour débugger
-            resp = requests.request(
+            # Session partagée : réutilise les connexions keep-alive entre les appels
+            resp = self._send(
                 'PROPFIND', 
                 url, 
                 headers=headers, 
-                auth=self.auth,
                 verify=False
             )
             print(f"[NextcloudAPI] Réponse reçue (Status: {resp.status_code})")
@@ -84,8 +152,9 @@ class NextcloudAPI:
         remote_path = remote_dir.rstrip('/') + '/' + quote(filename)
         url = self.webdav + remote_path
         with open(local_path, 'rb') as f:
-            r = requests.put(url, auth=self.auth, data=f, verify=False)
+            r = self._send('PUT', url, budgeted=False, data=f, verify=False)
         r.raise_for_status()
+        self.listing_cache.invalidate(remote_dir)
         return remote_path
 
     def share_file_nextcloud(self, path):
@@ -93,7 +162,7 @@ class NextcloudAPI:
             path = f"/{path}"
         headers = {'OCS-APIRequest': 'true', 'Accept': 'application/xml'}
         data = {'path': path, 'shareType': 3, 'permissions': 1}
-        resp = requests.post(self.share, headers=headers, data=data, auth=self.auth, verify=False)
+        resp = self._send('POST', self.share, headers=headers, data=data, verify=False)
         resp.raise_for_status()
         tree = ET.fromstring(resp.text)
         return tree.find('.//url').text
@@ -0,0 +1,88 @@
+"""
+Attente adaptative d'une condition (cohérence à terme de Moodle), en remplacement des time.sleep fixes.
+
+La condition est testée immédiatement, puis avec un délai croissant (backoff exponentiel + gigue)
+jusqu'à ce qu'elle soit vraie ou que l'échéance globale soit atteinte. La durée réelle de chaque attente
+est enregistrée dans wait_metrics pour pouvoir ajuster les échéances.
+"""
+import random
+import threading
+import time
+
+DEFAULT_DEADLINE = 5.0
+DEFAULT_INITIAL_DELAY = 0.1
+DEFAULT_MAX_DELAY = 1.0
+DEFAULT_BACKOFF = 2.0
+DEFAULT_JITTER = 0.2
+
+
+class WaitMetrics:
+    """Statistiques des attentes, par nom d'opération."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed, attempts, satisfied):
+        with self._lock:
+            stats = self._stats.setdefault(name, {
+                'count': 0, 'timeouts': 0, 'attempts': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            })
+            stats['count'] += 1
+            stats['attempts'] += attempts
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+            if not satisfied:
+                stats['timeouts'] += 1
+
+    def snapshot(self):
+        """Copie des statistiques, avec la durée moyenne de chaque opération."""
+        with self._lock:
+            return {
+                name: {**stats, 'avg_seconds': stats['total_seconds'] / stats['count'] if stats['count'] else 0.0}
+                for name, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+wait_metrics = WaitMetrics()
+
+
+def wait_until(condition, name='wait', deadline=DEFAULT_DEADLINE, initial_delay=DEFAULT_INITIAL_DELAY,
+               max_delay=DEFAULT_MAX_DELAY, backoff=DEFAULT_BACKOFF, jitter=DEFAULT_JITTER):
+    """
+    Appelle condition() jusqu'à ce qu'elle retourne une valeur vraie ou que `deadline` secondes soient écoulées.
+
+    Args:
+        condition: fonction sans argument ; ses exceptions sont propagées
+        name: nom de l'opération dans wait_metrics
+        deadline: durée maximale totale de l'attente (secondes)
+        initial_delay / max_delay: bornes du délai entre deux essais
+        backoff: facteur multiplicatif du délai après chaque essai
+        jitter: variation aléatoire relative du délai (0.2 = ±20 %)
+
+    Returns:
+        La dernière valeur retournée par condition() (fausse si l'échéance a été atteinte).
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    attempts = 1
+    value = condition()
+    while not value:
+        remaining = deadline - (time.monotonic() - start)
+        if remaining <= 0:
+            break
+        pause = delay * random.uniform(1 - jitter, 1 + jitter)
+        time.sleep(max(0.0, min(pause, remaining)))
+        delay = min(delay * backoff, max_delay)
+        attempts += 1
+        value = condition()
+
+    elapsed = time.monotonic() - start
+    wait_metrics.record(name, elapsed, attempts, bool(value))
+    if not value:
+        print(f"[wait_until] {name}: condition non satisfaite après {elapsed:.2f}s ({attempts} essais)")
+    return value
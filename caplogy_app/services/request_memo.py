@@ -0,0 +1,80 @@
+"""
+Mémorisation des appels WS Moodle le temps d'une requête Django.
+
+Activée par RequestMemoMiddleware : à l'intérieur d'une même requête, un appel de lecture identique
+(même fonction, mêmes paramètres) retourne le résultat déjà obtenu au lieu de refaire l'aller-retour.
+Tout appel d'écriture vide la mémoire de la requête, qui disparaît avec elle : aucune donnée ne survit
+d'une requête à l'autre.
+
+Hors requête (scripts, threads d'arrière-plan), rien n'est mémorisé.
+
+Les résultats mémorisés ne sont pas copiés (une copie du catalogue complet par lecture annulerait le gain) :
+comme les valeurs des caches, ils sont partagés entre les appelants et doivent être traités en lecture seule.
+Un appelant qui veut modifier un résultat en fait d'abord une copie (ex. MoodleAPI.get_course_with_sections).
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_memo = ContextVar('moodle_request_memo', default=None)
+_bypass = ContextVar('moodle_request_memo_bypass', default=False)
+
+
+class RequestMemo:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Retourne (True, résultat partagé, en lecture seule) si la clé est connue, (False, None) sinon."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@contextmanager
+def request_memo():
+    """Active une mémoire vierge pour le contexte courant (une requête Django)."""
+    memo = RequestMemo()
+    token = _current_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _current_memo.reset(token)
+
+
+@contextmanager
+def memo_bypass():
+    """Les lectures faites dans ce bloc interrogent Moodle (ex. attente de la prise en compte d'une écriture)."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def current_memo():
+    """Mémoire active pour les lectures du contexte courant, None si aucune (ou si elle est contournée)."""
+    if _bypass.get():
+        return None
+    return _current_memo.get()
+
+
+def clear_current_memo():
+    """Vide la mémoire du contexte courant, même dans un bloc memo_bypass (appelé après une écriture)."""
+    memo = _current_memo.get()
+    if memo is not None:
+        memo.clear()
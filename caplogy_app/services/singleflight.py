@@ -0,0 +1,78 @@
+"""
+Regroupement (« single-flight ») des appels identiques simultanés.
+
+Quand plusieurs threads demandent en même temps la même clé, un seul (le premier) exécute l'appel ;
+les autres attendent sa fin et reçoivent son résultat (ou son exception). Une fois l'appel terminé,
+la clé est libérée : l'appel suivant repart vers le service distant (ce n'est pas un cache).
+
+Exception : si l'appel a échoué faute de temps dans le budget de la requête du premier appelant
+(délai raccourci par clip_timeout, DeadlineExceeded), les autres appelants, qui ont leur propre budget,
+refont l'appel eux-mêmes au lieu de recevoir cette erreur.
+"""
+import threading
+
+from .deadline import MIN_CALL_TIMEOUT, DeadlineExceeded, remaining
+
+
+def _budget_exhausted(error):
+    """Vrai si l'échec peut venir du budget de temps de la requête en cours plutôt que du service."""
+    left = remaining()
+    if left is not None and left < MIN_CALL_TIMEOUT:
+        return True
+    while error is not None:
+        if isinstance(error, DeadlineExceeded):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+        self.budget_exhausted = False
+
+
+class SingleFlight:
+    def __init__(self):
+        # Le résultat est remis tel quel à tous les appelants regroupés : il est partagé, en lecture seule
+        self.coalesced = 0  # nombre d'appels servis par un appel déjà en cours
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Exécute fn() pour `key`, ou attend l'exécution déjà en cours pour la même clé."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                if call.budget_exhausted:
+                    # Échec lié au budget de l'appelant principal : appel refait avec le budget de celui-ci
+                    return fn()
+                raise call.error
+            return call.result
+
+        try:
+            result = fn()
+            call.result = result
+        except BaseException as e:
+            call.error = e
+            call.budget_exhausted = _budget_exhausted(e)
+            raise
+        finally:
+            with self._lock:
+                # Clé libérée : plus aucun appelant ne peut rejoindre cet appel
+                del self._calls[key]
+            call.done.set()
+        return result
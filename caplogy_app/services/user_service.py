@@ -1,10 +1,15 @@
-import os, json, hashlib
+import os, json, hashlib, threading
 from django.conf import settings
+from django.core.cache import caches
 from ..models import UserProfile
 from django.contrib.auth.models import User
+from .cache import SharedCache, TTLCache
+from .circuit_breaker import CircuitBreaker
+from .deadline import clip_timeout
 
 # AD/LDAP
 from ldap3 import Server, Connection, ALL, NTLM
+from ldap3.core.exceptions import LDAPCommunicationError, LDAPResponseTimeoutError
 
 class UserService:
     def __init__(self, file_path=None):
@@ -38,7 +43,8 @@ class UserService:
         """
         try:
             print(f"Tentative de connexion LDAP vers {settings.AD_SERVER}")
-            server = Server(settings.AD_SERVER, get_info=ALL, use_ssl=True)
+            server = Server(settings.AD_SERVER, get_info=ALL, use_ssl=True,
+                            connect_timeout=settings.LDAP_CONNECT_TIMEOUT)
             user_dn = f"{settings.AD_DOMAIN}\\{username}"
             print(f"DN utilisateur: {user_dn}")
             print(f"DEBUG: Tentative de bind avec le compte {user_dn}")
@@ -47,7 +53,8 @@ class UserService:
                 user=user_dn,
                 password=password,
                 authentication=NTLM,
-                auto_bind=False
+                auto_bind=False,
+                receive_timeout=settings.LDAP_RECEIVE_TIMEOUT
             )
             print("Tentative de bind...")
             if not conn.bind():
@@ -94,33 +101,101 @@ class UserService:
 
     def get_ldap_profs(self):
         """
-        Récupère tous les utilisateurs de l'OU Utilisateurs Caplogy (profs) depuis LDAP
+        Récupère tous les utilisateurs de l'OU Utilisateurs Caplogy (profs) depuis LDAP.
+        La liste est mise en cache (get_profs_cache) : périmée, elle reste servie pendant son rechargement.
         """
         try:
-            server = Server(settings.AD_SERVER, get_info=ALL, use_ssl=True)
-            # Connexion avec un compte de service LDAP valide
-            conn = Connection(
-                server,
-                user=f"{settings.AD_DOMAIN}\\t.frescaline",  # Utiliser un compte LDAP valide
-                password="&NC$U&QS*8cbiy",  # Mot de passe LDAP valide
-                authentication=NTLM,
-                auto_bind=True
-            )
-            # Recherche dans l'OU Utilisateurs Caplogy
-            search_base = 'OU=Utilisateurs Caplogy,' + settings.AD_SEARCH_BASE
-            conn.search(
-                search_base,
-                '(objectClass=person)',
-                attributes=['sAMAccountName', 'cn', 'mail']
-            )
-            profs = []
-            for entry in conn.entries:
-                profs.append({
-                    'username': str(entry.sAMAccountName),
-                    'name': str(entry.cn),
-                    'mail': str(entry.mail) if hasattr(entry, 'mail') else ''
-                })
-            return profs
+            return get_profs_cache().get_or_load(PROFS_CACHE_KEY, fetch_ldap_profs)
         except Exception as e:
             print(f"Erreur LDAP lors de la récupération des profs: {e}")
             return []
+
+
+PROFS_CACHE_KEY = 'profs'
+
+_profs_cache_lock = threading.Lock()
+_profs_cache = None
+
+
+def get_profs_cache():
+    """Cache de la liste des profs LDAP, partagé par les workers si un cache Django est configuré."""
+    global _profs_cache
+    if _profs_cache is None:
+        with _profs_cache_lock:
+            if _profs_cache is None:
+                ttl = settings.LDAP_PROFS_CACHE_TTL
+                stale_ttl = settings.LDAP_PROFS_STALE_TTL
+                store = None
+                if settings.UPSTREAM_CACHE_ALIAS:
+                    timeout = (ttl + stale_ttl + settings.UPSTREAM_LAST_GOOD_TTL) or None
+                    store = SharedCache(caches[settings.UPSTREAM_CACHE_ALIAS], 'ldap:profs',
+                                        timeout=timeout, local_ttl=ttl)
+                _profs_cache = TTLCache(ttl=ttl, stale_ttl=stale_ttl, store=store, name='LDAP')
+    return _profs_cache
+
+
+_ldap_breaker = None
+
+
+def get_ldap_breaker():
+    """Disjoncteur de l'annuaire LDAP (voir circuit_breaker.py)."""
+    global _ldap_breaker
+    if _ldap_breaker is None:
+        with _profs_cache_lock:
+            if _ldap_breaker is None:
+                _ldap_breaker = CircuitBreaker('LDAP', settings.UPSTREAM_FAILURE_THRESHOLD,
+                                               settings.UPSTREAM_RETRY_AFTER)
+    return _ldap_breaker
+
+
+def fetch_ldap_profs():
+    """
+    Interroge LDAP (OU Utilisateurs Caplogy) ; lève une exception en cas d'échec pour qu'il ne soit pas mis en cache.
+    Les délais de connexion et de réponse sont limités au budget restant de la requête Django.
+    """
+    breaker = get_ldap_breaker()
+    breaker.before_call()
+    try:
+        # Dans le try : un budget épuisé (DeadlineExceeded) doit libérer l'essai du disjoncteur semi-ouvert
+        connect_timeout, connect_clipped = clip_timeout(settings.LDAP_CONNECT_TIMEOUT)
+        receive_timeout, receive_clipped = clip_timeout(settings.LDAP_RECEIVE_TIMEOUT)
+        profs = _search_ldap_profs(connect_timeout, receive_timeout)
+    except (LDAPCommunicationError, LDAPResponseTimeoutError):
+        # Délais raccourcis par le budget de la requête : rien ne dit que l'annuaire est en cause
+        if not (connect_clipped or receive_clipped):
+            breaker.record_failure()
+        raise
+    else:
+        breaker.record_success()
+    finally:
+        breaker.release()
+    return profs
+
+
+def _search_ldap_profs(connect_timeout, receive_timeout):
+    server = Server(settings.AD_SERVER, get_info=ALL, use_ssl=True, connect_timeout=connect_timeout)
+    # Connexion avec un compte de service LDAP valide
+    conn = Connection(
+        server,
+        user=f"{settings.AD_DOMAIN}\\t.frescaline",  # Utiliser un compte LDAP valide
+        password="&NC$U&QS*8cbiy",  # Mot de passe LDAP valide
+        authentication=NTLM,
+        auto_bind=True,
+        receive_timeout=receive_timeout
+    )
+    # Recherche dans l'OU Utilisateurs Caplogy
+    search_base = 'OU=Utilisateurs Caplogy,' + settings.AD_SEARCH_BASE
+    conn.search(
+        search_base,
+        '(objectClass=person)',
+        attributes=['sAMAccountName', 'cn', 'mail']
+    )
+    profs = []
+    for entry in conn.entries:
+        profs.append({
+            'username': str(entry.sAMAccountName),
+            'name': str(entry.cn),
+            'mail': str(entry.mail) if hasattr(entry, 'mail') else ''
+        })
+    conn.unbind()
+    return profs
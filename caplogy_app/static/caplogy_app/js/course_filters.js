@@ -145,52 +145,83 @@ document.addEventListener('DOMContentLoaded', () => {
     // Initialiser le composant de recherche
     initSchoolSearchable()
 
+    // Chargement en cours de chaque liste de sous-catégories : vider la liste abandonne son chargement
+    const subcategoryRequests = new Map()
+
+    function resetSubcategories(target, placeholder) {
+        const request = (subcategoryRequests.get(target) || 0) + 1
+        subcategoryRequests.set(target, request)
+        target.innerHTML = `<option value="">${placeholder}</option>`
+        return () => subcategoryRequests.get(target) === request
+    }
+
     function toggleGroups() {
         if (schoolFilter.value) {
             yearGroup.classList.remove('hidden')
         } else {
             yearGroup.classList.add('hidden')
-            yearFilter.innerHTML = '<option value="">Toutes les années</option>'
+            resetSubcategories(yearFilter, 'Toutes les années')
             formationGroup.classList.add('hidden')
-            formationFilter.innerHTML = '<option value="">Toutes les formations</option>'
+            resetSubcategories(formationFilter, 'Toutes les formations')
         }
 
         if (yearFilter.value) {
             formationGroup.classList.remove('hidden')
         } else {
             formationGroup.classList.add('hidden')
-            formationFilter.innerHTML = '<option value="">Toutes les formations</option>'
+            resetSubcategories(formationFilter, 'Toutes les formations')
         }
     }
 
-    function loadSubcategories(parent, target, placeholder) {
-        target.innerHTML = `<option value="">${placeholder}</option>`
-        if (!parent.value) return
-        fetch(`/api/categories/?parent=${parent.value}`)
+    const COURSES_PAGE_SIZE = 100
+
+    // Parcourt toutes les pages d'une API paginée (?limit=&cursor=) en appelant onPage pour chacune.
+    // isCurrent() permet d'abandonner le parcours si une requête plus récente l'a remplacé.
+    function fetchPages(url, params, key, onPage, isCurrent = () => true, cursor = null) {
+        const p = new URLSearchParams(params)
+        if (cursor) p.set('cursor', cursor)
+        return fetch(`${url}?${p.toString()}`)
             .then(r => r.json())
             .then(json => {
-                json.categories.forEach(cat => {
-                    const o = document.createElement('option')
-                    o.value = cat.id
-                    o.textContent = cat.name
-                    target.appendChild(o)
-                })
+                if (!isCurrent()) return
+                onPage(json[key] || [], json)
+                if (json.next_cursor) {
+                    return fetchPages(url, params, key, onPage, isCurrent, json.next_cursor)
+                }
             })
     }
 
+    function loadSubcategories(parent, target, placeholder) {
+        // Un nouveau parent abandonne le chargement précédent : ses pages ne sont plus ajoutées à la liste
+        const isCurrent = resetSubcategories(target, placeholder)
+        if (!parent.value) return
+        const params = { parent: parent.value, fields: 'id,name', limit: 200 }
+        fetchPages('/api/categories/', params, 'categories', categories => {
+            categories.forEach(cat => {
+                const o = document.createElement('option')
+                o.value = cat.id
+                o.textContent = cat.name
+                target.appendChild(o)
+            })
+        }, isCurrent)
+    }
+
+    let tableRequest = 0
+
     function updateTable() {
-        const p = new URLSearchParams()
-        if (schoolFilter.value) p.set('school', schoolFilter.value)
-        if (yearFilter.value) p.set('year', yearFilter.value)
-        if (formationFilter.value) p.set('formation', formationFilter.value)
-        if (searchFilter.value) p.set('search', searchFilter.value)
-        fetch(`/api/courses/?${p.toString()}`)
-            .then(r => r.json())
-            .then(json => {
-                tableBody.innerHTML = ''
-                json.courses.forEach(c => {
-                    const tr = document.createElement('tr')
-                    tr.innerHTML = `
+        const p = { limit: COURSES_PAGE_SIZE, fields: 'id,fullname,schoolname,yearname,formationname' }
+        if (schoolFilter.value) p.school = schoolFilter.value
+        if (yearFilter.value) p.year = yearFilter.value
+        if (formationFilter.value) p.formation = formationFilter.value
+        if (searchFilter.value) p.search = searchFilter.value
+
+        // Les pages arrivent progressivement ; un changement de filtre abandonne le chargement en cours
+        const request = ++tableRequest
+        tableBody.innerHTML = ''
+        fetchPages('/api/courses/', p, 'courses', courses => {
+            courses.forEach(c => {
+                const tr = document.createElement('tr')
+                tr.innerHTML = `
             <td>${c.fullname}</td>
             <td>${c.schoolname}</td>
             <td>${c.yearname || ''}</td>
@@ -213,9 +244,9 @@ document.addEventListener('DOMContentLoaded', () => {
                     <span>Supprimer</span>
                 </a>
             </td>`
-                    tableBody.appendChild(tr)
-                })
+                tableBody.appendChild(tr)
             })
+        }, () => request === tableRequest)
     }
 
     schoolFilter.addEventListener('change', () => {
@@ -0,0 +1,588 @@
+import json
+import threading
+import time
+from unittest import mock
+
+import requests
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import views
+from .models import CatalogueSyncState
+from .services import catalogue_mirror, user_service
+from .services.batch import BATCH_FUNCTION, MoodleBatch, unflatten_params
+from .services.cache import SharedCache
+from .services.capabilities import SiteCapabilities
+from .services.circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
+from .services.deadline import DeadlineExceeded, request_deadline
+from .services.degraded import UpstreamUnavailable
+from .services.moodle_api import MoodleAPI
+from .services.nextcloud_api import NextcloudAPI
+from .services.request_memo import request_memo
+from .services.singleflight import SingleFlight
+
+
+def _half_open_breaker(name):
+    """Disjoncteur ouvert après un échec, dont le délai d'ouverture est déjà écoulé (prochain appel = essai)."""
+    breaker = CircuitBreaker(name, failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    return breaker
+
+
+class CircuitBreakerDeadlineTests(SimpleTestCase):
+    """Un budget de requête épuisé pendant l'essai de reprise ne doit pas bloquer le disjoncteur semi-ouvert."""
+
+    def test_nextcloud_trial_released_when_deadline_exhausted(self):
+        api = NextcloudAPI('https://nc.example/webdav', 'https://nc.example/ocs', 'user', 'password')
+        api.breaker = _half_open_breaker('Nextcloud')
+
+        with request_deadline(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(DeadlineExceeded):
+                api._send('PROPFIND', api.webdav)
+        self.assertEqual(api.breaker.state, HALF_OPEN)
+
+        response = mock.Mock(status_code=207)
+        with mock.patch.object(api.session, 'request', return_value=response):
+            self.assertIs(api._send('PROPFIND', api.webdav), response)
+        self.assertEqual(api.breaker.state, CLOSED)
+
+    def test_ldap_trial_released_when_deadline_exhausted(self):
+        breaker = _half_open_breaker('LDAP')
+        with mock.patch.object(user_service, '_ldap_breaker', breaker), \
+                mock.patch.object(user_service, '_search_ldap_profs', return_value=[{'username': 'prof'}]) as search:
+            with request_deadline(0.01):
+                time.sleep(0.02)
+                with self.assertRaises(DeadlineExceeded):
+                    user_service.fetch_ldap_profs()
+            search.assert_not_called()
+            self.assertEqual(breaker.state, HALF_OPEN)
+
+            self.assertEqual(user_service.fetch_ldap_profs(), [{'username': 'prof'}])
+        self.assertEqual(breaker.state, CLOSED)
+
+
+class FakeCourse:
+    """Sections d'un cours Moodle en mémoire (plugin wsmanagesections) : titre et ressources de chaque section."""
+
+    def __init__(self, names, move_supported=True):
+        self.sections = [{'name': name, 'resources': [f"{name.lower()}-res"]} for name in names]
+        self.move_supported = move_supported
+
+    def attach(self, api):
+        for method in ('get_course_sections', 'rename_sections', 'delete_sections', 'create_sections', 'move_section'):
+            setattr(api, method, getattr(self, method))
+
+    def get_course_sections(self, course_id):
+        return [{'section': 0, 'name': 'Généralités'}] + [
+            {'section': num, 'name': section['name']} for num, section in enumerate(self.sections, 1)
+        ]
+
+    def rename_sections(self, course_id, renames):
+        for num, name in renames.items():
+            self.sections[num - 1]['name'] = name
+        return True
+
+    def delete_sections(self, course_id, section_nums, verify_deletion=True):
+        self.sections = [s for num, s in enumerate(self.sections, 1) if num not in section_nums]
+        return {'success': True}
+
+    def create_sections(self, course_id, section_names):
+        self.sections.extend({'name': name, 'resources': []} for name in section_names)
+        return list(range(len(self.sections) - len(section_names) + 1, len(self.sections) + 1))
+
+    def move_section(self, course_id, section_num, position):
+        if not self.move_supported:
+            return False
+        self.sections.insert(position - 1, self.sections.pop(section_num - 1))
+        return True
+
+    def state(self):
+        return [(num, s['name'], s['resources']) for num, s in enumerate(self.sections, 1)]
+
+
+class UpdateSectionsTests(SimpleTestCase):
+    """Les sections conservées gardent leurs ressources : appariement par titre, pas par position."""
+
+    def update(self, before, after, **kwargs):
+        api = MoodleAPI('https://moodle.example/webservice/rest/server.php', 'token')
+        course = FakeCourse(before, **kwargs)
+        course.attach(api)
+        nums = api.update_sections(42, after)
+        # Les numéros retournés désignent, dans l'ordre, les sections demandées
+        self.assertEqual([course.sections[num - 1]['name'] for num in nums], after)
+        return course.state()
+
+    def test_delete_middle_section(self):
+        self.assertEqual(self.update(['A', 'B', 'C', 'D'], ['A', 'C', 'D']), [
+            (1, 'A', ['a-res']), (2, 'C', ['c-res']), (3, 'D', ['d-res']),
+        ])
+
+    def test_move_middle_section(self):
+        self.assertEqual(self.update(['A', 'B', 'C', 'D'], ['A', 'C', 'B', 'D']), [
+            (1, 'A', ['a-res']), (2, 'C', ['c-res']), (3, 'B', ['b-res']), (4, 'D', ['d-res']),
+        ])
+
+    def test_insert_and_rename(self):
+        self.assertEqual(self.update(['A', 'B', 'C'], ['New', 'A', 'B2', 'C']), [
+            (1, 'New', []), (2, 'A', ['a-res']), (3, 'B2', ['b-res']), (4, 'C', ['c-res']),
+        ])
+
+    def test_move_unavailable_recreates_from_first_misplaced_section(self):
+        self.assertEqual(self.update(['A', 'B', 'C'], ['A', 'C', 'B'], move_supported=False), [
+            (1, 'A', ['a-res']), (2, 'C', []), (3, 'B', []),
+        ])
+
+
+class SharedCacheVersionTests(SimpleTestCase):
+    """Une entrée écrite avant une invalidation n'est jamais relue, même si la clé de version est évincée."""
+
+    def test_invalidated_entries_stay_hidden_after_version_key_eviction(self):
+        backend = LocMemCache('shared-cache-tests', {})
+        cache = SharedCache(backend, 'tests:catalogue')
+        cache.set('tree', 'v1')
+        cache.invalidate()
+        self.assertIsNone(cache.get('tree'))
+
+        backend.delete(cache._version_key)  # Éviction (ex. cull de FileBasedCache)
+        self.assertIsNone(cache.get('tree'))
+
+        cache.set('tree', 'v2')
+        self.assertEqual(SharedCache(backend, 'tests:catalogue').get('tree'), 'v2')
+
+
+class NextcloudListingCacheTests(SimpleTestCase):
+    """Les listings Nextcloud ne sont pas rechargés par le préchargeur et restent bornés en mémoire."""
+
+    def setUp(self):
+        self.api = NextcloudAPI('http://nextcloud.invalid/dav', 'http://nextcloud.invalid/ocs', 'user', 'secret',
+                                listing_cache_ttl=30, listing_cache_size=2)
+
+    def test_listings_are_not_refreshed_by_the_warmer(self):
+        loader = mock.Mock(return_value=[])
+        self.api.listing_cache.get_or_load('/a', loader)
+        self.assertEqual(self.api.listing_cache.refresh_hot(ratio=0), [])
+        self.assertEqual(loader.call_count, 1)
+
+    def test_listing_store_evicts_least_recently_read_folder(self):
+        cache = self.api.listing_cache
+        for folder in ('/a', '/b'):
+            cache.get_or_load(folder, lambda: [folder])
+        cache.get_or_load('/a', mock.Mock())  # '/a' relu : '/b' devient le moins récent
+        cache.get_or_load('/c', lambda: ['/c'])
+        self.assertEqual([key for key, _ in cache.items()], ['/a', '/c'])
+
+
+class MoodleRetryTests(SimpleTestCase):
+    """Les nouvelles tentatives ne sont faites qu'à un seul niveau (_post), pas aussi par le transport."""
+
+    def test_connection_error_is_retried_read_retries_times_only(self):
+        api = MoodleAPI('http://moodle.invalid/webservice/rest/server.php', 'token', read_retries=2, backoff_factor=0)
+        with mock.patch('urllib3.util.connection.create_connection', side_effect=ConnectionRefusedError) as connect:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                api._post('core_course_get_courses', {})
+        self.assertEqual(connect.call_count, 3)
+
+    def test_write_is_sent_once(self):
+        api = MoodleAPI('http://moodle.invalid/webservice/rest/server.php', 'token', read_retries=2, backoff_factor=0)
+        with mock.patch('urllib3.util.connection.create_connection', side_effect=ConnectionRefusedError) as connect:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                api._post('core_course_create_courses', {})
+        self.assertEqual(connect.call_count, 1)
+
+
+class UnflattenParamsTests(SimpleTestCase):
+    def test_nested_indexes_become_lists_in_numeric_order(self):
+        params = {
+            'courses[0][fullname]': 'Algèbre',
+            'courses[0][categoryid]': 3,
+            'courses[10][fullname]': 'Topologie',
+            'courses[2][fullname]': 'Analyse',
+            'courses[0][courseformatoptions][0][name]': 'numsections',
+            'moodlewsrestformat': 'json',
+        }
+        self.assertEqual(unflatten_params(params), {
+            'courses': [
+                {'fullname': 'Algèbre', 'categoryid': 3, 'courseformatoptions': [{'name': 'numsections'}]},
+                {'fullname': 'Analyse'},
+                {'fullname': 'Topologie'},
+            ],
+            'moodlewsrestformat': 'json',
+        })
+
+
+class FakeBatchAPI:
+    """MoodleAPI réduit à ce qu'utilise MoodleBatch ; _request répond via `responses` (fonction -> réponse ou exception)."""
+
+    def __init__(self, responses, batch_supported=None, supports=None):
+        self.responses = responses
+        self.batch_supported = batch_supported
+        self.capabilities = mock.Mock()
+        self.capabilities.supports.return_value = supports
+        self.invalidate_categories = mock.Mock()
+        self.requests = []
+
+    def _request(self, function, params):
+        self.requests.append((function, params))
+        response = self.responses[function]
+        if isinstance(response, Exception):
+            raise response
+        return response(params) if callable(response) else response
+
+
+class MoodleBatchTests(SimpleTestCase):
+    def _grouped(self, *items):
+        return {'responses': list(items)}
+
+    def test_grouped_results_follow_call_order(self):
+        api = FakeBatchAPI({BATCH_FUNCTION: self._grouped(
+            {'error': False, 'data': json.dumps({'id': 1})},
+            {'error': False, 'data': json.dumps({'id': 2})},
+        )})
+        with MoodleBatch(api) as batch:
+            first = batch.add('local_ajouturl_add_url', {'courseid': 1})
+            second = batch.add('local_ajouturl_add_url', {'courseid': 2})
+
+        self.assertEqual([first.get(), second.get()], [{'id': 1}, {'id': 2}])
+        self.assertEqual(len(api.requests), 1)
+        arguments = [json.loads(api.requests[0][1][f'requests[{i}][arguments]']) for i in range(2)]
+        self.assertEqual(arguments, [{'courseid': 1}, {'courseid': 2}])
+        self.assertTrue(api.batch_supported)
+
+    def test_calls_after_first_error_are_run_sequentially(self):
+        # Moodle interrompt le lot au premier appel en erreur : le troisième appel n'a pas été exécuté
+        api = FakeBatchAPI({
+            BATCH_FUNCTION: self._grouped(
+                {'error': False, 'data': '{"id": 1}'},
+                {'error': True, 'exception': json.dumps({'message': 'Section introuvable'})},
+            ),
+            'local_ajouturl_add_url': {'id': 3},
+        })
+        with MoodleBatch(api) as batch:
+            calls = [batch.add('local_ajouturl_add_url', {'courseid': i}) for i in range(3)]
+
+        self.assertEqual(calls[0].get(), {'id': 1})
+        with self.assertRaisesRegex(Exception, 'Section introuvable'):
+            calls[1].get()
+        self.assertEqual(calls[2].get(), {'id': 3})
+        self.assertEqual([function for function, _ in api.requests], [BATCH_FUNCTION, 'local_ajouturl_add_url'])
+        self.assertEqual(api.requests[1][1], {'courseid': 2})
+
+    def test_network_error_is_not_replayed(self):
+        # On ignore ce que Moodle a exécuté : les écritures ne sont pas rejouées une à une
+        error = requests.exceptions.ConnectionError('connexion perdue')
+        api = FakeBatchAPI({BATCH_FUNCTION: error})
+        with MoodleBatch(api) as batch:
+            calls = [batch.add('core_course_create_courses', {'courses[0][fullname]': name}) for name in 'AB']
+
+        self.assertEqual([call.error for call in calls], [error, error])
+        self.assertEqual(len(api.requests), 1)
+        api.invalidate_categories.assert_called_once()
+
+    def test_unavailable_batch_function_falls_back_to_sequential_calls(self):
+        api = FakeBatchAPI({
+            BATCH_FUNCTION: {'exception': 'webservice_access_exception', 'message': 'Access control exception'},
+            'core_course_get_courses': lambda params: [{'id': params['options[ids][0]']}],
+        })
+        with MoodleBatch(api) as batch:
+            calls = [batch.add('core_course_get_courses', {'options[ids][0]': i}) for i in (7, 8)]
+
+        self.assertEqual([call.get() for call in calls], [[{'id': 7}], [{'id': 8}]])
+        self.assertIs(api.batch_supported, False)
+
+        # Appris pour les lots suivants : plus de tentative groupée
+        api.requests.clear()
+        with MoodleBatch(api) as batch:
+            batch.add('core_course_get_courses', {'options[ids][0]': 9})
+            batch.add('core_course_get_courses', {'options[ids][0]': 10})
+        self.assertNotIn(BATCH_FUNCTION, [function for function, _ in api.requests])
+
+    def test_disabled_function_is_not_tried(self):
+        api = FakeBatchAPI({'core_course_get_courses': []}, supports=False)
+        with MoodleBatch(api) as batch:
+            batch.add('core_course_get_courses', {})
+            batch.add('core_course_get_courses', {})
+        self.assertEqual([function for function, _ in api.requests], ['core_course_get_courses'] * 2)
+
+
+class RequestMemoErrorTests(SimpleTestCase):
+    """Une erreur Moodle n'est pas mémorisée : une lecture répétée lève la même erreur au lieu de la retourner."""
+
+    def test_repeated_read_after_moodle_error_raises_again(self):
+        api = MoodleAPI('https://moodle.example/webservice/rest/server.php', 'token')
+        error = {'exception': 'invalid_parameter_exception', 'errorcode': 'invalidparameter', 'message': 'Invalid parameter'}
+        response = mock.Mock(**{'json.return_value': error})
+        with mock.patch.object(api, '_post', return_value=response) as post, request_memo():
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    api._request('core_course_get_courses', {'options[ids][0]': 1})
+        self.assertEqual(post.call_count, 2)
+
+    def test_repeated_read_returns_the_memoised_result_without_copy(self):
+        api = MoodleAPI('https://moodle.example/webservice/rest/server.php', 'token')
+        response = mock.Mock(**{'json.return_value': [{'id': 2, 'fullname': 'Cours'}]})
+        with mock.patch.object(api, '_post', return_value=response) as post, request_memo():
+            first = api._request('core_course_get_courses', {})
+            self.assertIs(api._request('core_course_get_courses', {}), first)
+        self.assertEqual(post.call_count, 1)
+
+    def test_course_with_sections_does_not_modify_the_shared_course(self):
+        api = MoodleAPI('https://moodle.example/webservice/rest/server.php', 'token')
+        course = {'id': 2, 'fullname': 'Cours'}
+        with mock.patch.object(api, 'find_course', return_value=course), \
+                mock.patch.object(api, 'get_course_sections', return_value=[{'section': 1, 'name': 'A'}]):
+            self.assertEqual(api.get_course_with_sections(2)['sections'], [{'section': 1, 'name': 'A'}])
+        self.assertNotIn('sections', course)
+
+
+class MoodleAPIConstructionTests(SimpleTestCase):
+    def test_shared_cache_without_url(self):
+        # MOODLE_URL non défini : le client se construit, comme avant l'ajout du cache partagé
+        api = MoodleAPI(None, None, cache_backend=LocMemCache('moodle-api-tests', {}))
+        self.assertIsNone(api.base)
+
+
+class FakeCatalogueAPI:
+    """Catalogue Moodle en mémoire ; on_fetch est appelé pendant la lecture des cours (synchronisation en cours)."""
+
+    def __init__(self, courses, on_fetch=None):
+        self.courses = courses
+        self.on_fetch = on_fetch
+
+    def _fetch_all_categories(self):
+        return [{'id': 1, 'name': 'École', 'parent': 0, 'timemodified': 1}]
+
+    def get_courses(self):
+        if self.on_fetch:
+            self.on_fetch()
+        return [{'id': i, 'fullname': name, 'categoryid': 1, 'timemodified': 1} for i, name in enumerate(self.courses, 2)]
+
+
+class CatalogueMirrorStaleTests(TestCase):
+    """Après une écriture depuis l'intranet, le miroir n'est relu qu'une fois resynchronisé avec cette écriture."""
+
+    def setUp(self):
+        catalogue_mirror.sync_catalogue(FakeCatalogueAPI(['Old']))
+        catalogue_mirror.mark_mirror_stale()
+
+    def test_mirror_stays_stale_while_sync_is_fetching(self):
+        readable_during_fetch = []
+        api = FakeCatalogueAPI(['Old', 'New'], on_fetch=lambda: readable_during_fetch.append(catalogue_mirror.mirror_sync_date()))
+        catalogue_mirror.sync_catalogue(api)
+        self.assertEqual(readable_during_fetch, [None])
+        self.assertFalse(CatalogueSyncState.objects.get().stale)
+
+    def test_write_during_sync_keeps_mirror_stale(self):
+        catalogue_mirror.sync_catalogue(FakeCatalogueAPI(['Old'], on_fetch=catalogue_mirror.mark_mirror_stale))
+        self.assertTrue(CatalogueSyncState.objects.get().stale)
+
+        catalogue_mirror.sync_catalogue(FakeCatalogueAPI(['Old', 'New']))
+        self.assertFalse(CatalogueSyncState.objects.get().stale)
+
+
+class SingleFlightDeadlineTests(SimpleTestCase):
+    """Un appel regroupé qui échoue faute de budget chez le premier appelant est refait par les autres."""
+
+    def run_concurrently(self, leader_deadline, leader_error):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(threading.current_thread().name)
+            if len(calls) == 1:
+                time.sleep(0.3)
+                raise leader_error
+            return 'ok'
+
+        def leader():
+            with request_deadline(leader_deadline):
+                try:
+                    flight.do('key', fn)
+                except Exception:
+                    pass
+
+        thread = threading.Thread(target=leader, name='leader')
+        thread.start()
+        time.sleep(0.1)
+        try:
+            return flight.do('key', fn), calls
+        except Exception as e:
+            return e, calls
+        finally:
+            thread.join()
+
+    def test_waiter_retries_when_leader_ran_out_of_budget(self):
+        result, calls = self.run_concurrently(0.35, Exception("Erreur réseau: Read timed out"))
+        self.assertEqual(result, 'ok')
+        self.assertEqual(calls, ['leader', 'MainThread'])
+
+    def test_waiter_retries_after_leader_deadline_exceeded(self):
+        result, calls = self.run_concurrently(None, DeadlineExceeded("Budget de temps de la requête épuisé"))
+        self.assertEqual(result, 'ok')
+
+    def test_waiter_shares_upstream_error(self):
+        error = Exception("Erreur réseau: Connection refused")
+        result, calls = self.run_concurrently(None, error)
+        self.assertIs(result, error)
+        self.assertEqual(calls, ['leader'])
+
+
+class SiteCapabilitiesTests(SimpleTestCase):
+    def strategies(self, first_outcome):
+        calls = []
+
+        def first():
+            calls.append('first')
+            if isinstance(first_outcome, Exception):
+                raise first_outcome
+            return first_outcome
+
+        def second():
+            calls.append('second')
+            return {'ok': True}
+
+        return calls, [('local_first', first), ('core_second', second)]
+
+    def capabilities(self):
+        return SiteCapabilities(lambda: {'functions': [{'name': 'local_first'}, {'name': 'core_second'}]})
+
+    def test_probe_runs_outside_the_lock(self):
+        seen = []
+
+        def probe():
+            # Un autre thread lit les stratégies retenues pendant l'appel réseau
+            reader = threading.Thread(target=lambda: seen.append(capabilities.preferred('op')))
+            reader.start()
+            reader.join(timeout=1)
+            return {'functions': [{'name': 'f'}]}
+
+        capabilities = SiteCapabilities(probe)
+        capabilities.remember('op', 'f')
+        self.assertEqual(capabilities.functions(), {'f'})
+        self.assertEqual(seen, ['f'])
+
+    def test_failed_probe_is_retried_after_a_short_delay(self):
+        probe = mock.Mock(side_effect=[UpstreamUnavailable('Moodle indisponible'), {'functions': [{'name': 'f'}]}])
+        capabilities = SiteCapabilities(probe, failed_probe_ttl=0.01)
+        self.assertIsNone(capabilities.functions())
+        self.assertIsNone(capabilities.functions())
+        time.sleep(0.02)
+        self.assertEqual(capabilities.functions(), {'f'})
+        self.assertEqual(probe.call_count, 2)
+
+    def test_read_falls_through_on_functional_error(self):
+        calls, strategies = self.strategies(Exception("Erreur API Moodle: fonction absente"))
+        self.assertEqual(self.capabilities().run('op', strategies), {'ok': True})
+        self.assertEqual(calls, ['first', 'second'])
+
+    def test_transport_error_is_raised_without_trying_next_strategy(self):
+        try:
+            raise requests.exceptions.ReadTimeout('Read timed out')
+        except requests.exceptions.RequestException as e:
+            try:
+                raise Exception(f"Erreur réseau: {e}")
+            except Exception as wrapped:
+                error = wrapped
+        capabilities = self.capabilities()
+        capabilities.remember('op', 'local_first')
+        calls, strategies = self.strategies(error)
+        with self.assertRaises(Exception):
+            capabilities.run('op', strategies)
+        self.assertEqual(calls, ['first'])
+        self.assertEqual(capabilities.preferred('op'), 'local_first')
+
+    def test_write_is_not_retried_with_another_strategy(self):
+        calls, strategies = self.strategies({'exception': 'moodle_exception', 'errorcode': 'generalexceptionmessage',
+                                             'message': 'Erreur'})
+        with self.assertRaises(Exception):
+            self.capabilities().run('op', strategies, is_valid=lambda r: 'exception' not in r, write=True)
+        self.assertEqual(calls, ['first'])
+
+    def test_write_falls_through_when_function_unavailable(self):
+        calls, strategies = self.strategies({'exception': 'webservice_access_exception', 'errorcode': 'accessexception',
+                                             'message': 'Access control exception'})
+        result = self.capabilities().run('op', strategies, is_valid=lambda r: 'exception' not in r, write=True)
+        self.assertEqual(result, {'ok': True})
+        self.assertEqual(calls, ['first', 'second'])
+
+
+class PaginateTests(SimpleTestCase):
+    """Pagination par curseur des API JSON (views._paginate)."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Noms en double : l'ID départage les éléments, la clé de tri reste unique
+        self.items = [{'id': i, 'name': name} for i, name in enumerate(['b', 'a', 'c', 'a', 'b'], start=1)]
+        self.sort_key = lambda item: (item['name'], item['id'])
+
+    def _pages(self, items, limit):
+        pages, cursor = [], None
+        while True:
+            params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+            page, total, cursor = views._paginate(self.factory.get('/', params), items, self.sort_key)
+            pages.append([item['id'] for item in page])
+            if cursor is None:
+                return pages, total
+
+    def test_cursor_round_trip_covers_every_item_once(self):
+        pages, total = self._pages(self.items, limit=2)
+        self.assertEqual(pages, [[2, 4], [1, 5], [3]])
+        self.assertEqual(total, 5)
+
+    def test_last_full_page_has_no_next_cursor(self):
+        pages, _ = self._pages(self.items[:4], limit=2)
+        self.assertEqual(pages, [[2, 4], [1, 3]])
+
+    def test_cursor_survives_insertion_before_it(self):
+        _, _, cursor = views._paginate(self.factory.get('/', {'limit': 2}), self.items, self.sort_key)
+        items = self.items + [{'id': 6, 'name': 'a'}]
+        page, _, _ = views._paginate(self.factory.get('/', {'limit': 2, 'cursor': cursor}), items, self.sort_key)
+        self.assertEqual([item['id'] for item in page], [6, 1])
+
+    def test_invalid_cursor_or_limit(self):
+        for params in ({'cursor': 'pas-un-curseur'}, {'limit': 'dix'}, {'cursor': views._encode_cursor(['a'])[:-2]}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                views._paginate(self.factory.get('/', params), self.items, self.sort_key)
+
+
+@override_settings(MOODLE_URL='http://moodle.invalid/webservice/rest/server.php', MOODLE_TOKEN='token')
+class ConditionalJsonTests(SimpleTestCase):
+    """ETag / If-None-Match des API du catalogue, y compris derrière GZipMiddleware (ETag faible)."""
+
+    def setUp(self):
+        categories = [{'id': i, 'name': f'Catégorie {i}', 'parent': 0, 'sortorder': i} for i in range(1, 40)]
+        self.children = mock.Mock(return_value=categories)
+        tree = mock.Mock(version=7)
+        for target, value in (('get_moodle_api', mock.Mock()), ('get_catalogue_tree', mock.Mock(return_value=tree)),
+                              ('get_catalogue_children', self.children)):
+            patcher = mock.patch.object(views, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tree = tree
+
+    def _get(self, **headers):
+        return self.client.get('/api/categories/', {'parent': 0}, headers=headers)
+
+    def test_gzipped_response_is_revalidated_with_its_weak_etag(self):
+        response = self._get(accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+        revalidated = self._get(accept_encoding='gzip', if_none_match=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.children.call_count, 1)  # 304 sans recalculer la vue
+
+    def test_plain_response_is_revalidated_with_its_etag(self):
+        response = self._get()
+        self.assertNotIn('Content-Encoding', response)
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertEqual(self._get(if_none_match=response['ETag']).status_code, 304)
+
+    def test_catalogue_change_invalidates_etag(self):
+        etag = self._get(accept_encoding='gzip')['ETag']
+        self.tree.version = 8
+        response = self._get(accept_encoding='gzip', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
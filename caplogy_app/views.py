@@ -1,16 +1,27 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+import asyncio
+import base64
+import bisect
+import contextvars
+import hashlib
 import json
-import os
 import time
 import requests
 
 from django.contrib.auth import login as dj_login, logout as dj_logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from .services.user_service import UserService
-from .services.moodle_api import MoodleAPI
-from .services.nextcloud_api import NextcloudAPI
+from .services.catalogue_mirror import get_catalogue_children, get_catalogue_tree, get_course_index
+from .services.clients import get_async_moodle_api, get_moodle_api, get_nextcloud_api
+from .services.degraded import UpstreamUnavailable
+from .services.moodle_api import annotate_category_courses
 
 us = UserService()
 
@@ -39,65 +50,17 @@ def home_view(request):
     # Si l'utilisateur n'a aucun accès, afficher une page d'accueil vide/minimale
     if hasattr(request.user, 'userprofile') and request.user.userprofile.role == 'none':
         return render(request, 'caplogy_app/home_none.html')
-    api = MoodleAPI(
-        url=os.getenv('MOODLE_URL'),
-        token=os.getenv('MOODLE_TOKEN')
-    )
     return render(request, 'caplogy_app/home.html')
 
 @login_required
 def category_view(request):
     try:
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
-        categories = api.get_all_categories()
+        api = get_moodle_api()
+        tree = get_catalogue_tree(api)
         
-        # Créer un dictionnaire pour faire le mapping parent-enfant plus facilement
-        categories_dict = {cat['id']: cat for cat in categories}
-        
-        # Fonction récursive pour compter les cours dans une catégorie et ses sous-catégories
-        def count_total_courses(category_id, visited=None):
-            if visited is None:
-                visited = set()
-            
-            # Éviter les cycles infinis
-            if category_id in visited:
-                return 0
-            visited.add(category_id)
-            
-            category = categories_dict.get(category_id)
-            if not category:
-                return 0
-            
-            # Commencer par les cours de cette catégorie
-            total_courses = category.get('coursecount', 0)
-            
-            # Ajouter les cours de toutes les sous-catégories
-            for cat in categories:
-                if cat.get('parent') == category_id:
-                    total_courses += count_total_courses(cat['id'], visited.copy())
-            
-            return total_courses
-        
-        # Enrichir les données de l'API avec nos champs personnalisés
-        for category in categories:
-            # Calculer le total des cours (catégorie + sous-catégories)
-            total_courses = count_total_courses(category['id'])
-            
-            # Mettre à jour le coursecount avec le total récursif
-            category['coursecount'] = total_courses
-            
-            # Ajouter le champ has_courses basé sur le total (au lieu de coursecount direct)
-            category['has_courses'] = total_courses > 0
-            
-            # Vérifier s'il y a vraiment des sous-catégories
-            has_subcategories = any(cat.get('parent') == category['id'] for cat in categories)
-            category['has_subcategories'] = has_subcategories
-        
-        # Filtrer pour ne retourner que les catégories de niveau racine
-        root_categories = [cat for cat in categories if cat.get('parent', 0) == 0]
+        # Ne retourner que les catégories de niveau racine, enrichies de nos champs personnalisés
+        # (coursecount récursif, has_courses, has_subcategories)
+        root_categories = [tree.annotated(cat) for cat in tree.roots() if cat.get('parent', 0) == 0]
         
         # Appliquer le filtre de cours si spécifié
         course_filter = request.GET.get('filter_courses')
@@ -108,131 +71,25 @@ def category_view(request):
         # Si course_filter est 'all' ou None, on garde toutes les catégories
                 
     except Exception as e:
-        # En cas d'erreur de connexion, utiliser des données de test
-        categories = [
-            {
-                'id': 1,
-                'name': 'Mathématiques',
-                'description': 'Cours de mathématiques pour tous niveaux',
-                'coursecount': 5,
-                'has_courses': True,
-                'has_subcategories': True
-            },
-            {
-                'id': 2,
-                'name': 'Sciences',
-                'description': 'Cours de physique, chimie et biologie',
-                'coursecount': 8,
-                'has_courses': True,
-                'has_subcategories': True
-            },
-            {
-                'id': 3,
-                'name': 'Informatique',
-                'description': 'Programmation et technologies de l\'information',
-                'coursecount': 12,
-                'has_courses': True,
-                'has_subcategories': True
-            },
-            {
-                'id': 4,
-                'name': 'Langues',
-                'description': 'Cours de langues étrangères',
-                'coursecount': 6,
-                'has_courses': True,
-                'has_subcategories': True
-            },
-            {
-                'id': 5,
-                'name': 'Arts',
-                'description': 'Catégorie en préparation',
-                'coursecount': 0,
-                'has_courses': False,
-                'has_subcategories': False
-            }
-        ]
-        messages.warning(request, "Connexion à Moodle indisponible. Affichage des données de test.")
-        root_categories = [cat for cat in categories if cat.get('parent', 0) == 0]
+        # Moodle indisponible et aucune donnée connue (cache ou miroir) à afficher
+        root_categories = []
+        messages.error(request, f"Erreur de connexion à Moodle: {str(e)}")
     return render(request, 'caplogy_app/category.html', {'categories': root_categories})
 
 @login_required
 def subcategory_view(request, category_id):
     try:
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
+        api = get_moodle_api()
         
-        # Récupérer toutes les catégories pour avoir une vue complète de la hiérarchie
-        all_categories = api.get_all_categories()
-        categories_dict = {cat['id']: cat for cat in all_categories}
+        # Arborescence complète indexée : enfants, chemins et comptages récursifs précalculés
+        tree = get_catalogue_tree(api)
         
-        # Fonction récursive pour compter les cours dans une catégorie et ses sous-catégories
-        def count_total_courses(category_id, visited=None):
-            if visited is None:
-                visited = set()
-            
-            # Éviter les cycles infinis
-            if category_id in visited:
-                return 0
-            visited.add(category_id)
-            
-            category = categories_dict.get(category_id)
-            if not category:
-                return 0
-            
-            # Commencer par les cours de cette catégorie
-            total_courses = category.get('coursecount', 0)
-            
-            # Ajouter les cours de toutes les sous-catégories
-            for cat in all_categories:
-                if cat.get('parent') == category_id:
-                    total_courses += count_total_courses(cat['id'], visited.copy())
-            
-            return total_courses
-        
-        # Récupérer les sous-catégories directes
-        subcategories = api.get_subcategories(category_id)
-        
-        # Enrichir chaque sous-catégorie avec le comptage récursif
-        for subcategory in subcategories:
-            # Calculer le total des cours (sous-catégorie + ses sous-sous-catégories)
-            total_courses = count_total_courses(subcategory['id'])
-            
-            # Mettre à jour le coursecount avec le total récursif
-            subcategory['coursecount'] = total_courses
-            
-            # Ajouter le champ has_courses basé sur le total
-            subcategory['has_courses'] = total_courses > 0
-            
-            # Vérifier s'il y a vraiment des sous-sous-catégories
-            has_subcategories = any(cat.get('parent') == subcategory['id'] for cat in all_categories)
-            subcategory['has_subcategories'] = has_subcategories
+        # Sous-catégories directes, enrichies avec le comptage récursif et la présence de sous-sous-catégories
+        subcategories = [tree.annotated(subcategory) for subcategory in tree.children(int(category_id))]
         
         # Récupérer le nom de la catégorie parent et construire le chemin
-        parent_name = "Catégorie"
-        breadcrumb_path = []
-        
-        # Fonction pour trouver une catégorie par ID dans toutes les catégories
-        def find_category_by_id(cat_id):
-            return categories_dict.get(cat_id)
-        
-        # Trouver la catégorie parent
-        parent_category = find_category_by_id(int(category_id))
-        if parent_category:
-            parent_name = parent_category.get('name', 'Catégorie')
-            
-            # Construire le chemin de navigation (breadcrumb) en remontant la hiérarchie
-            def build_breadcrumb(cat_id, path=[]):
-                category = find_category_by_id(cat_id)
-                if category:
-                    path.insert(0, {'name': category.get('name', 'Catégorie'), 'id': cat_id})
-                    parent_id = category.get('parent')
-                    if parent_id and parent_id != 0:
-                        build_breadcrumb(parent_id, path)
-                return path
-            
-            breadcrumb_path = build_breadcrumb(int(category_id))
+        parent_name = tree.name(int(category_id), "Catégorie")
+        breadcrumb_path = tree.breadcrumb(int(category_id))
                 
     except Exception as e:
         # En cas d'erreur de connexion à l'API Moodle
@@ -249,103 +106,36 @@ def subcategory_view(request, category_id):
     })
 
 @login_required
-def category_courses_view(request, category_id):
+async def category_courses_view(request, category_id):
     """Vue pour afficher les cours d'une catégorie spécifique et de ses sous-catégories"""
+    api = get_async_moodle_api()
     try:
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
+        # Arborescence (breadcrumb, sous-catégories) et cours de la catégorie et de ses sous-catégories,
+        # récupérés en parallèle ; le miroir du catalogue passe par l'ORM, exécuté hors de la boucle
+        tree, courses = await asyncio.gather(
+            sync_to_async(get_catalogue_tree)(api.api),
+            api.get_courses_in_category_tree(int(category_id)),
+            return_exceptions=True,
         )
+        if isinstance(tree, Exception):
+            raise tree
+        if isinstance(courses, Exception):
+            # Moodle indisponible : cours de l'index (dernières données connues ou miroir local)
+            print(f"Cours de la catégorie {category_id} lus depuis l'index: {courses}")
+            target_ids = tree.subtree_ids(int(category_id)) or [int(category_id)]
+            target_set = set(target_ids)
+            index = await sync_to_async(get_course_index)(api.api)
+            courses = annotate_category_courses(
+                tree, target_ids, [entry['course'] for entry in index.entries.values() if entry['categoryid'] in target_set]
+            )
         
-        # Récupérer toutes les catégories pour identifier les sous-catégories
-        all_categories = api.get_all_categories()
-        categories_dict = {cat['id']: cat for cat in all_categories}
-        
-        # Fonction récursive pour collecter tous les IDs de catégories (catégorie + sous-catégories)
-        def get_all_category_ids(category_id, visited=None):
-            if visited is None:
-                visited = set()
-            
-            # Éviter les cycles infinis
-            if category_id in visited:
-                return []
-            visited.add(category_id)
-            
-            category_ids = [category_id]
-            
-            # Ajouter toutes les sous-catégories
-            for cat in all_categories:
-                if cat.get('parent') == category_id:
-                    category_ids.extend(get_all_category_ids(cat['id'], visited.copy()))
-            
-            return category_ids
-        
-        # Obtenir tous les IDs de catégories (principale + sous-catégories)
-        target_category_ids = get_all_category_ids(int(category_id))
-        
-        # Récupérer les cours de toutes ces catégories
-        all_courses = []
-        for cat_id in target_category_ids:
-            try:
-                category_courses = api.get_courses_by_category(cat_id)
-                if category_courses:
-                    # Ajouter l'information de la catégorie source à chaque cours
-                    for course in category_courses:
-                        course['source_category_id'] = cat_id
-                        if cat_id in categories_dict:
-                            course['source_category_name'] = categories_dict[cat_id].get('name', f'Catégorie {cat_id}')
-                        else:
-                            course['source_category_name'] = f'Catégorie {cat_id}'
-                    all_courses.extend(category_courses)
-            except Exception as course_error:
-                print(f"Erreur lors de la récupération des cours de la catégorie {cat_id}: {course_error}")
-                continue
-        
-        courses = all_courses
-        
-        # Récupérer les informations de la catégorie et construire le breadcrumb
-        breadcrumb_path = []
-        try:
-            all_categories = api.get_all_categories()
-            
-            # Fonction pour trouver une catégorie par ID dans toutes les catégories
-            def find_category_by_id(cat_id):
-                for cat in all_categories:
-                    if cat.get('id') == cat_id:
-                        return cat
-                return None
-            
-            # Trouver la catégorie actuelle
-            current_category = find_category_by_id(int(category_id))
-            if current_category:
-                category_name = current_category.get('name', 'Catégorie')
-                
-                # Construire le chemin de navigation (breadcrumb) en remontant la hiérarchie
-                def build_breadcrumb(cat_id, path=[]):
-                    category = find_category_by_id(cat_id)
-                    if category:
-                        path.insert(0, {'name': category.get('name', 'Catégorie'), 'id': cat_id})
-                        parent_id = category.get('parent')
-                        if parent_id and parent_id != 0:
-                            build_breadcrumb(parent_id, path)
-                    return path
-                
-                breadcrumb_path = build_breadcrumb(int(category_id))
-            else:
-                category_name = f'Catégorie {category_id}'
-                
-        except Exception as cat_error:
-            print(f"Erreur lors de la récupération du nom de catégorie: {cat_error}")
-            # Utiliser des noms de catégories par défaut basés sur l'ID
-            category_names = {
-                1: 'Mathématiques',
-                2: 'Sciences', 
-                3: 'Informatique',
-                4: 'Langues',
-                5: 'Arts'
-            }
-            category_name = category_names.get(int(category_id), f'Catégorie {category_id}')
-            breadcrumb_path = [{'name': category_name, 'id': int(category_id)}]
+        # Nom de la catégorie et chemin de navigation (breadcrumb)
+        if int(category_id) in tree:
+            category_name = tree.name(int(category_id), 'Catégorie')
+            breadcrumb_path = tree.breadcrumb(int(category_id))
+        else:
+            category_name = f'Catégorie {category_id}'
+            breadcrumb_path = []
         
         if not courses:
             messages.warning(request, "Aucun cours trouvé dans cette catégorie.")
@@ -354,8 +144,10 @@ def category_courses_view(request, category_id):
         print(f"Erreur dans category_courses_view: {e}")
         messages.error(request, f"Erreur de connexion à Moodle: {str(e)}")
         courses = []
+        category_name = f'Catégorie {category_id}'
+        breadcrumb_path = []
     
-    return render(request, 'caplogy_app/category_courses.html', {
+    return await sync_to_async(render)(request, 'caplogy_app/category_courses.html', {
         'courses': courses,
         'category_name': category_name,
         'category_id': category_id,
@@ -432,10 +224,7 @@ def add_category_view(request):
 
             parent_id = data.get('parent_id', 0)
 
-            api = MoodleAPI(
-                url=os.getenv('MOODLE_URL'),
-                token=os.getenv('MOODLE_TOKEN')
-            )
+            api = get_moodle_api()
             new_id = api.create_category(name, parent_id)
             if new_id:
                 return JsonResponse({'success': True, 'id': new_id})
@@ -457,10 +246,7 @@ def delete_category_view(request):
         try:
             if not category_id:
                 return JsonResponse({'success': False, 'error': 'Le paramètre category_id est obligatoire'})
-            api = MoodleAPI(
-                url=os.getenv('MOODLE_URL'),
-                token=os.getenv('MOODLE_TOKEN')
-            )
+            api = get_moodle_api()
             api.delete_category(category_id)
             return JsonResponse({'success': True})
         except Exception as e:
@@ -489,44 +275,19 @@ def promote_to_admin(request):
 
 def courses(request):
     try:
-        api = MoodleAPI(
-                url=os.getenv('MOODLE_URL'),
-                token=os.getenv('MOODLE_TOKEN')
-            )
+        api = get_moodle_api()
         
         selected_school = request.GET.get('school') or None
 
-        raw = api.get_courses()
-        raw = [c for c in raw if c.get('id') != 1]
+        tree = get_catalogue_tree(api)
+        index = get_course_index(api)
 
-        all_cats = api.get_all_categories()
-        cat_map = {c['id']: c for c in all_cats}
-        
-        def find_root(cat_id):
-            if not cat_id or cat_id not in cat_map:
-                return cat_id
-            parent = cat_map.get(cat_id, {}).get('parent')
-            return cat_id if not parent or parent == 0 else find_root(parent)
-
-        enriched = []
-        for c in raw:
-            try:
-                cat_id = c.get('categoryid')
-                if not cat_id:
-                    continue
-                    
-                rid = find_root(cat_id)
-                c['root_id'] = rid
-                c['schoolname'] = cat_map.get(rid, {}).get('name', '—')
-                enriched.append(c)
-            except Exception as e:
-                print(f"Erreur lors du traitement du cours {c.get('id', 'inconnu')}: {e}")
-                continue
-
-        if selected_school:
-            enriched = [c for c in enriched if str(c.get('root_id', '')) == selected_school]
+        enriched = [
+            {**entry['course'], 'root_id': entry['school_id'], 'schoolname': entry['schoolname'] or '—'}
+            for entry in index.filter(school=selected_school)
+        ]
 
-        schools = [c for c in all_cats if c.get('parent') == 0]
+        schools = [c for c in tree.roots() if c.get('parent') == 0]
 
         return render(request, 'caplogy_app/courses.html', {
             'courses': enriched,
@@ -542,79 +303,341 @@ def courses(request):
             'selected_school': '',
         })
 
+# Pagination des API JSON : ?limit=N&cursor=...&fields=a,b
+MAX_PAGE_SIZE = 500
+
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode()).decode()))
+    except Exception:
+        raise ValueError("Paramètre cursor invalide")
+
+
+def _paginate(request, items, sort_key):
+    """
+    Trie items selon sort_key (ordre stable, la clé doit être unique) et retourne la page demandée.
+    Le curseur est la clé du dernier élément de la page précédente : une page n'est pas décalée
+    par un ajout ou une suppression survenu avant elle. Sans `limit`, tous les éléments sont retournés.
+
+    Returns:
+        (page, total, next_cursor) ; lève ValueError si limit ou cursor est invalide.
+    """
+    items = sorted(items, key=sort_key)
+    total = len(items)
+
+    start = 0
+    cursor = request.GET.get('cursor')
+    if cursor:
+        keys = [sort_key(item) for item in items]
+        try:
+            start = bisect.bisect_right(keys, _decode_cursor(cursor))
+        except TypeError:
+            raise ValueError("Paramètre cursor invalide")
+
+    limit = request.GET.get('limit')
+    if not limit:
+        return items[start:], total, None
+    try:
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("Paramètre limit invalide")
+
+    page = items[start:start + limit]
+    next_cursor = _encode_cursor(sort_key(page[-1])) if page and start + limit < total else None
+    return page, total, next_cursor
+
+
+def _project(request, items):
+    """Ne garde que les champs demandés par ?fields=a,b (tous les champs si absent ou sans champ connu)."""
+    fields = [f.strip() for f in request.GET.get('fields', '').split(',') if f.strip()]
+    if not items or not fields:
+        return items
+    known = [f for f in fields if f in items[0]]
+    if not known:
+        return items
+    return [{f: item[f] for f in known} for item in items]
+
+
+# Requêtes conditionnelles des API JSON (ETag / If-None-Match)
+def _make_etag(*parts):
+    return '"%s"' % hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _etag_matches(request, etag):
+    """Comparaison faible : GZipMiddleware transforme l'ETag d'une réponse compressée en W/"..."."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    return '*' in candidates or etag in [c.removeprefix('W/') for c in candidates]
+
+
+def _not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _with_etag(response, etag):
+    response['ETag'] = etag
+    # Le navigateur garde la réponse mais la revalide à chaque appel (If-None-Match)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _conditional_json(version_func):
+    """
+    Décorateur des API JSON du catalogue : l'ETag est dérivé de la version du catalogue et de l'URL,
+    un If-None-Match correspondant reçoit un 304 sans que la vue (et son JSON) ne soit calculée.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                etag = _make_etag(version_func(request), request.get_full_path())
+            except Exception:
+                return view(request, *args, **kwargs)  # Version indisponible : la vue gère l'erreur
+            if request.method in ('GET', 'HEAD') and _etag_matches(request, etag):
+                return _not_modified(etag)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                _with_etag(response, etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def _json_response(request, payload):
+    """JsonResponse avec un ETag calculé sur son contenu (304 si le client détient déjà ce contenu)."""
+    response = JsonResponse(payload)
+    etag = _make_etag(response.content)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    return _with_etag(response, etag)
+
+
+@_conditional_json(lambda request: get_course_index(get_moodle_api()).version)
 def courses_api(request):
     try:
-        api = MoodleAPI(
-                url=os.getenv('MOODLE_URL'),
-                token=os.getenv('MOODLE_TOKEN')
-            )
+        api = get_moodle_api()
         
         school    = request.GET.get('school')
         year      = request.GET.get('year')
         formation = request.GET.get('formation')
-        raw = [c for c in api.get_courses() if c.get('id') != 1]
-        all_cats = api.get_all_categories()
-        cat_map = {c['id']: c for c in all_cats}
-
-        def find_root(cid):
-            if cid not in cat_map:
-                return cid  # Retourner l'ID original si non trouvé
-            parent = cat_map[cid].get('parent', 0)
-            return cid if parent == 0 else find_root(parent)
-
-        def find_year(cid, root):
-            if cid not in cat_map:
-                return cid  # Retourner l'ID original si non trouvé
-            parent = cat_map[cid].get('parent', 0)
-            return cid if parent == root else find_year(parent, root)
-
-        def find_formation(cid, year_id):
-            if cid not in cat_map:
-                return cid  # Retourner l'ID original si non trouvé
-            parent = cat_map[cid].get('parent', 0)
-            return cid if parent == year_id else find_formation(parent, year_id)
-
-        data = []
-        for c in raw:
-            try:
-                cid          = c.get('categoryid')
-                if not cid:
-                    continue  # Ignorer les cours sans catégorie
-                    
-                root_id      = find_root(cid)
-                year_id      = find_year(cid, root_id)
-                formation_id = find_formation(cid, year_id)
-                
-                if school and str(root_id) != school:
-                    continue
-                if year and str(year_id) != year:
-                    continue
-                if formation and str(formation_id) != formation:
-                    continue
-                    
-                data.append({
-                    'id':            c['id'],
-                    'fullname':      c['fullname'],
-                    'schoolname':    cat_map.get(root_id, {}).get('name', 'Catégorie inconnue'),
-                    'yearname':      cat_map.get(year_id, {}).get('name', 'Année inconnue'),
-                    'formationname': cat_map.get(formation_id, {}).get('name', 'Formation inconnue'),
-                })
-            except Exception as e:
-                # Ignorer les cours qui causent des erreurs
-                print(f"Erreur lors du traitement du cours {c.get('id', 'inconnu')}: {e}")
-                continue
+
+        # Index précalculé (école / année / formation) : le filtre est une intersection d'ensembles
+        index = get_course_index(api)
+        try:
+            # Tri stable : nom du cours puis ID
+            entries, total, next_cursor = _paginate(
+                request, index.filter(school=school, year=year, formation=formation),
+                sort_key=lambda entry: (entry['fullname'].casefold(), entry['id']),
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        data = [
+            {
+                'id':            entry['id'],
+                'fullname':      entry['fullname'],
+                'schoolname':    entry['schoolname'] or 'Catégorie inconnue',
+                'yearname':      entry['yearname'] or 'Année inconnue',
+                'formationname': entry['formationname'] or 'Formation inconnue',
+            }
+            for entry in entries
+        ]
                 
-        return JsonResponse({'courses': data})
+        return JsonResponse({'courses': _project(request, data), 'total': total, 'next_cursor': next_cursor})
     except Exception as e:
         print(f"Erreur dans courses_api: {e}")
         return JsonResponse({'error': f'Erreur lors de la récupération des cours: {str(e)}'}, status=500)
 
-def create_course(request, course_id=None):
+def _get_section_files(request):
+    """Récupère les fichiers/URLs associés aux sections (clés file_<n>, n = ordre dans l'interface)"""
+    files_data = {}
+    for key, value in request.POST.items():
+        if key.startswith('file_') and value.strip():
+            section_num = key.replace('file_', '')
+            files_data[section_num] = value.strip()
+    return files_data
+
+def _section_resource(api, course_id, section_num, section_title, file_path, batch=None):
+    """
+    Prépare la ressource d'une section (URL externe ou lien de partage d'un fichier Nextcloud) et l'ajoute
+    au cours ; sans lot, l'appel add_url est fait ici. Retourne les arguments d'add_url.
+    """
+    print(f"DEBUG - Processing file: {file_path} for section {section_num} (title: {section_title})")
+    # Déterminer si c'est un fichier Nextcloud ou une URL externe
+    if file_path.startswith('http'):
+        # C'est une URL externe
+        print(f"DEBUG - Adding URL: {file_path}")
+        args = (course_id, section_num, f"Lien - {section_title}", file_path, f"Ressource pour {section_title}")
+    else:
+        # C'est un fichier Nextcloud - générer l'URL de partage
+        print(f"DEBUG - Processing Nextcloud file: {file_path}")
+        share_url = get_nextcloud_api().get_share_url(file_path)
+        if not share_url:
+            raise Exception(f"Impossible de créer le lien de partage Nextcloud pour {file_path}")
+        print(f"DEBUG - Adding Nextcloud URL: {share_url}")
+        args = (course_id, section_num, f"Fichier - {section_title}", share_url, f"Fichier Nextcloud pour {section_title}")
+    if batch is None:
+        api.add_url(*args)
+    return args
+
+def _attach_section_resources(api, course_id, sections, section_nums, files_data, batch=None):
+    """
+    Ajoute aux sections créées les URLs externes ou les liens de partage des fichiers Nextcloud.
+    
+    Les sections sont traitées en parallèle (au plus SECTION_RESOURCE_CONCURRENCY à la fois) : création
+    des liens de partage Nextcloud et, sans lot, appels add_url. Avec un lot, les appels add_url y sont
+    mis en file dans l'ordre des sections.
+    
+    Returns:
+        Une entrée par section ayant une ressource, dans l'ordre des sections :
+        {'section': titre, 'section_num': numéro Moodle, 'file': chemin ou URL,
+         'call': BatchCall de add_url (avec un lot) ou None, 'error': exception ou None}
+    """
+    if not files_data or not section_nums:
+        return []
+    print(f"DEBUG - Processing URLs for sections")
+    resources = []
+    # Itérer sur les sections dans l'ordre de création (interface utilisateur)
+    for i, section_num in enumerate(section_nums):
+        # Les clés de fichiers correspondent à l'ordre dans l'interface (1-based)
+        file_key = str(i + 1)
+        if file_key in files_data:
+            section_title = sections[i] if i < len(sections) else f"Section {i+1}"
+            resources.append({'section': section_title, 'file': files_data[file_key], 'section_num': section_num, 'call': None, 'error': None})
+    if not resources:
+        return []
+    
+    workers = max(1, min(settings.SECTION_RESOURCE_CONCURRENCY, len(resources)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Chaque tâche s'exécute dans une copie du contexte : mémo, budget et suivi des données périmées de la requête
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run, _section_resource,
+                api, course_id, resource['section_num'], resource['section'], resource['file'], batch,
+            )
+            for resource in resources
+        ]
+        for resource, future in zip(resources, futures):
+            try:
+                args = future.result()
+                if batch is not None:
+                    resource['call'] = api.add_url(*args, batch=batch)
+            except Exception as e:
+                print(f"Erreur lors de l'ajout de la ressource {resource['file']}: {e}")
+                resource['error'] = e
+    return resources
+
+def _report_enrolment(request, call, warning_prefix):
+    """Signale à l'utilisateur l'échec d'un enrôlement exécuté dans un lot."""
+    if call is not None and call.error is not None:
+        print(f"[ERROR] {warning_prefix}: {call.error}")
+        messages.warning(request, f"{warning_prefix}: {call.error}")
+
+def _report_section_resources(request, resources, warning_prefix):
+    """Signale à l'utilisateur, section par section, les ressources qui n'ont pas pu être ajoutées."""
+    for resource in resources:
+        error = resource['error'] or (resource['call'].error if resource['call'] is not None else None)
+        if error is not None:
+            messages.warning(request, f"{warning_prefix} « {resource['section']} » ({resource['file']}): {error}")
+
+async def create_course(request, course_id=None):
     """Vue pour créer ou éditer un cours"""
-    api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
+    if request.method == 'POST' or course_id is None:
+        return await sync_to_async(_create_or_update_course)(request, course_id)
+    return await _edit_course_form(request, course_id)
+
+async def _edit_course_form(request, course_id):
+    """Formulaire d'édition : cours, sections, catégories, profs LDAP et arborescence sont récupérés en parallèle."""
+    api = get_async_moodle_api()
+    course_data, sections, top_cats, profs, tree = await asyncio.gather(
+        api.find_course(course_id),
+        api.get_course_sections(course_id),
+        api.get_categories(0),
+        asyncio.to_thread(lambda: UserService().get_ldap_profs()),
+        api.get_category_tree(),
+        return_exceptions=True,
+    )
+    
+    if isinstance(course_data, Exception):
+        messages.error(request, f"Erreur lors de la récupération du cours: {str(course_data)}")
+        return redirect('courses')
+    if not course_data:
+        messages.error(request, "Cours introuvable")
+        return redirect('courses')
+    # Si on ne peut pas récupérer les sections, continuer sans elles (copie : le cours peut venir du cache)
+    course_data = {**course_data, 'sections': [] if isinstance(sections, Exception) else sections}
+    
+    if isinstance(top_cats, Exception):
+        print(f"Erreur lors de la récupération des catégories: {top_cats}")
+        messages.error(request, f"Erreur de connexion à Moodle: {str(top_cats)}")
+        top_cats = []
+    if isinstance(profs, Exception):
+        profs = []
+    
+    preselection_data = None
+    if course_data.get('categoryid'):
+        if isinstance(tree, Exception):
+            print(f"Erreur lors de la construction du chemin: {tree}")
+        else:
+            preselection_data = _build_preselection(tree, course_data['categoryid'])
+    
+    context = {
+        'categories': top_cats,
+        'is_edit': True,
+        'course': course_data,
+        'preselection_data': json.dumps(preselection_data) if preselection_data else None,
+        'profs': profs
+    }
+    return await sync_to_async(render)(request, 'caplogy_app/create_course.html', context)
+
+def _build_preselection(tree, category_id):
+    """Chemin école → année → formation du cours et options des selects, pour la présélection rapide."""
+    print(f"Mode édition: construction du chemin pour categoryid={category_id}")
+    if category_id not in tree:
+        return None
+    
+    # Chemin école → année → formation
+    category_path = [
+        {'id': cat['id'], 'name': cat.get('name', ''), 'parent': cat.get('parent', 0)}
+        for cat in tree.ancestors(category_id)
+    ]
+    print(f"Chemin trouvé: {[cat['name'] + ' (ID: ' + str(cat['id']) + ')' for cat in category_path]}")
+    
+    # Construire les données de présélection
+    preselection_data = {
+        'target_category_id': category_id,
+        'path': category_path
+    }
+    
+    # Ajouter les catégories nécessaires pour peupler les selects
+    if len(category_path) >= 1:
+        # École sélectionnée - récupérer toutes les années
+        school_id = category_path[0]['id']
+        preselection_data['years'] = tree.children(school_id)
+        
+        if len(category_path) >= 2:
+            # Année sélectionnée - récupérer toutes les formations
+            year_id = category_path[1]['id']
+            preselection_data['formations'] = tree.children(year_id)
+    
+    print(f"École: {category_path[0]['name'] if category_path else 'N/A'}")
+    print(f"Année: {category_path[1]['name'] if len(category_path) > 1 else 'N/A'}")
+    print(f"Formation: {category_path[2]['name'] if len(category_path) > 2 else 'N/A'}")
+    return preselection_data
+
+def _create_or_update_course(request, course_id=None):
+    """Création (formulaire et envoi) et enregistrement des modifications d'un cours."""
+    api = get_moodle_api()
     
     # Déterminer si on est en mode édition
     is_edit = course_id is not None
@@ -663,181 +686,106 @@ def create_course(request, course_id=None):
                 # Mettre à jour le cours existant
                 api.update_course(course_id, title, cat_id)
                 
-                # Affecter les profs sélectionnés au cours (ajouter aux professeurs existants)
-                if selected_profs:
-                    print(f"[DEBUG] Ajout des professeurs au cours {course_id}: {selected_profs}")
-                    try:
-                        result = api.assign_teachers_to_course(course_id, selected_profs)
-                        if result is not None:
-                            print(f"[DEBUG] Professeurs ajoutés avec succès: {selected_profs}")
-                        else:
-                            print(f"[WARNING] Aucun professeur n'a pu être affecté")
-                    except Exception as prof_error:
-                        print(f"[ERROR] Erreur lors de l'ajout des professeurs: {prof_error}")
-                        messages.warning(request, f"Cours modifié mais erreur lors de l'ajout des professeurs: {prof_error}")
-                
-                # Affecter les assistants/coordinateurs sélectionnés au cours (rôle ID 2)
-                if selected_assistants:
-                    print(f"[DEBUG] Ajout des assistants/coordinateurs au cours {course_id}: {selected_assistants}")
-                    try:
-                        result = api.assign_users_to_course_with_role(course_id, selected_assistants, role_id=2)
-                        if result is not None:
-                            print(f"[DEBUG] Assistants/coordinateurs ajoutés avec succès: {selected_assistants}")
-                        else:
-                            print(f"[WARNING] Aucun assistant/coordinateur n'a pu être affecté")
-                    except Exception as assistant_error:
-                        print(f"[ERROR] Erreur lors de l'ajout des assistants/coordinateurs: {assistant_error}")
-                        messages.warning(request, f"Cours modifié mais erreur lors de l'ajout des assistants/coordinateurs: {assistant_error}")
-                
-                # Note: Les professeurs et assistants existants ne sont plus supprimés automatiquement
-                # Ils doivent être supprimés individuellement via l'interface
-                
-                # Récupérer et traiter les sections pour l'édition
-                sections = [v for k,v in request.POST.items() if k.startswith('section_')]
-                
-                # Récupérer les fichiers/URLs associés aux sections
-                files_data = {}
-                for key, value in request.POST.items():
-                    if key.startswith('file_') and value.strip():
-                        section_num = key.replace('file_', '')
-                        files_data[section_num] = value.strip()
-                
-                # Debug logging
-                print(f"DEBUG - POST data: {dict(request.POST)}")
-                print(f"DEBUG - Sections found: {sections}")
-                print(f"DEBUG - Files data: {files_data}")
-                
-                if sections:
-                    # Utiliser la méthode update_sections pour les opérations sur les sections
-                    section_nums = api.update_sections(course_id, sections)
-                    print(f"DEBUG - Section nums created: {section_nums}")
-                    
-                    # Ajouter les URLs aux sections créées
-                    if files_data and section_nums:
-                        print(f"DEBUG - Processing URLs for sections")
-                        for i, section_num in enumerate(section_nums):
-                            file_key = str(i + 1)  # Les clés de fichiers sont basées sur l'ordre dans l'interface
-                            print(f"DEBUG - Looking for file_key: {file_key} in files_data: {files_data}")
-                            if file_key in files_data:
-                                file_path = files_data[file_key]
-                                section_title = sections[i] if i < len(sections) else f"Section {i+1}"
-                                print(f"DEBUG - Processing file: {file_path} for section {section_num} (title: {section_title})")
-                                # Déterminer si c'est un fichier Nextcloud ou une URL externe
-                                if file_path.startswith('http'):
-                                    # C'est une URL externe
-                                    try:
-                                        print(f"DEBUG - Adding URL: {file_path}")
-                                        result = api.add_url(course_id, section_num, f"Lien - {section_title}", file_path, f"Ressource pour {section_title}")
-                                        print(f"DEBUG - URL add result: {result}")
-                                    except Exception as url_error:
-                                        print(f"Erreur lors de l'ajout de l'URL {file_path}: {url_error}")
-                                else:
-                                    # C'est un fichier Nextcloud - générer l'URL de partage
-                                    try:
-                                        print(f"DEBUG - Processing Nextcloud file: {file_path}")
-                                        # Générer l'URL de partage Nextcloud
-                                        nextcloud_api = NextcloudAPI(
-                                            base_url=os.getenv('NEXTCLOUD_WEBDAV_URL'),
-                                            share_url=os.getenv('NEXTCLOUD_SHARE_URL'),
-                                            user=os.getenv('NEXTCLOUD_USER'),
-                                            password=os.getenv('NEXTCLOUD_PASSWORD')
-                                        )
-                                        share_url = nextcloud_api.get_share_url(file_path)
-                                        if share_url:
-                                            print(f"DEBUG - Adding Nextcloud URL: {share_url}")
-                                            result = api.add_url(course_id, section_num, f"Fichier - {section_title}", share_url, f"Fichier Nextcloud pour {section_title}")
-                                            print(f"DEBUG - Nextcloud URL add result: {result}")
-                                    except Exception as nc_error:
-                                        print(f"Erreur lors de la création du lien Nextcloud pour {file_path}: {nc_error}")
-                
-                messages.success(request, f"Cours '{title}' modifié avec succès")
-            else:
-                # Créer un nouveau cours
-                course_id = api.create_course(title, cat_id)
-                if course_id:
-                    # Affecter les profs sélectionnés au cours
+                # Les enrôlements et les ressources des sections sont envoyés à Moodle en une seule requête
+                with api.batch() as batch:
+                    # Affecter les profs sélectionnés au cours (ajouter aux professeurs existants)
+                    prof_call = None
                     if selected_profs:
-                        print(f"[DEBUG] Affectation des professeurs au nouveau cours {course_id}: {selected_profs}")
+                        print(f"[DEBUG] Ajout des professeurs au cours {course_id}: {selected_profs}")
                         try:
-                            result = api.assign_teachers_to_course(course_id, selected_profs)
-                            if result is not None:
-                                print(f"[DEBUG] Professeurs affectés avec succès: {selected_profs}")
-                            else:
+                            prof_call = api.assign_teachers_to_course(course_id, selected_profs, batch=batch)
+                            if prof_call is None:
                                 print(f"[WARNING] Aucun professeur n'a pu être affecté")
                         except Exception as prof_error:
-                            print(f"[ERROR] Erreur lors de l'affectation des professeurs: {prof_error}")
-                            messages.warning(request, f"Cours créé mais erreur lors de l'affectation des professeurs: {prof_error}")
+                            print(f"[ERROR] Erreur lors de l'ajout des professeurs: {prof_error}")
+                            messages.warning(request, f"Cours modifié mais erreur lors de l'ajout des professeurs: {prof_error}")
                     
                     # Affecter les assistants/coordinateurs sélectionnés au cours (rôle ID 2)
+                    assistant_call = None
                     if selected_assistants:
-                        print(f"[DEBUG] Affectation des assistants/coordinateurs au nouveau cours {course_id}: {selected_assistants}")
+                        print(f"[DEBUG] Ajout des assistants/coordinateurs au cours {course_id}: {selected_assistants}")
                         try:
-                            result = api.assign_users_to_course_with_role(course_id, selected_assistants, role_id=2)
-                            if result is not None:
-                                print(f"[DEBUG] Assistants/coordinateurs affectés avec succès: {selected_assistants}")
-                            else:
+                            assistant_call = api.assign_users_to_course_with_role(course_id, selected_assistants, role_id=2, batch=batch)
+                            if assistant_call is None:
                                 print(f"[WARNING] Aucun assistant/coordinateur n'a pu être affecté")
                         except Exception as assistant_error:
-                            print(f"[ERROR] Erreur lors de l'affectation des assistants/coordinateurs: {assistant_error}")
-                            messages.warning(request, f"Cours créé mais erreur lors de l'affectation des assistants/coordinateurs: {assistant_error}")
+                            print(f"[ERROR] Erreur lors de l'ajout des assistants/coordinateurs: {assistant_error}")
+                            messages.warning(request, f"Cours modifié mais erreur lors de l'ajout des assistants/coordinateurs: {assistant_error}")
                     
-                    sections = [v for k,v in request.POST.items() if k.startswith('section_')]
+                    # Note: Les professeurs et assistants existants ne sont plus supprimés automatiquement
+                    # Ils doivent être supprimés individuellement via l'interface
                     
-                    # Récupérer les fichiers/URLs associés aux sections
-                    files_data = {}
-                    for key, value in request.POST.items():
-                        if key.startswith('file_') and value.strip():
-                            section_num = key.replace('file_', '')
-                            files_data[section_num] = value.strip()
+                    # Récupérer et traiter les sections pour l'édition
+                    resources = []
+                    sections = [v for k,v in request.POST.items() if k.startswith('section_')]
+                    files_data = _get_section_files(request)
                     
                     # Debug logging
                     print(f"DEBUG - POST data: {dict(request.POST)}")
                     print(f"DEBUG - Sections found: {sections}")
                     print(f"DEBUG - Files data: {files_data}")
                     
-                    # Créer les sections
-                    section_nums = api.create_sections(course_id, sections)
-                    print(f"DEBUG - Section nums created: {section_nums}")
+                    if sections:
+                        # Utiliser la méthode update_sections pour les opérations sur les sections
+                        section_nums = api.update_sections(course_id, sections)
+                        print(f"DEBUG - Section nums created: {section_nums}")
+                        
+                        # Ajouter les URLs aux sections créées
+                        resources = _attach_section_resources(api, course_id, sections, section_nums, files_data, batch)
+                
+                _report_section_resources(request, resources, "Cours modifié mais ressource non ajoutée à la section")
+                _report_enrolment(request, prof_call, "Cours modifié mais erreur lors de l'ajout des professeurs")
+                _report_enrolment(request, assistant_call, "Cours modifié mais erreur lors de l'ajout des assistants/coordinateurs")
+                
+                messages.success(request, f"Cours '{title}' modifié avec succès")
+            else:
+                # Créer un nouveau cours
+                course_id = api.create_course(title, cat_id)
+                if course_id:
+                    # Les enrôlements et les ressources des sections sont envoyés à Moodle en une seule requête
+                    with api.batch() as batch:
+                        # Affecter les profs sélectionnés au cours
+                        prof_call = None
+                        if selected_profs:
+                            print(f"[DEBUG] Affectation des professeurs au nouveau cours {course_id}: {selected_profs}")
+                            try:
+                                prof_call = api.assign_teachers_to_course(course_id, selected_profs, batch=batch)
+                                if prof_call is None:
+                                    print(f"[WARNING] Aucun professeur n'a pu être affecté")
+                            except Exception as prof_error:
+                                print(f"[ERROR] Erreur lors de l'affectation des professeurs: {prof_error}")
+                                messages.warning(request, f"Cours créé mais erreur lors de l'affectation des professeurs: {prof_error}")
+                        
+                        # Affecter les assistants/coordinateurs sélectionnés au cours (rôle ID 2)
+                        assistant_call = None
+                        if selected_assistants:
+                            print(f"[DEBUG] Affectation des assistants/coordinateurs au nouveau cours {course_id}: {selected_assistants}")
+                            try:
+                                assistant_call = api.assign_users_to_course_with_role(course_id, selected_assistants, role_id=2, batch=batch)
+                                if assistant_call is None:
+                                    print(f"[WARNING] Aucun assistant/coordinateur n'a pu être affecté")
+                            except Exception as assistant_error:
+                                print(f"[ERROR] Erreur lors de l'affectation des assistants/coordinateurs: {assistant_error}")
+                                messages.warning(request, f"Cours créé mais erreur lors de l'affectation des assistants/coordinateurs: {assistant_error}")
+                        
+                        sections = [v for k,v in request.POST.items() if k.startswith('section_')]
+                        files_data = _get_section_files(request)
+                        
+                        # Debug logging
+                        print(f"DEBUG - POST data: {dict(request.POST)}")
+                        print(f"DEBUG - Sections found: {sections}")
+                        print(f"DEBUG - Files data: {files_data}")
+                        
+                        # Créer les sections
+                        section_nums = api.create_sections(course_id, sections)
+                        print(f"DEBUG - Section nums created: {section_nums}")
+                        
+                        # Ajouter les URLs aux sections créées
+                        resources = _attach_section_resources(api, course_id, sections, section_nums, files_data, batch)
                     
-                    # Ajouter les URLs aux sections créées
-                    if files_data and section_nums:
-                        print(f"DEBUG - Processing URLs for sections")
-                        # Itérer sur les sections dans l'ordre de création (interface utilisateur)
-                        for i, section_num in enumerate(section_nums):
-                            # Les clés de fichiers correspondent à l'ordre dans l'interface (1-based)
-                            file_key = str(i + 1)
-                            print(f"DEBUG - Section {i+1} (Moodle section {section_num}): looking for file_key: {file_key} in files_data: {files_data}")
-                            if file_key in files_data:
-                                file_path = files_data[file_key]
-                                section_title = sections[i] if i < len(sections) else f"Section {i+1}"
-                                print(f"DEBUG - Processing file: {file_path} for section {section_num} (title: {section_title})")
-                                # Déterminer si c'est un fichier Nextcloud ou une URL externe
-                                if file_path.startswith('http'):
-                                    # C'est une URL externe
-                                    try:
-                                        print(f"DEBUG - Adding URL: {file_path}")
-                                        result = api.add_url(course_id, section_num, f"Lien - {section_title}", file_path, f"Ressource pour {section_title}")
-                                        print(f"DEBUG - URL add result: {result}")
-                                    except Exception as url_error:
-                                        print(f"Erreur lors de l'ajout de l'URL {file_path}: {url_error}")
-                                else:
-                                    # C'est un fichier Nextcloud - générer l'URL de partage
-                                    try:
-                                        print(f"DEBUG - Processing Nextcloud file: {file_path}")
-                                        # Générer l'URL de partage Nextcloud
-                                        nextcloud_api = NextcloudAPI(
-                                            base_url=os.getenv('NEXTCLOUD_WEBDAV_URL'),
-                                            share_url=os.getenv('NEXTCLOUD_SHARE_URL'),
-                                            user=os.getenv('NEXTCLOUD_USER'),
-                                            password=os.getenv('NEXTCLOUD_PASSWORD')
-                                        )
-                                        share_url = nextcloud_api.get_share_url(file_path)
-                                        if share_url:
-                                            print(f"DEBUG - Adding Nextcloud URL: {share_url}")
-                                            result = api.add_url(course_id, section_num, f"Fichier - {section_title}", share_url, f"Fichier Nextcloud pour {section_title}")
-                                            print(f"DEBUG - Nextcloud URL add result: {result}")
-                                    except Exception as nc_error:
-                                        print(f"Erreur lors de la création du lien Nextcloud pour {file_path}: {nc_error}")
+                    _report_section_resources(request, resources, "Cours créé mais ressource non ajoutée à la section")
+                    _report_enrolment(request, prof_call, "Cours créé mais erreur lors de l'affectation des professeurs")
+                    _report_enrolment(request, assistant_call, "Cours créé mais erreur lors de l'affectation des assistants/coordinateurs")
                     
                     messages.success(request, f"Cours '{title}' créé avec succès")
                 else:
@@ -849,87 +797,16 @@ def create_course(request, course_id=None):
             
         return redirect('courses')
 
-    # Préparer le contexte pour le template
+    # Préparer le contexte pour le template (le formulaire d'édition est servi par _edit_course_form)
     top_cats = api.get_categories(0)
     user_service = UserService()
     profs = user_service.get_ldap_profs()
-    # Pour le mode édition, construire le chemin de présélection rapide
-    preselection_data = None
-    
-    if is_edit and course_data and course_data.get('categoryid'):
-        category_id = course_data['categoryid']
-        print(f"Mode édition: construction du chemin pour categoryid={category_id}")
-        
-        try:
-            start_time = time.time()
-            
-            # Utiliser get_all_categories() pour récupérer toutes les catégories rapidement
-            all_cats = api.get_all_categories()
-            cat_map = {c['id']: c for c in all_cats}
-            
-            print(f"Récupéré {len(all_cats)} catégories en {time.time() - start_time:.3f}s")
-            
-            if category_id in cat_map:
-                # Fonction pour remonter la hiérarchie : formation → année → école
-                def build_category_path(target_id):
-                    path = []
-                    current_id = target_id
-                    
-                    while current_id and current_id in cat_map:
-                        category = cat_map[current_id]
-                        path.append({
-                            'id': current_id,
-                            'name': category.get('name', ''),
-                            'parent': category.get('parent', 0)
-                        })
-                        
-                        parent_id = category.get('parent', 0)
-                        if parent_id == 0:
-                            break
-                        current_id = parent_id
-                    
-                    # Inverser pour avoir école → année → formation
-                    return list(reversed(path))
-                
-                category_path = build_category_path(category_id)
-                print(f"Chemin trouvé: {[f'{cat['name']} (ID: {cat['id']})' for cat in category_path]}")
-                
-                # Construire les données de présélection
-                preselection_data = {
-                    'target_category_id': category_id,
-                    'path': category_path
-                }
-                
-                # Ajouter les catégories nécessaires pour peupler les selects
-                if len(category_path) >= 1:
-                    # École sélectionnée - récupérer toutes les années
-                    school_id = category_path[0]['id']
-                    years = [c for c in all_cats if c.get('parent', 0) == school_id]
-                    preselection_data['years'] = years
-                    
-                    if len(category_path) >= 2:
-                        # Année sélectionnée - récupérer toutes les formations
-                        year_id = category_path[1]['id']
-                        formations = [c for c in all_cats if c.get('parent', 0) == year_id]
-                        preselection_data['formations'] = formations
-                
-                end_time = time.time()
-                print(f"Données de présélection construites en {end_time - start_time:.3f}s")
-                print(f"École: {category_path[0]['name'] if category_path else 'N/A'}")
-                print(f"Année: {category_path[1]['name'] if len(category_path) > 1 else 'N/A'}")
-                print(f"Formation: {category_path[2]['name'] if len(category_path) > 2 else 'N/A'}")
-                
-        except Exception as e:
-            print(f"Erreur lors de la construction du chemin: {e}")
-            import traceback
-            traceback.print_exc()
-            preselection_data = None
     
     context = {
         'categories': top_cats,
         'is_edit': is_edit,
         'course': course_data,
-        'preselection_data': json.dumps(preselection_data) if preselection_data else None,
+        'preselection_data': None,
         'profs': profs
     }
     return render(request, 'caplogy_app/create_course.html', context)
@@ -941,15 +818,11 @@ def delete_course(request, course_id):
         messages.error(request, "Méthode non autorisée")
         return redirect('courses')
     
-    api = MoodleAPI(
-        url=os.getenv('MOODLE_URL'),
-        token=os.getenv('MOODLE_TOKEN')
-    )
+    api = get_moodle_api()
     
     try:
         # Obtenir d'abord les informations du cours pour afficher un message plus informatif
-        courses = api.get_courses()
-        course_to_delete = next((c for c in courses if c.get('id') == course_id), None)
+        course_to_delete = api.find_course(course_id)
         
         if not course_to_delete:
             messages.error(request, "Cours introuvable")
@@ -970,13 +843,13 @@ def list_nc_dir(request):
         path = request.GET.get('path', '/')
         print(f"[DEBUG] list_nc_dir appelé avec path: {path}")
         
-        # Vérification des variables d'environnement
-        nc_webdav = os.getenv('NEXTCLOUD_WEBDAV_URL')
-        nc_share = os.getenv('NEXTCLOUD_SHARE_URL')
-        nc_user = os.getenv('NEXTCLOUD_USER')
-        nc_password = os.getenv('NEXTCLOUD_PASSWORD')
+        # Vérification de la configuration
+        nc_webdav = settings.NEXTCLOUD_WEBDAV_URL
+        nc_share = settings.NEXTCLOUD_SHARE_URL
+        nc_user = settings.NEXTCLOUD_USER
+        nc_password = settings.NEXTCLOUD_PASSWORD
         
-        print(f"[DEBUG] Variables d'environnement:")
+        print(f"[DEBUG] Configuration Nextcloud:")
         print(f"  NEXTCLOUD_WEBDAV_URL: {nc_webdav}")
         print(f"  NEXTCLOUD_SHARE_URL: {nc_share}")
         print(f"  NEXTCLOUD_USER: {nc_user}")
@@ -993,20 +866,21 @@ def list_nc_dir(request):
             print(f"[ERROR] {error_msg}")
             return JsonResponse({'error': error_msg}, status=500)
         
-        # Créer une instance de NextcloudAPI
-        print(f"[DEBUG] Création de l'instance NextcloudAPI...")
-        nc_api = NextcloudAPI(
-            base_url=nc_webdav,
-            share_url=nc_share,
-            user=nc_user,
-            password=nc_password
-        )
+        # Récupérer l'instance NextcloudAPI partagée
+        nc_api = get_nextcloud_api()
         
         print(f"[DEBUG] Appel de nc_api.list_nc_dir('{path}')...")
         folders, files = nc_api.list_nc_dir(path)
         print(f"[DEBUG] Résultat: {len(folders)} dossiers, {len(files)} fichiers")
         
-        return JsonResponse({'folders': folders, 'files': files})
+        return _json_response(request, {'folders': folders, 'files': files})
+    except UpstreamUnavailable as e:
+        print(f"[ERROR] {e}")
+        return JsonResponse({
+            'error': f'{e}. Réessayez dans quelques instants.',
+            'error_type': 'unavailable',
+            'retry_suggestion': 'Nextcloud semble indisponible, réessayez dans quelques instants.'
+        }, status=503)
     except requests.exceptions.Timeout:
         error_msg = f'Timeout Nextcloud: Le serveur met trop de temps à répondre (>{nc_api.timeout[1]}s). Réessayez ou contactez l\'administrateur.'
         print(f"[ERROR] {error_msg}")
@@ -1034,27 +908,33 @@ def list_nc_dir(request):
             'retry_suggestion': 'Réessayez ou contactez l\'administrateur si le problème persiste.'
         }, status=500)
 
+@_conditional_json(lambda request: get_catalogue_tree(get_moodle_api()).version)
 def categories_api(request):
     try:
-        # Vérification des variables d'environnement
-        moodle_url = os.getenv('MOODLE_URL')
-        moodle_token = os.getenv('MOODLE_TOKEN')
-        
-        if not moodle_url or not moodle_token:
+        # Vérification de la configuration
+        if not settings.MOODLE_URL or not settings.MOODLE_TOKEN:
             return JsonResponse({'error': 'Configuration Moodle manquante. Veuillez configurer les variables d\'environnement MOODLE_URL et MOODLE_TOKEN.'}, status=500)
         
-        api = MoodleAPI(url=moodle_url, token=moodle_token)
+        api = get_moodle_api()
         
         parent_id = request.GET.get('parent')
         if parent_id:
             try:
                 parent_id = int(parent_id)
-                categories = api.get_categories(parent_id)
+                categories = get_catalogue_children(api, parent_id)
             except (ValueError, TypeError):
                 return JsonResponse({'error': 'Invalid parent ID'}, status=400)
         else:
-            categories = api.get_categories(0)
+            categories = get_catalogue_children(api, 0)
         
+        try:
+            # Tri stable : ordre Moodle (sortorder) puis ID
+            categories, total, next_cursor = _paginate(
+                request, categories, sort_key=lambda cat: (cat.get('sortorder', 0) or 0, cat['id'])
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
         formatted_categories = []
         for cat in categories:
             formatted_categories.append({
@@ -1063,51 +943,40 @@ def categories_api(request):
                 'parent': cat.get('parent', 0)
             })
         
-        return JsonResponse({'categories': formatted_categories})
+        return JsonResponse({
+            'categories': _project(request, formatted_categories),
+            'total': total,
+            'next_cursor': next_cursor,
+        })
     except Exception as e:
         return JsonResponse({'error': f'Erreur lors de la récupération des catégories: {str(e)}'}, status=500)
 
 def build_category_hierarchy_for_course(api, target_category_id):
     """
     Construit rapidement la hiérarchie des catégories et le chemin de sélection
-    en utilisant get_all_categories() comme les autres vues (courses_api, etc.)
+    à partir de l'arborescence indexée (CategoryTree) comme les autres vues (courses_api, etc.)
     """
     try:
         start_time = time.time()
         print(f"[FAST] Building hierarchy for category {target_category_id} using get_all_categories()")
         
-        # 1. Récupérer TOUTES les catégories d'un coup (comme courses_api)
-        all_cats = api.get_all_categories()
-        cat_map = {c['id']: c for c in all_cats}
+        # 1. Récupérer TOUTES les catégories d'un coup, indexées en arborescence
+        tree = api.get_category_tree()
         
         end_time = time.time()
-        print(f"[FAST] Retrieved {len(all_cats)} categories in {end_time - start_time:.3f} seconds")
+        print(f"[FAST] Retrieved {len(tree)} categories in {end_time - start_time:.3f} seconds")
         
-        if target_category_id not in cat_map:
+        if target_category_id not in tree:
             print(f"[FAST] Category {target_category_id} not found in category map")
             return None, None
         
-        # 2. Trouver le chemin vers la catégorie cible (même logique que courses_api)
-        def find_path_to_root(cat_id):
-            """Trouve le chemin de la catégorie vers la racine"""
-            path = []
-            current_id = cat_id
-            
-            while current_id and current_id in cat_map:
-                path.append(current_id)
-                parent_id = cat_map[current_id].get('parent', 0)
-                if parent_id == 0:
-                    break
-                current_id = parent_id
-            
-            return list(reversed(path))  # Inverser pour avoir racine->feuille
-        
-        selection_path = find_path_to_root(target_category_id)
+        # 2. Chemin racine -> catégorie cible, précalculé par l'arborescence
+        selection_path = tree.path_ids(target_category_id)
         print(f"[FAST] Found selection path: {selection_path}")
         
         # 3. Organiser les catégories par niveaux pour l'interface
         hierarchy = {
-            'main': [c for c in all_cats if c.get('parent', 0) == 0],  # Écoles
+            'main': [c for c in tree.roots() if c.get('parent', 0) == 0],  # Écoles
             'sub': {},
             'subsub': {}
         }
@@ -1116,12 +985,12 @@ def build_category_hierarchy_for_course(api, target_category_id):
         if len(selection_path) >= 1:
             # Charger les années pour l'école sélectionnée
             school_id = selection_path[0]
-            hierarchy['sub'][school_id] = [c for c in all_cats if c.get('parent', 0) == school_id]
+            hierarchy['sub'][school_id] = tree.children(school_id)
             
             if len(selection_path) >= 2:
                 # Charger les formations pour l'année sélectionnée
                 year_id = selection_path[1]
-                hierarchy['subsub'][year_id] = [c for c in all_cats if c.get('parent', 0) == year_id]
+                hierarchy['subsub'][year_id] = tree.children(year_id)
         
         total_time = time.time() - start_time
         print(f"[FAST] Total hierarchy building time: {total_time:.3f} seconds")
@@ -1134,40 +1003,46 @@ def build_category_hierarchy_for_course(api, target_category_id):
         traceback.print_exc()
         return None, None
 
+def _format_teachers(teachers):
+    """Formatter les utilisateurs d'un cours pour le frontend."""
+    return [
+        {
+            'id': teacher.get('id'),
+            'username': teacher.get('username', ''),
+            'firstname': teacher.get('firstname', ''),
+            'lastname': teacher.get('lastname', ''),
+            'email': teacher.get('email', ''),
+            'fullname': f"{teacher.get('firstname', '')} {teacher.get('lastname', '')}".strip()
+        }
+        for teacher in teachers
+    ]
+
 @login_required
-def get_course_teachers_api(request, course_id):
+async def get_course_teachers_api(request, course_id):
     """
     API pour récupérer les professeurs d'un cours
-    Supporte le paramètre ?role_id=X pour filtrer par rôle
+    Supporte le paramètre ?role_id=X pour filtrer par rôle, ou ?role_id=3,2 pour plusieurs rôles
+    récupérés en parallèle (détail par rôle dans by_role)
     """
     try:
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
-        
-        # Récupérer le role_id depuis les paramètres GET (par défaut 3 = enseignant)
-        role_id = int(request.GET.get('role_id', 3))
+        api = get_async_moodle_api()
         
-        teachers = api.get_course_teachers(course_id, role_id=role_id)
+        # Récupérer le(s) role_id depuis les paramètres GET (par défaut 3 = enseignant)
+        role_ids = [int(r) for r in request.GET.get('role_id', '3').split(',') if r.strip()] or [3]
         
-        # Formatter les données pour le frontend
-        formatted_teachers = []
-        for teacher in teachers:
-            formatted_teachers.append({
-                'id': teacher.get('id'),
-                'username': teacher.get('username', ''),
-                'firstname': teacher.get('firstname', ''),
-                'lastname': teacher.get('lastname', ''),
-                'email': teacher.get('email', ''),
-                'fullname': f"{teacher.get('firstname', '')} {teacher.get('lastname', '')}".strip()
-            })
+        results = await asyncio.gather(*(api.get_course_teachers(course_id, role_id=role_id) for role_id in role_ids))
+        by_role = {role_id: _format_teachers(teachers) for role_id, teachers in zip(role_ids, results)}
         
-        return JsonResponse({
+        formatted_teachers = by_role[role_ids[0]]
+        payload = {
             'teachers': formatted_teachers,
             'count': len(formatted_teachers),
-            'role_id': role_id
-        })
+            'role_id': role_ids[0]
+        }
+        if len(role_ids) > 1:
+            payload['by_role'] = {str(role_id): teachers for role_id, teachers in by_role.items()}
+        
+        return _json_response(request, payload)
         
     except Exception as e:
         print(f"Erreur lors de la récupération des professeurs du cours {course_id}: {e}")
@@ -1190,10 +1065,7 @@ def add_teacher_to_course_api(request, course_id):
         if not username:
             return JsonResponse({'error': 'Username requis'}, status=400)
         
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
+        api = get_moodle_api()
         
         result = api.assign_teachers_to_course(course_id, [username])
         
@@ -1223,10 +1095,7 @@ def remove_teacher_from_course_api(request, course_id):
         if not teacher_id:
             return JsonResponse({'error': 'teacher_id requis'}, status=400)
         
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
+        api = get_moodle_api()
         
         result = api.remove_teachers_from_course(course_id, [teacher_id])
         
@@ -2,8 +2,7 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from .forms_add_category import AddCategoryForm
 from .models import SchoolImage
-from .services.moodle_api import MoodleAPI
-import os
+from .services.clients import get_moodle_api
 
 def add_category_page(request):
     if request.method == 'POST':
@@ -12,10 +11,7 @@ def add_category_page(request):
             name = form.cleaned_data['name']
             image = form.cleaned_data['image']
             # Création de la catégorie sur Moodle
-            api = MoodleAPI(
-                url=os.getenv('MOODLE_URL'),
-                token=os.getenv('MOODLE_TOKEN')
-            )
+            api = get_moodle_api()
             try:
                 category_id = api.create_category(name, parent_id=0)
             except Exception as e:
@@ -3,8 +3,7 @@ from django.contrib import messages
 from .forms import SchoolImageForm
 from .models import SchoolImage
 from django.views.decorators.http import require_http_methods
-from .services.moodle_api import MoodleAPI
-import os
+from .services.clients import get_moodle_api
 from django import forms
 
 @require_http_methods(["GET", "POST"])
@@ -12,10 +11,7 @@ def school_image_upload(request, category_id=None):
     category_name = None
     if category_id:
         # Récupérer le nom de la catégorie principale depuis Moodle
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
+        api = get_moodle_api()
         try:
             all_cats = api.get_all_categories()
             cat = next((c for c in all_cats if c['id'] == int(category_id)), None)
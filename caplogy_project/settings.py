@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -27,12 +28,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Compression des réponses (JSON des API notamment) pour les navigateurs qui l'acceptent
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'caplogy_app.middleware.StaleDataMiddleware',
+    'caplogy_app.middleware.DeadlineMiddleware',
+    'caplogy_app.middleware.RequestMemoMiddleware',
 ]
 
 ROOT_URLCONF = 'caplogy_project.urls'
@@ -48,6 +54,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'caplogy_app.context_processors.stale_data',
             ],
         },
     },
@@ -69,6 +76,31 @@ TIME_ZONE = 'Europe/Paris'
 USE_I18N = True
 USE_TZ = True
 
+# Cache partagé par tous les workers du nœud (fichiers), borné en nombre d'entrées
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'caplogy_cache')),
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '2000')),
+            'CULL_FREQUENCY': 3,  # un tiers des entrées évincé quand la limite est atteinte
+        },
+    }
+}
+# Alias du cache utilisé pour les données Moodle / Nextcloud ('' : cache mémoire propre à chaque worker)
+UPSTREAM_CACHE_ALIAS = os.getenv('UPSTREAM_CACHE_ALIAS', 'default')
+# Mode dégradé : après UPSTREAM_FAILURE_THRESHOLD échecs consécutifs (réseau, délai, 5xx), le disjoncteur
+# de Moodle / Nextcloud / LDAP s'ouvre et les appels échouent aussitôt pendant UPSTREAM_RETRY_AFTER secondes ;
+# les dernières données connues sont conservées UPSTREAM_LAST_GOOD_TTL secondes au-delà de leur fenêtre
+# de péremption pour être servies (avec leur date) pendant une indisponibilité
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv('UPSTREAM_FAILURE_THRESHOLD', '3'))
+UPSTREAM_RETRY_AFTER = float(os.getenv('UPSTREAM_RETRY_AFTER', '30'))
+UPSTREAM_LAST_GOOD_TTL = int(os.getenv('UPSTREAM_LAST_GOOD_TTL', str(7 * 86400)))
+# Budget de temps d'une requête pour ses appels à Moodle / Nextcloud / LDAP (secondes, 0 : illimité) :
+# chaque appel réduit son délai d'attente au temps restant (à garder sous le timeout des workers WSGI)
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '25'))
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'caplogy_app' / 'static']
 
@@ -89,3 +121,61 @@ LOGOUT_REDIRECT_URL = '/login/'
 AD_SERVER = os.getenv('AD_SERVER')
 AD_DOMAIN = os.getenv('AD_DOMAIN')
 AD_SEARCH_BASE = os.getenv('AD_SEARCH_BASE')
+LDAP_CONNECT_TIMEOUT = float(os.getenv('LDAP_CONNECT_TIMEOUT', '5'))
+LDAP_RECEIVE_TIMEOUT = float(os.getenv('LDAP_RECEIVE_TIMEOUT', '15'))
+# Liste des profs LDAP : durée de fraîcheur, puis durée de service de la version périmée (secondes)
+LDAP_PROFS_CACHE_TTL = float(os.getenv('LDAP_PROFS_CACHE_TTL', '600'))
+LDAP_PROFS_STALE_TTL = float(os.getenv('LDAP_PROFS_STALE_TTL', '3600'))
+
+# Moodle Web Services
+MOODLE_URL = os.getenv('MOODLE_URL')
+MOODLE_TOKEN = os.getenv('MOODLE_TOKEN')
+MOODLE_POOL_SIZE = int(os.getenv('MOODLE_POOL_SIZE', '10'))
+# Appels WS simultanés d'une vue asynchrone (à garder sous MOODLE_POOL_SIZE)
+MOODLE_ASYNC_CONCURRENCY = int(os.getenv('MOODLE_ASYNC_CONCURRENCY', '8'))
+# Sections traitées en parallèle à l'enregistrement d'un cours (liens de partage Nextcloud, ajout des ressources)
+SECTION_RESOURCE_CONCURRENCY = int(os.getenv('SECTION_RESOURCE_CONCURRENCY', '6'))
+MOODLE_CONNECT_TIMEOUT = float(os.getenv('MOODLE_CONNECT_TIMEOUT', '5'))
+MOODLE_READ_TIMEOUT = float(os.getenv('MOODLE_READ_TIMEOUT', '30'))
+MOODLE_READ_RETRIES = int(os.getenv('MOODLE_READ_RETRIES', '2'))
+# Durée maximale d'attente de la cohérence de Moodle après une écriture (secondes)
+MOODLE_CONSISTENCY_TIMEOUT = float(os.getenv('MOODLE_CONSISTENCY_TIMEOUT', '5'))
+# Durée de fraîcheur de l'arborescence des catégories, puis durée pendant laquelle
+# la version périmée est encore servie pendant sa revalidation (secondes)
+MOODLE_CATEGORY_CACHE_TTL = float(os.getenv('MOODLE_CATEGORY_CACHE_TTL', '300'))
+MOODLE_CATEGORY_STALE_TTL = float(os.getenv('MOODLE_CATEGORY_STALE_TTL', '3600'))
+# Nombre maximal d'usernames résolus en utilisateurs Moodle gardés en mémoire
+MOODLE_USER_CACHE_SIZE = int(os.getenv('MOODLE_USER_CACHE_SIZE', '1024'))
+# Durée de vie des utilisateurs résolus dans le cache partagé (secondes)
+MOODLE_USER_CACHE_TTL = int(os.getenv('MOODLE_USER_CACHE_TTL', '86400'))
+# Miroir local du catalogue (manage.py sync_moodle_catalogue) : lu par les pages du catalogue
+# tant que sa dernière synchronisation date de moins de MOODLE_MIRROR_MAX_AGE secondes
+MOODLE_MIRROR_ENABLED = os.getenv('MOODLE_MIRROR_ENABLED', 'True') == 'True'
+MOODLE_MIRROR_MAX_AGE = int(os.getenv('MOODLE_MIRROR_MAX_AGE', '900'))
+MOODLE_MIRROR_SYNC_INTERVAL = int(os.getenv('MOODLE_MIRROR_SYNC_INTERVAL', '300'))
+
+# Nextcloud (WebDAV + OCS)
+NEXTCLOUD_WEBDAV_URL = os.getenv('NEXTCLOUD_WEBDAV_URL')
+NEXTCLOUD_SHARE_URL = os.getenv('NEXTCLOUD_SHARE_URL')
+NEXTCLOUD_USER = os.getenv('NEXTCLOUD_USER')
+NEXTCLOUD_PASSWORD = os.getenv('NEXTCLOUD_PASSWORD')
+# Durée de fraîcheur des listings de dossiers (secondes, 0 pour désactiver)
+NEXTCLOUD_LISTING_CACHE_TTL = float(os.getenv('NEXTCLOUD_LISTING_CACHE_TTL', '30'))
+# Nombre maximal de listings gardés en mémoire du processus (sans cache partagé)
+NEXTCLOUD_LISTING_CACHE_SIZE = int(os.getenv('NEXTCLOUD_LISTING_CACHE_SIZE', '256'))
+NEXTCLOUD_CONNECT_TIMEOUT = float(os.getenv('NEXTCLOUD_CONNECT_TIMEOUT', '5'))
+NEXTCLOUD_READ_TIMEOUT = float(os.getenv('NEXTCLOUD_READ_TIMEOUT', '30'))
+
+# Préchargement des caches en arrière-plan (thread démarré par wsgi.py / asgi.py, ou manage.py warm_caches --loop) :
+# toutes les CACHE_WARMER_INTERVAL secondes, les entrées lues depuis moins de CACHE_WARMER_HOT_WINDOW secondes
+# sont rechargées dès qu'elles ont atteint CACHE_WARMER_REFRESH_RATIO de leur durée de fraîcheur
+CACHE_WARMER_ENABLED = os.getenv('CACHE_WARMER_ENABLED', 'True') == 'True'
+CACHE_WARMER_INTERVAL = int(os.getenv('CACHE_WARMER_INTERVAL', '30'))
+CACHE_WARMER_REFRESH_RATIO = float(os.getenv('CACHE_WARMER_REFRESH_RATIO', '0.8'))
+CACHE_WARMER_HOT_WINDOW = int(os.getenv('CACHE_WARMER_HOT_WINDOW', '1800'))
+# Instantané disque des caches (catalogue, utilisateurs Moodle, profs LDAP) restauré au démarrage des workers :
+# réécrit toutes les CACHE_SNAPSHOT_INTERVAL secondes et à l'arrêt, ignoré s'il date de plus de CACHE_SNAPSHOT_MAX_AGE
+CACHE_SNAPSHOT_ENABLED = os.getenv('CACHE_SNAPSHOT_ENABLED', 'True') == 'True'
+CACHE_SNAPSHOT_PATH = os.getenv('CACHE_SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'caplogy_cache_snapshot.bin'))
+CACHE_SNAPSHOT_INTERVAL = int(os.getenv('CACHE_SNAPSHOT_INTERVAL', '300'))
+CACHE_SNAPSHOT_MAX_AGE = int(os.getenv('CACHE_SNAPSHOT_MAX_AGE', '86400'))
@@ -3,3 +3,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'caplogy_project.settings')
 application = get_wsgi_application()
+
+# Préchargement des caches : seulement dans les processus qui servent des requêtes
+from caplogy_app.services.cache_warmer import start_for_server  # noqa: E402
+
+start_for_server()
@@ -12,7 +12,7 @@ sys.path.append('.')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'caplogy_project.settings')
 django.setup()
 
-from caplogy_app.services.moodle_api import MoodleAPI
+from caplogy_app.services.clients import get_moodle_api
 from caplogy_app.services.user_service import UserService
 
 def create_moodle_user_from_ldap(username):
@@ -38,10 +38,7 @@ def create_moodle_user_from_ldap(username):
         print(f"✅ Utilisateur trouvé dans LDAP: {ldap_user}")
         
         # Préparer les données pour Moodle
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
+        api = get_moodle_api()
         
         # Extraire le prénom et nom depuis le champ 'name'
         full_name = ldap_user['name']
@@ -107,10 +104,7 @@ def bulk_create_users_from_ldap():
         user_service = UserService()
         ldap_profs = user_service.get_ldap_profs()
         
-        api = MoodleAPI(
-            url=os.getenv('MOODLE_URL'),
-            token=os.getenv('MOODLE_TOKEN')
-        )
+        api = get_moodle_api()
         
         created_count = 0
         failed_count = 0